@@ -0,0 +1,135 @@
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import copy
+import re
+
+from ansible.plugins.action import ActionBase
+
+BUFFER_FACT_PREFIX = "dt_report_buffer_"
+BUFFER_HOST = "localhost"
+
+
+def get_buffer_fact_name(host):
+    return BUFFER_FACT_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', host)
+
+
+def add_edits(buffer, src, separator, edits):
+    """Add edits to the buffer keyed by file and section.
+
+    Edits setting a key replace the earlier buffered edits of the same key.
+    """
+    report = buffer.setdefault(src, {"separator": separator, "edits": []})
+    if report["separator"] != separator:
+        raise ValueError(
+            "Edits of '%s' are buffered with '%s' separator, got '%s'" % (
+                src, report["separator"], separator))
+    for edit in edits:
+        if not isinstance(edit, dict) or not edit.get("key"):
+            raise ValueError("Each edit must be a dict with 'key', got: %s" % (
+                edit, ))
+        if not edit.get("action"):
+            report["edits"] = [
+                e for e in report["edits"]
+                if e.get("action") or e["key"] != edit["key"]]
+        report["edits"].append(edit)
+    return buffer
+
+
+class ActionModule(ActionBase):
+
+    TRANSFERS_FILES = False
+
+    def get_buffers(self, task_vars):
+        """Return buffers of all the hosts kept as facts of the localhost."""
+        host_vars = task_vars['hostvars'].raw_get(BUFFER_HOST)
+        if not isinstance(host_vars, dict):
+            return {}
+        return dict(
+            (name, copy.deepcopy(value)) for name, value in host_vars.items()
+            if name.startswith(BUFFER_FACT_PREFIX) and value)
+
+    def buffer(self, task_vars):
+        # NOTE(vponomar): facts are the only data which survives between
+        # tasks, because each of them is run in a separate fork. Each host
+        # keeps its buffer in a separate fact of the localhost, so hosts
+        # processed in parallel do not overwrite buffers of each other.
+        if (task_vars.get('inventory_hostname') != BUFFER_HOST and
+                not self._task.delegate_facts):
+            return {"failed": True, "msg": (
+                "Report must be buffered on '%s' using 'delegate_to' and "
+                "'delegate_facts' options" % BUFFER_HOST)}
+        fact_name = get_buffer_fact_name(task_vars['inventory_hostname'])
+        buffer = self.get_buffers(task_vars).get(fact_name, {})
+        try:
+            add_edits(
+                buffer, self._task.args['src'],
+                self._task.args.get('separator', '.'),
+                self._task.args.get('edits') or [])
+        except ValueError as e:
+            return {"failed": True, "msg": str(e)}
+        return {
+            "changed": True,
+            "buffered_edits": sum(len(r["edits"]) for r in buffer.values()),
+            "ansible_facts": {fact_name: buffer},
+        }
+
+    def flush(self, task_vars):
+        buffers = self.get_buffers(task_vars)
+        reports = {}
+        try:
+            for fact_name in sorted(buffers):
+                for src, report in buffers[fact_name].items():
+                    add_edits(
+                        reports, src, report["separator"], report["edits"])
+        except ValueError as e:
+            return {"failed": True, "msg": str(e)}
+
+        result, failed_srcs = {"changed": False, "files": {}}, set()
+        for src in sorted(reports):
+            module_result = self._execute_module(
+                module_name='dt_yedit',
+                module_args={
+                    "src": src,
+                    "state": "present",
+                    "separator": reports[src]["separator"],
+                    "edits": reports[src]["edits"],
+                    # NOTE(vponomar): new sections are appended without
+                    # rewriting the file, existing ones are updated as usual.
+                    "stream": not any(
+                        e.get("action") for e in reports[src]["edits"]),
+                },
+                task_vars=task_vars)
+            result["files"][src] = {
+                "changed": module_result.get("changed", False),
+                "edits": len(reports[src]["edits"]),
+            }
+            if module_result.get("failed"):
+                failed_srcs.add(src)
+                result["files"][src]["msg"] = module_result.get("msg")
+            result["changed"] |= bool(module_result.get("changed"))
+
+        # Keep edits of the failed files to be flushed next time
+        result["ansible_facts"] = dict(
+            (fact_name, dict(
+                (src, report) for src, report in buffer.items()
+                if src in failed_srcs))
+            for fact_name, buffer in buffers.items())
+        if failed_srcs:
+            result.update(failed=True, msg="Failed to write %s" % ", ".join(
+                sorted(failed_srcs)))
+        return result
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        if self._task.args.get('flush'):
+            result.update(self.flush(task_vars))
+        elif not self._task.args.get('src'):
+            result.update(failed=True, msg="'src' or 'flush' is required")
+        else:
+            result.update(self.buffer(task_vars))
+        return result
@@ -0,0 +1,112 @@
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    inventory: dt_cluster_state
+    version_added: "2.4"
+    short_description: Loads cluster nodes from the cluster state file.
+    description:
+        - "Reads cluster state file written by the '1_provision_nodes.yaml'
+           playbook and adds all the cluster nodes in one shot, so the
+           playbooks skip the 'add_host' loops and per-host discovery of
+           the hostnames and IP addresses."
+        - "Nodes are added to the 'dt_masters', 'dt_nodes', 'dt_glusterfs'
+           and 'dt_glusterfs_registry' groups with 'ansible_host' set to
+           their IP addresses. Groups are created even if they are empty.
+           Each node also gets 'dt_vm_uuid', 'dt_vm_instance_uuid' and
+           'dt_vm_moid' vars."
+        - "DNS servers are added to the 'dns_dnsmasq_servers' group."
+        - "The 'all' group gets 'dt_cluster_state_path',
+           'dt_cluster_state_config_sha256' and
+           'dt_cluster_state_hostnames_ip_mapping' vars."
+    options:
+      plugin:
+        description: Token which makes sure the file is a cluster state file.
+        required: True
+        choices: ['dt_cluster_state']
+'''
+
+EXAMPLES = '''
+# $ tox -e ocp3.11 -- ansible-playbook -i ../cluster_state.yaml \\
+#     2_configure_nodes.yaml \\
+#     -e config_filepath=/path/to/the/config.yaml
+plugin: dt_cluster_state
+config_sha256: 2f1ad4...
+nodes:
+  master-0:
+    group: dt_masters
+    ip: 10.0.0.10
+    uuid: 4218a4d0-...
+    instance_uuid: 50180d1e-...
+    moid: vm-101
+dns_dnsmasq_servers:
+- server_hostname: dns.example.com
+  server_username: root
+  config_filepath: /etc/dnsmasq.d/dt-unsorted-mapping.conf
+'''
+
+import os
+
+from ansible.errors import AnsibleParserError
+from ansible.module_utils._text import to_native
+from ansible.plugins.inventory import BaseFileInventoryPlugin
+
+NODE_GROUPS = (
+    "dt_masters", "dt_nodes", "dt_glusterfs", "dt_glusterfs_registry")
+DNS_GROUP = "dns_dnsmasq_servers"
+
+
+class InventoryModule(BaseFileInventoryPlugin):
+
+    NAME = 'dt_cluster_state'
+
+    def verify_file(self, path):
+        return (super(InventoryModule, self).verify_file(path) and
+                os.path.splitext(path)[1] in ('.yaml', '.yml', '.json'))
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path)
+        try:
+            data = self.loader.load_from_file(path)
+        except Exception as e:
+            raise AnsibleParserError(to_native(e))
+        if not isinstance(data, dict) or data.get('plugin') != self.NAME:
+            raise AnsibleParserError(
+                "'%s' is not a cluster state file" % to_native(path))
+
+        for group in NODE_GROUPS + (DNS_GROUP, ):
+            self.inventory.add_group(group)
+
+        hostnames_ip_mapping = {}
+        for name, node in sorted((data.get('nodes') or {}).items()):
+            if node.get('group') not in NODE_GROUPS:
+                raise AnsibleParserError(
+                    "Node '%s' has unexpected '%s' group" % (
+                        name, node.get('group')))
+            self.inventory.add_host(name, group=node['group'])
+            self.inventory.set_variable(name, 'ansible_user', 'root')
+            if node.get('ip'):
+                self.inventory.set_variable(name, 'ansible_host', node['ip'])
+                hostnames_ip_mapping[name] = node['ip']
+            for key in ('uuid', 'instance_uuid', 'moid'):
+                self.inventory.set_variable(
+                    name, 'dt_vm_%s' % key, node.get(key))
+
+        # TODO(vponomar): update following when support for other DNS
+        # servers than 'dnsmasq' is added.
+        for server in data.get('dns_dnsmasq_servers') or []:
+            self.inventory.add_host(server['server_hostname'], group=DNS_GROUP)
+            self.inventory.set_variable(
+                server['server_hostname'], 'ansible_user',
+                server['server_username'])
+            self.inventory.set_variable(
+                server['server_hostname'], 'dnsmasq_config_filepath',
+                server['config_filepath'])
+
+        self.inventory.set_variable(
+            'all', 'dt_cluster_state_path', os.path.abspath(path))
+        self.inventory.set_variable(
+            'all', 'dt_cluster_state_config_sha256', data.get('config_sha256'))
+        self.inventory.set_variable(
+            'all', 'dt_cluster_state_hostnames_ip_mapping',
+            hostnames_ip_mapping)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_cluster_state
+
+short_description: saves state of the provisioned cluster nodes to a file
+
+version_added: "2.4"
+
+description:
+    - "Writes cluster state file with names, groups, IP addresses and UUIDs
+       of the provisioned VMs, list of the dnsmasq-based DNS servers and
+       hash of the config file the cluster was provisioned with."
+    - "The file is a config of the 'dt_cluster_state' inventory plugin,
+       so it can be passed to the 'ansible-playbook' command with the '-i'
+       option to load all the cluster nodes in one shot."
+    - "File is written atomically and is not touched if its content is
+       not changed."
+
+options:
+    path:
+        description:
+            - Path to the cluster state file.
+        required: true
+    state:
+        description:
+            - Whether the file should be present or absent.
+        required: false
+        default: present
+        choices: ['present', 'absent']
+    config_sha256:
+        description:
+            - SHA256 hash of the config file content.
+        required: false
+    vms:
+        description:
+            - List of VM records returned by the 'dt_vmware_clone_vms'
+              module. Each of them is expected to have 'name' and 'group'
+              keys and may have 'uuid', 'instance_uuid' and 'moid' ones.
+        required: false
+        default: []
+    hostnames_ip_mapping:
+        description:
+            - Dict where keys are VM names and values are IP addresses.
+        required: false
+        default: {}
+    dns_servers:
+        description:
+            - List of the dnsmasq-based DNS servers defined in the
+              'vm.dns.servers' config option.
+        required: false
+        default: []
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Save state of the provisioned cluster
+  dt_cluster_state:
+    path: "{{ config.common.output_cluster_state_file }}"
+    config_sha256: "{{ config_output.config_sha256 }}"
+    vms: "{{ vms_cloning.vms }}"
+    hostnames_ip_mapping: "{{ hostnames_ip_mapping }}"
+    dns_servers: "{{ config.vm.dns.servers }}"
+
+- name: Remove state of the deleted cluster
+  dt_cluster_state:
+    path: "{{ config.common.output_cluster_state_file }}"
+    state: absent
+'''
+
+RETURN = '''
+path:
+    description: Absolute path to the cluster state file.
+    returned: always
+    type: str
+nodes:
+    description: Node records saved to the file keyed by VM names.
+    returned: when state is present
+    type: dict
+'''
+
+import os
+import tempfile
+
+import yaml
+
+from ansible.module_utils.basic import AnsibleModule
+
+# NOTE(vponomar): keep in sync with the 'dt_cluster_state' inventory plugin
+INVENTORY_PLUGIN_NAME = "dt_cluster_state"
+FILE_HEADER = (
+    "# Generated by the '1_provision_nodes.yaml' playbook, do not edit.\n"
+    "# Use it as inventory source: ansible-playbook -i %s ...\n")
+
+
+def get_state(params):
+    nodes = {}
+    for vm in params['vms']:
+        if not (vm.get("name") and vm.get("group")):
+            raise ValueError("VM records must have 'name' and 'group' keys")
+        nodes[vm["name"]] = {
+            "group": "dt_%s" % vm["group"],
+            "ip": params['hostnames_ip_mapping'].get(vm["name"]),
+            "uuid": vm.get("uuid"),
+            "instance_uuid": vm.get("instance_uuid"),
+            "moid": vm.get("moid"),
+        }
+    return {
+        "plugin": INVENTORY_PLUGIN_NAME,
+        "config_sha256": params['config_sha256'],
+        "nodes": nodes,
+        "dns_dnsmasq_servers": [{
+            "server_hostname": server["server_hostname"],
+            "server_username": server["server_username"],
+            "config_filepath": server["config_filepath"],
+        } for server in params['dns_servers']],
+    }
+
+
+def read_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def write_file(module, path, content):
+    file_dir = os.path.dirname(path)
+    if not os.path.isdir(file_dir):
+        os.makedirs(file_dir, 0o755)
+    fd, tmp_path = tempfile.mkstemp(dir=file_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    module.atomic_move(tmp_path, path)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "path": {"type": "path", "required": True},
+            "state": {
+                "type": "str", "default": "present",
+                "choices": ["present", "absent"],
+            },
+            "config_sha256": {"type": "str", "required": False},
+            "vms": {"type": "list", "default": []},
+            "hostnames_ip_mapping": {"type": "dict", "default": {}},
+            "dns_servers": {"type": "list", "default": []},
+        },
+        supports_check_mode=True,
+    )
+    path = os.path.abspath(module.params['path'])
+    old_content = read_file(path)
+    result = {"changed": False, "path": path}
+
+    if module.params['state'] == "absent":
+        result["changed"] = old_content is not None
+        if result["changed"] and not module.check_mode:
+            os.remove(path)
+        module.exit_json(**result)
+
+    try:
+        state = get_state(module.params)
+    except (KeyError, ValueError) as e:
+        module.fail_json(msg="Failed to build cluster state: %s" % e)
+    new_content = FILE_HEADER % path + yaml.safe_dump(
+        state, default_flow_style=False)
+    result.update(
+        changed=old_content != new_content,
+        nodes=state["nodes"],
+        diff={
+            "before": old_content or "", "after": new_content,
+            "before_header": path, "after_header": path,
+        },
+    )
+    if result["changed"] and not module.check_mode:
+        write_file(module, path, new_content)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
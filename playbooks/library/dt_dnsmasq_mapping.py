@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_dnsmasq_mapping
+
+short_description: manages hostname to IP mapping in dnsmasq config file
+
+version_added: "2.4"
+
+description:
+    - "Renders whole dnsmasq config file with 'address=/<hostname>/<ip>'
+       lines using single atomic write. Requested hostnames get added,
+       updated or removed, all other lines of the file are kept as is,
+       so the same file can be shared by several clusters."
+    - "File is not touched and dnsmasq is not reloaded if the content is
+       not changed. File is removed if it has no lines left."
+
+options:
+    path:
+        description:
+            - Path to the dnsmasq config file.
+        required: true
+    hostnames_ip_mapping:
+        description:
+            - Dict where keys are hostnames and values are IP addresses.
+              Hostnames with empty values are removed from the file.
+        required: false
+        default: {}
+    remove_hostnames:
+        description:
+            - List of hostnames to be removed from the file.
+        required: false
+        default: []
+    reload:
+        description:
+            - "How to make dnsmasq apply changes of the file. Note that
+               dnsmasq re-reads 'address' options only on restart,
+               'sighup' only clears its cache. 'none' does nothing."
+        required: false
+        default: none
+        choices: ['none', 'sighup', 'restart']
+    service_name:
+        description:
+            - Name of the dnsmasq service.
+        required: false
+        default: dnsmasq
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Add cluster nodes to the dnsmasq config and restart it on change
+  dt_dnsmasq_mapping:
+    path: /etc/dnsmasq.d/dt-unsorted-mapping.conf
+    hostnames_ip_mapping: "{{ hostnames_ip_mapping }}"
+    reload: restart
+
+- name: Remove cluster nodes from the dnsmasq config
+  dt_dnsmasq_mapping:
+    path: /etc/dnsmasq.d/dt-unsorted-mapping.conf
+    remove_hostnames: "{{ groups['dt_nodes'] }}"
+    reload: restart
+'''
+
+RETURN = '''
+added:
+    description: Hostnames added to the file.
+    returned: always
+    type: list
+updated:
+    description: Hostnames which IP addresses are changed.
+    returned: always
+    type: list
+removed:
+    description: Hostnames removed from the file.
+    returned: always
+    type: list
+reloaded:
+    description: Whether dnsmasq has been reloaded or not.
+    returned: always
+    type: bool
+'''
+
+import os
+import re
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+
+ADDRESS_LINE_REGEX = re.compile(r"^\s*address=/([^/\s]+)/([^/\s]+)\s*$")
+
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return f.read().splitlines()
+
+
+def render_lines(lines, hostnames_ip_mapping, remove_hostnames):
+    """Return new lines of the file and lists of added, updated and removed
+    hostnames. Order of the existing lines is kept, new ones are appended
+    sorted by hostnames.
+    """
+    to_set = {
+        hostname: ip for hostname, ip in hostnames_ip_mapping.items()
+        if hostname and ip}
+    to_remove = set(remove_hostnames) | set(
+        hostname for hostname, ip in hostnames_ip_mapping.items()
+        if hostname and not ip)
+    to_remove -= set(to_set)
+    new_lines, seen = [], set()
+    added, updated, removed = [], [], []
+    for line in lines:
+        match = ADDRESS_LINE_REGEX.match(line)
+        if not match:
+            new_lines.append(line)
+            continue
+        hostname, ip = match.groups()
+        if hostname in seen or hostname in to_remove:
+            # Drop duplicates and removed hostnames
+            if hostname in to_remove and hostname not in removed:
+                removed.append(hostname)
+            continue
+        seen.add(hostname)
+        if hostname in to_set and to_set[hostname] != ip:
+            line = "address=/%s/%s" % (hostname, to_set[hostname])
+            updated.append(hostname)
+        new_lines.append(line)
+    for hostname in sorted(set(to_set) - seen):
+        new_lines.append("address=/%s/%s" % (hostname, to_set[hostname]))
+        added.append(hostname)
+    return new_lines, added, updated, removed
+
+
+def write_file(module, path, content):
+    file_dir = os.path.dirname(path)
+    if not os.path.isdir(file_dir):
+        os.makedirs(file_dir, 0o755)
+    fd, tmp_path = tempfile.mkstemp(dir=file_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    # NOTE(vponomar): 'atomic_move' keeps SELinux context of the file
+    module.atomic_move(tmp_path, path)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "path": {"type": "path", "required": True},
+            "hostnames_ip_mapping": {"type": "dict", "default": {}},
+            "remove_hostnames": {"type": "list", "default": []},
+            "reload": {
+                "type": "str", "default": "none",
+                "choices": ["none", "sighup", "restart"],
+            },
+            "service_name": {"type": "str", "default": "dnsmasq"},
+        },
+        supports_check_mode=True,
+    )
+    path = module.params['path']
+    old_lines = read_lines(path)
+    new_lines, added, updated, removed = render_lines(
+        old_lines, module.params['hostnames_ip_mapping'] or {},
+        module.params['remove_hostnames'] or [])
+    old_content = "".join(line + "\n" for line in old_lines)
+    new_content = "".join(line + "\n" for line in new_lines)
+    # Empty file is removed, so there is no difference between them
+    changed = old_content != new_content or (
+        not new_lines and os.path.exists(path))
+    result = {
+        "changed": changed,
+        "added": added,
+        "updated": updated,
+        "removed": removed,
+        "reloaded": False,
+        "diff": {
+            "before": old_content, "after": new_content,
+            "before_header": path, "after_header": path,
+        },
+    }
+    if not changed or module.check_mode:
+        module.exit_json(**result)
+
+    if new_lines:
+        write_file(module, path, new_content)
+    else:
+        os.remove(path)
+
+    if module.params['reload'] != "none":
+        command = ["systemctl", "restart", module.params['service_name']]
+        if module.params['reload'] == "sighup":
+            command = ["systemctl", "kill", "--signal=HUP",
+                       module.params['service_name']]
+        rc, stdout, stderr = module.run_command(command)
+        if rc != 0:
+            module.fail_json(
+                msg="Failed to reload '%s' service: %s" % (
+                    module.params['service_name'], stderr.strip()),
+                **result)
+        result["reloaded"] = True
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_etc_hosts_block
+
+short_description: manages block of hostname to IP mapping in hosts file
+
+version_added: "2.4"
+
+description:
+    - "Owns block of lines marked with 'block_id' in the hosts file and
+       rewrites it with single atomic write. Blocks with other IDs and all
+       other lines are kept as is, so several clusters can be defined in
+       the same hosts file side by side."
+    - "File is not touched if its content is not changed."
+    - "Lines with exactly one of the managed hostnames, like ones added by
+       'lineinfile', are removed from outside of the managed blocks."
+
+options:
+    path:
+        description:
+            - Path to the hosts file.
+        required: false
+        default: /etc/hosts
+    block_id:
+        description:
+            - ID of the block, for example, name of a cluster.
+        required: true
+    hostnames_ip_mapping:
+        description:
+            - Dict where keys are hostnames and values are IP addresses.
+              Hostnames with empty values are skipped.
+        required: false
+        default: {}
+    remove_hostnames:
+        description:
+            - Hostnames lines of which should be removed from outside of the
+              managed blocks in addition to the 'hostnames_ip_mapping' ones.
+        required: false
+        default: []
+    state:
+        description:
+            - Whether the block should be present or absent.
+        required: false
+        default: present
+        choices: ['present', 'absent']
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Add hostnames of the cluster nodes to the hosts file
+  dt_etc_hosts_block:
+    block_id: "{{ config.vmware.folder }}"
+    hostnames_ip_mapping: "{{ hostnames_ip_mapping }}"
+
+- name: Remove hostnames of the cluster nodes from the hosts file
+  dt_etc_hosts_block:
+    block_id: "{{ config.vmware.folder }}"
+    state: absent
+'''
+
+RETURN = '''
+hostnames:
+    description: Sorted list of hostnames in the block.
+    returned: always
+    type: list
+removed_unmanaged_lines:
+    description: Lines removed from outside of the managed blocks.
+    returned: always
+    type: list
+'''
+
+import os
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+
+BLOCK_BEGIN = "# BEGIN dt managed block: "
+BLOCK_END = "# END dt managed block: "
+
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return f.read().splitlines()
+
+
+def render_block(block_id, hostnames_ip_mapping):
+    if not hostnames_ip_mapping:
+        return []
+    return ([BLOCK_BEGIN + block_id] + [
+        "%s %s" % (hostnames_ip_mapping[hostname], hostname)
+        for hostname in sorted(hostnames_ip_mapping)
+    ] + [BLOCK_END + block_id])
+
+
+def render_lines(lines, block_id, block_lines, remove_hostnames):
+    """Return new lines of the file and removed unmanaged lines.
+
+    The block stays at its place if exists, otherwise it is appended.
+    """
+    new_lines, removed_lines = [], []
+    current_block_id = None
+    block_is_placed = False
+    for line in lines:
+        stripped_line = line.strip()
+        if current_block_id is None and stripped_line.startswith(
+                BLOCK_BEGIN):
+            current_block_id = stripped_line[len(BLOCK_BEGIN):]
+            if current_block_id == block_id:
+                new_lines.extend(block_lines)
+                block_is_placed = True
+                continue
+        elif current_block_id is not None:
+            if stripped_line == BLOCK_END + current_block_id:
+                is_our_block = current_block_id == block_id
+                current_block_id = None
+                if is_our_block:
+                    continue
+        if current_block_id == block_id:
+            continue
+        fields = stripped_line.split("#")[0].split()
+        if (current_block_id is None and len(fields) == 2 and
+                fields[1] in remove_hostnames):
+            removed_lines.append(line)
+            continue
+        new_lines.append(line)
+    if current_block_id == block_id:
+        raise ValueError(
+            "Block '%s' has no end marker, fix it manually" % block_id)
+    if not block_is_placed:
+        new_lines.extend(block_lines)
+    return new_lines, removed_lines
+
+
+def write_file(module, path, content):
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    # NOTE(vponomar): 'atomic_move' keeps permissions and SELinux context
+    # of the existing file.
+    module.atomic_move(tmp_path, path)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "path": {"type": "path", "default": "/etc/hosts"},
+            "block_id": {"type": "str", "required": True},
+            "hostnames_ip_mapping": {"type": "dict", "default": {}},
+            "remove_hostnames": {"type": "list", "default": []},
+            "state": {
+                "type": "str", "default": "present",
+                "choices": ["present", "absent"],
+            },
+        },
+        supports_check_mode=True,
+    )
+    path = module.params['path']
+    block_id = module.params['block_id'].strip()
+    if not block_id or "\n" in block_id:
+        module.fail_json(msg="'block_id' must be non-empty single line")
+
+    hostnames_ip_mapping = {}
+    if module.params['state'] == "present":
+        hostnames_ip_mapping = {
+            hostname: ip for hostname, ip in (
+                module.params['hostnames_ip_mapping'] or {}).items()
+            if hostname and ip}
+    remove_hostnames = set(module.params['remove_hostnames'] or []) | set(
+        module.params['hostnames_ip_mapping'] or {})
+
+    old_lines = read_lines(path)
+    try:
+        new_lines, removed_lines = render_lines(
+            old_lines, block_id,
+            render_block(block_id, hostnames_ip_mapping), remove_hostnames)
+    except ValueError as e:
+        module.fail_json(msg=str(e))
+    old_content = "".join(line + "\n" for line in old_lines)
+    new_content = "".join(line + "\n" for line in new_lines)
+    result = {
+        "changed": old_content != new_content,
+        "hostnames": sorted(hostnames_ip_mapping),
+        "removed_unmanaged_lines": removed_lines,
+        "diff": {
+            "before": old_content, "after": new_content,
+            "before_header": path, "after_header": path,
+        },
+    }
+    if result["changed"] and not module.check_mode:
+        write_file(module, path, new_content)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
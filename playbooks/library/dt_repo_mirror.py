@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_repo_mirror
+
+short_description: keeps local mirror of yum repositories and serves it
+
+version_added: "2.4"
+
+description:
+    - "Syncs yum repositories to the local directory, so all the nodes
+       download repo metadata and RPMs from it instead of the remote
+       mirrors. Only changed metadata files and absent RPMs are downloaded.
+       New metadata gets switched atomically after all the RPMs referenced
+       by it are downloaded, so the mirror is consistent at any time."
+    - "Optionally, serves the mirror over HTTP using detached threaded
+       HTTP server. Server is started only if it does not run yet and
+       keeps running till it is stopped using 'state=stopped'. Server has
+       no authentication, so bind it to the address reachable only by the
+       nodes if possible."
+
+options:
+    repositories:
+        description:
+            - List of repositories to mirror. Each of them is dict with 'name'
+              and 'url' keys. Each repository is mirrored to the
+              'dest/<name>' dir. Required if 'state' is 'present'.
+        required: false
+    dest:
+        description:
+            - Directory to keep the mirror in.
+        required: true
+    prune:
+        description:
+            - Whether to remove RPMs which are not referenced by the repo
+              metadata anymore or not.
+        required: false
+        default: true
+    max_parallel_downloads:
+        description:
+            - Amount of files downloaded at the same time.
+        required: false
+        default: 8
+    timeout:
+        description:
+            - Time in seconds to wait for response for each of requests.
+        required: false
+        default: 60
+    validate_certs:
+        description:
+            - Whether to validate SSL certificates of the repositories or not.
+        required: false
+        default: false
+    serve:
+        description:
+            - Whether to serve the 'dest' dir over HTTP or not.
+        required: false
+        default: false
+    port:
+        description:
+            - Port of the HTTP server serving the mirror.
+        required: false
+        default: 8088
+    bind_address:
+        description:
+            - Address the HTTP server listens on. '0.0.0.0' means all the
+              interfaces.
+        required: false
+        default: '0.0.0.0'
+    pid_file:
+        description:
+            - File to keep PID of the HTTP server in. Must be outside of
+              the 'dest' dir, so it is not served. Defaults to the
+              '<dest>.server.pid' file.
+        required: false
+    state:
+        description:
+            - "'present' syncs the mirror and serves it if 'serve' is set.
+               'stopped' only stops the HTTP server if it runs, the mirror
+               is kept to be reused later."
+        required: false
+        default: 'present'
+        choices: ['present', 'stopped']
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Sync local mirror of the downstream repositories and serve it
+  dt_repo_mirror:
+    repositories:
+    - name: downstream-foo
+      url: http://foo.bar/x86_64/os/
+    dest: /var/cache/dt-repo-mirror
+    serve: yes
+    port: 8088
+    bind_address: 192.168.1.10
+
+- name: Stop the repo mirror server
+  dt_repo_mirror:
+    dest: /var/cache/dt-repo-mirror
+    state: stopped
+'''
+
+RETURN = '''
+repositories:
+    description:
+        - One record per each of the repositories. Each of them has 'name',
+          'url', 'changed', 'packages', 'downloaded_files',
+          'downloaded_bytes', 'removed_files' and 'time_sec' keys.
+    returned: always
+    type: list
+server:
+    description:
+        - Dict with 'address', 'port', 'pid' and 'started' keys, or with
+          'pid' and 'stopped' keys if 'state' is 'stopped'. Empty if 'serve'
+          is disabled.
+    returned: always
+    type: dict
+'''
+
+import bz2
+import gzip
+import hashlib
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.urls import open_url
+
+REPO_NS = "{http://linux.duke.edu/metadata/repo}"
+COMMON_NS = "{http://linux.duke.edu/metadata/common}"
+REPODATA_DIR = "repodata"
+READ_CHUNK_SIZE = 1024 * 1024
+SERVER_PID_FILE_SUFFIX = ".server.pid"
+
+# NOTE(vponomar): 'SimpleHTTPServer' serves requests one by one, which is
+# too slow for lots of nodes downloading RPMs at the same time.
+HTTP_SERVER_SCRIPT = """
+import os, sys
+try:
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import SimpleHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class Handler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+os.chdir(sys.argv[1])
+Server((sys.argv[3], int(sys.argv[2])), Handler).serve_forever()
+"""
+
+
+def get_checksum(filepath, checksum_type):
+    # 'sha' is an alias for 'sha1' in the yum metadata
+    checksum = hashlib.new("sha1" if checksum_type == "sha" else checksum_type)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def get_safe_path(base_dir, href):
+    path = os.path.normpath(os.path.join(base_dir, href))
+    if not path.startswith(os.path.join(base_dir, "")):
+        raise ValueError("Unsafe location of repo file: '%s'" % href)
+    return path
+
+
+def read_compressed(filepath):
+    if filepath.endswith(".gz"):
+        with gzip.open(filepath, 'rb') as f:
+            return f.read()
+    if filepath.endswith(".bz2"):
+        with open(filepath, 'rb') as f:
+            return bz2.decompress(f.read())
+    if filepath.endswith(".xml"):
+        with open(filepath, 'rb') as f:
+            return f.read()
+    raise ValueError("Unsupported compression of '%s' file" % filepath)
+
+
+def parse_repomd(repomd_data):
+    """Return dict with metadata types as keys and dicts with 'href',
+    'checksum_type' and 'checksum' keys as values.
+    """
+    files = {}
+    for data in ET.fromstring(repomd_data).findall(REPO_NS + "data"):
+        checksum = data.find(REPO_NS + "checksum")
+        files[data.get("type")] = {
+            "href": data.find(REPO_NS + "location").get("href"),
+            "checksum_type": checksum.get("type"),
+            "checksum": checksum.text.strip(),
+        }
+    return files
+
+
+def parse_primary(primary_data):
+    """Return list of dicts with 'href', 'size', 'checksum_type' and
+    'checksum' keys describing packages of a repo.
+    """
+    packages = []
+    for package in ET.fromstring(primary_data).findall(COMMON_NS + "package"):
+        checksum = package.find(COMMON_NS + "checksum")
+        packages.append({
+            "href": package.find(COMMON_NS + "location").get("href"),
+            "size": int(package.find(COMMON_NS + "size").get("package")),
+            "checksum_type": checksum.get("type"),
+            "checksum": checksum.text.strip(),
+        })
+    return packages
+
+
+class RepoMirror(object):
+    def __init__(self, module, name, url):
+        self.module = module
+        self.params = module.params
+        self.name = name
+        self.url = url.rstrip("/") + "/"
+        self.dest = os.path.join(self.params['dest'], name)
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.record = {
+            "name": name,
+            "url": url,
+            "changed": False,
+            "packages": 0,
+            "downloaded_files": 0,
+            "downloaded_bytes": 0,
+            "removed_files": 0,
+            "time_sec": None,
+        }
+
+    def read_url(self, href):
+        response = open_url(
+            self.url + href, timeout=self.params['timeout'],
+            validate_certs=self.params['validate_certs'])
+        return response.read()
+
+    def download(self, href, filepath, checksum_type, checksum):
+        """Download file to the temporary file near by and move it
+        to 'filepath' only if its checksum is correct.
+        """
+        file_dir = os.path.dirname(filepath)
+        if not os.path.isdir(file_dir):
+            try:
+                os.makedirs(file_dir)
+            except OSError:
+                # Created by one of the parallel downloads
+                if not os.path.isdir(file_dir):
+                    raise
+        response = open_url(
+            self.url + href, timeout=self.params['timeout'],
+            validate_certs=self.params['validate_certs'])
+        fd, tmp_filepath = tempfile.mkstemp(dir=file_dir, suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(
+                        lambda: response.read(READ_CHUNK_SIZE), b""):
+                    f.write(chunk)
+                    size += len(chunk)
+            actual_checksum = get_checksum(tmp_filepath, checksum_type)
+            if actual_checksum != checksum:
+                raise ValueError(
+                    "Checksum mismatch of '%s': expected '%s', got '%s'" % (
+                        self.url + href, checksum, actual_checksum))
+            os.rename(tmp_filepath, filepath)
+        except Exception:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            raise
+        with self.lock:
+            self.record["downloaded_files"] += 1
+            self.record["downloaded_bytes"] += size
+
+    def download_all(self, files):
+        """Download list of (href, filepath, checksum_type, checksum) tuples
+        using pool of threads. Raises first of the happened errors.
+        """
+        queue = list(files)
+        errors = []
+
+        def worker():
+            while not errors:
+                with self.lock:
+                    if not queue:
+                        return
+                    args = queue.pop(0)
+                try:
+                    self.download(*args)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker) for i in range(
+            min(len(queue), self.params['max_parallel_downloads']))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def is_valid(self, filepath, checksum_type, checksum, size=None):
+        if not os.path.isfile(filepath):
+            return False
+        if size is not None and os.path.getsize(filepath) != size:
+            return False
+        return get_checksum(filepath, checksum_type) == checksum
+
+    def stage_metadata(self, repomd_data, metadata_files, current_repodata,
+                       new_repodata):
+        """Put all the metadata files to the 'new_repodata' dir reusing
+        unchanged ones from the 'current_repodata' dir.
+        """
+        if os.path.isdir(new_repodata):
+            shutil.rmtree(new_repodata)
+        os.makedirs(new_repodata)
+        downloads = []
+        for metadata in metadata_files.values():
+            filename = os.path.basename(metadata["href"])
+            current_filepath = os.path.join(current_repodata, filename)
+            new_filepath = os.path.join(new_repodata, filename)
+            if self.is_valid(current_filepath, metadata["checksum_type"],
+                             metadata["checksum"]):
+                shutil.copy2(current_filepath, new_filepath)
+            else:
+                downloads.append((
+                    metadata["href"], new_filepath,
+                    metadata["checksum_type"], metadata["checksum"]))
+        self.download_all(downloads)
+        with open(os.path.join(new_repodata, "repomd.xml"), 'wb') as f:
+            f.write(repomd_data)
+
+    def sync(self):
+        repomd_data = self.read_url(REPODATA_DIR + "/repomd.xml")
+        metadata_files = parse_repomd(repomd_data)
+        if "primary" not in metadata_files:
+            raise ValueError("Repo '%s' has no 'primary' metadata" % self.url)
+
+        current_repodata = os.path.join(self.dest, REPODATA_DIR)
+        repomd_filepath = os.path.join(current_repodata, "repomd.xml")
+        old_repomd_data = None
+        if os.path.isfile(repomd_filepath):
+            with open(repomd_filepath, 'rb') as f:
+                old_repomd_data = f.read()
+        metadata_changed = old_repomd_data != repomd_data or not all(
+            self.is_valid(
+                os.path.join(current_repodata,
+                             os.path.basename(metadata["href"])),
+                metadata["checksum_type"], metadata["checksum"])
+            for metadata in metadata_files.values())
+
+        # Download changed metadata to the staging dir first
+        repodata = current_repodata
+        if metadata_changed:
+            repodata = os.path.join(self.dest, REPODATA_DIR + ".new")
+            self.stage_metadata(
+                repomd_data, metadata_files, current_repodata, repodata)
+
+        # Download absent packages before switching to the new metadata
+        packages = parse_primary(read_compressed(os.path.join(
+            repodata, os.path.basename(metadata_files["primary"]["href"]))))
+        package_paths = set()
+        downloads = []
+        for package in packages:
+            filepath = get_safe_path(self.dest, package["href"])
+            package_paths.add(filepath)
+            # NOTE(vponomar): RPMs never change having the same name, so
+            # check only size of the existing ones, it is much faster.
+            if (os.path.isfile(filepath) and
+                    os.path.getsize(filepath) == package["size"]):
+                continue
+            downloads.append((
+                package["href"], filepath,
+                package["checksum_type"], package["checksum"]))
+        self.download_all(downloads)
+        self.record["packages"] = len(packages)
+
+        if metadata_changed:
+            old_repodata = os.path.join(self.dest, REPODATA_DIR + ".old")
+            if os.path.isdir(old_repodata):
+                shutil.rmtree(old_repodata)
+            if os.path.isdir(current_repodata):
+                os.rename(current_repodata, old_repodata)
+            os.rename(repodata, current_repodata)
+            if os.path.isdir(old_repodata):
+                shutil.rmtree(old_repodata)
+
+        if self.params['prune']:
+            self.prune(package_paths)
+        self.record["changed"] = bool(
+            metadata_changed or self.record["downloaded_files"] or
+            self.record["removed_files"])
+        self.record["time_sec"] = round(time.time() - self.start_time, 3)
+        return self.record
+
+    def prune(self, package_paths):
+        for root, dirs, files in os.walk(self.dest):
+            if root == self.dest:
+                dirs[:] = [
+                    d for d in dirs if not d.startswith(REPODATA_DIR)]
+            for filename in files:
+                filepath = os.path.join(root, filename)
+                if (filename.endswith((".rpm", ".tmp")) and
+                        filepath not in package_paths):
+                    os.remove(filepath)
+                    self.record["removed_files"] += 1
+
+
+def is_port_open(address, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1)
+        return sock.connect_ex((
+            "127.0.0.1" if address in ("", "0.0.0.0") else address,
+            port)) == 0
+    finally:
+        sock.close()
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def read_server_pid(pid_filepath, dest):
+    """Return PID of the running server of the 'dest' dir or None."""
+    if not os.path.isfile(pid_filepath):
+        return None
+    with open(pid_filepath, 'r') as f:
+        pid = int(f.read().strip() or 0) or None
+    if not pid or not is_process_alive(pid):
+        return None
+    # NOTE(vponomar): PID may be reused by other process after reboot.
+    cmdline_filepath = "/proc/%d/cmdline" % pid
+    if os.path.isfile(cmdline_filepath):
+        with open(cmdline_filepath, 'rb') as f:
+            args = f.read().decode("utf-8", "replace").split("\0")
+        if dest not in args or not any(
+                "serve_forever" in arg for arg in args):
+            return None
+    return pid
+
+
+def start_server(dest, address, port, pid_filepath):
+    """Start detached HTTP server serving 'dest' dir if it is not started."""
+    pid = read_server_pid(pid_filepath, dest)
+    if pid and is_port_open(address, port):
+        return {"address": address, "port": port, "pid": pid,
+                "started": False}
+    if is_port_open(address, port):
+        raise ValueError(
+            "Port '%s' is used by other process than the repo mirror "
+            "server" % port)
+
+    with open(os.devnull, 'r+') as devnull:
+        process = subprocess.Popen(
+            [sys.executable, "-c", HTTP_SERVER_SCRIPT, dest, str(port),
+             address],
+            stdin=devnull, stdout=devnull, stderr=devnull,
+            close_fds=True, preexec_fn=os.setsid)
+    with open(pid_filepath, 'w') as f:
+        f.write(str(process.pid))
+    for i in range(50):
+        if is_port_open(address, port):
+            return {"address": address, "port": port, "pid": process.pid,
+                    "started": True}
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    raise ValueError("Failed to start repo mirror server on '%s:%s'" % (
+        address, port))
+
+
+def stop_server(dest, pid_filepath):
+    """Stop HTTP server serving 'dest' dir if it runs."""
+    pid = read_server_pid(pid_filepath, dest)
+    if pid is not None:
+        # Server is started in its own session, so kill the whole group
+        os.killpg(pid, signal.SIGTERM)
+        for i in range(50):
+            if not is_process_alive(pid):
+                break
+            time.sleep(0.1)
+        else:
+            raise ValueError(
+                "Repo mirror server with '%s' PID is not stopped" % pid)
+    if os.path.isfile(pid_filepath):
+        os.remove(pid_filepath)
+    return {"pid": pid, "stopped": pid is not None}
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "repositories": {"type": "list"},
+            "dest": {"type": "path", "required": True},
+            "prune": {"type": "bool", "default": True},
+            "max_parallel_downloads": {"type": "int", "default": 8},
+            "timeout": {"type": "int", "default": 60},
+            "validate_certs": {"type": "bool", "default": False},
+            "serve": {"type": "bool", "default": False},
+            "port": {"type": "int", "default": 8088},
+            "bind_address": {"type": "str", "default": "0.0.0.0"},
+            "pid_file": {"type": "path"},
+            "state": {
+                "type": "str", "default": "present",
+                "choices": ["present", "stopped"],
+            },
+        },
+        required_if=[["state", "present", ["repositories"]]],
+    )
+    dest = os.path.abspath(module.params['dest'])
+    module.params['dest'] = dest
+    pid_filepath = os.path.abspath(
+        module.params['pid_file'] or dest.rstrip("/") + SERVER_PID_FILE_SUFFIX)
+    if pid_filepath.startswith(os.path.join(dest, "")):
+        module.fail_json(msg="PID file must be outside of the 'dest' dir")
+
+    if module.params['state'] == 'stopped':
+        try:
+            server = stop_server(dest, pid_filepath)
+        except Exception as e:
+            module.fail_json(msg=str(e))
+        module.exit_json(changed=server["stopped"], repositories=[],
+                         server=server)
+
+    if module.params['max_parallel_downloads'] < 1:
+        module.fail_json(msg="'max_parallel_downloads' must be positive")
+
+    urls = {}
+    for repo in module.params['repositories']:
+        if not repo.get("name") or not repo.get("url"):
+            module.fail_json(
+                msg="Each of repositories must have 'name' and 'url' keys")
+        if urls.setdefault(repo["name"], repo["url"]) != repo["url"]:
+            module.fail_json(
+                msg="Repository '%s' is defined with different URLs: "
+                    "'%s' and '%s'" % (
+                        repo["name"], urls[repo["name"]], repo["url"]))
+
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+
+    records = []
+    for name in sorted(urls):
+        try:
+            records.append(RepoMirror(module, name, urls[name]).sync())
+        except Exception as e:
+            module.fail_json(
+                msg="Failed to sync '%s' repository from '%s': %s" % (
+                    name, urls[name], e),
+                repositories=records)
+
+    server = {}
+    if module.params['serve']:
+        try:
+            server = start_server(
+                dest, module.params['bind_address'], module.params['port'],
+                pid_filepath)
+        except Exception as e:
+            module.fail_json(msg=str(e), repositories=records)
+
+    module.exit_json(
+        changed=(any(record["changed"] for record in records) or
+                 server.get("started", False)),
+        repositories=records, server=server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_report
+
+short_description: buffers report writes and flushes each file once
+
+version_added: "2.4"
+
+description:
+    - "Keeps edits of the report files in memory of the Ansible runner
+       keyed by file and section instead of writing each of them right
+       away. Then, writes each of the files once, atomically, using single
+       'dt_yedit' module call."
+    - "Buffers are kept as facts of the localhost, so edits made by the
+       tasks of other hosts must be delegated to the localhost with the
+       'delegate_facts' option."
+    - "Use it with the handler run at the end of the play with enabled
+       'force_handlers' play option, so the reports are flushed even if
+       some of the hosts fail."
+    - "This module is implemented as action plugin."
+
+options:
+    src:
+        description:
+            - Path to the report file on the localhost. Required unless
+              'flush' is set.
+        required: false
+    edits:
+        description:
+            - List of edits in the format of the 'edits' option of the
+              'dt_yedit' module. Edits setting the same key in the same
+              file replace the earlier buffered ones.
+        required: false
+        default: []
+    separator:
+        description:
+            - Separator of the keys of the 'edits'. Must be the same for all
+              the edits of the same file.
+        required: false
+        default: '.'
+    flush:
+        description:
+            - Write all the buffered edits of all the hosts to the files
+              and clear the buffers. Edits of the files failed to be written
+              are kept.
+        required: false
+        default: false
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- hosts: dt_glusterfs
+  force_handlers: yes
+  tasks:
+  - name: Write Gluster node data to the report
+    delegate_to: localhost
+    delegate_facts: yes
+    dt_report:
+      src: "{{ data_file_path }}"
+      edits:
+      - key: "gluster_node_{{ inventory_hostname }}"
+        value:
+          List of Packages: "{{ packages.stdout_lines }}"
+    notify: Flush report
+  handlers:
+  - name: Flush report
+    delegate_to: localhost
+    delegate_facts: yes
+    run_once: yes
+    dt_report:
+      flush: yes
+'''
+
+RETURN = '''
+buffered_edits:
+    description: Amount of edits buffered by the current host.
+    returned: when 'flush' is not set
+    type: int
+files:
+    description:
+        - Dict with 'changed', 'edits' and, in case of failure, 'msg' keys
+          per each of the written files.
+    returned: when 'flush' is set
+    type: dict
+'''
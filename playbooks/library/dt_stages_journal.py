@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_stages_journal
+
+short_description: keeps journal of completed stages of the control playbook
+
+version_added: "2.4"
+
+description:
+    - "Records each completed stage of the control playbook with hash of its
+       inputs, hash of the config file and duration of the stage."
+    - "Stage is considered to be up to date if it is completed, its inputs
+       are not changed and the previous stage has not been re-run since
+       then. Once some stage is not up to date, all the next ones are not
+       up to date either."
+    - "Journal is written atomically on each change."
+
+options:
+    path:
+        description:
+            - Path to the journal file.
+        required: true
+    action:
+        description:
+            - "'plan' calculates which of the 'stages' are up to date.
+               'start' marks 'stage' as running, so it and all the next
+               stages become not up to date till it is finished.
+               'finish' marks 'stage' as completed."
+        required: true
+        choices: ['plan', 'start', 'finish']
+    stages:
+        description:
+            - "Ordered list of all the stages. Each item is a dict with
+               'name', 'inputs' and 'input_files' keys. Required for the
+               'plan' action."
+        required: false
+        default: []
+    stage:
+        description:
+            - Name of the stage. Required for the 'start' and 'finish'
+              actions.
+        required: false
+    previous_stage:
+        description:
+            - Name of the stage which goes before the 'stage' one.
+              Used by the 'start' action.
+        required: false
+    inputs:
+        description:
+            - Any data the stage depends on. Used by the 'start' action.
+        required: false
+        default: {}
+    input_files:
+        description:
+            - Files the stage depends on. Absent files are allowed.
+              Used by the 'start' action.
+        required: false
+        default: []
+    config_sha256:
+        description:
+            - SHA256 hash of the config file content to be saved in the
+              journal. Used by the 'start' action.
+        required: false
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Calculate stages which can be skipped
+  dt_stages_journal:
+    path: "{{ config.common.output_stages_journal_file }}"
+    action: plan
+    stages:
+    - name: "1"
+      inputs: "{{ config.vmware }}"
+    - name: "2"
+      inputs: "{{ config.vm }}"
+      input_files: "{{ ansible_inventory_sources }}"
+  register: stages_plan
+
+- name: Mark stage as running
+  dt_stages_journal:
+    path: "{{ config.common.output_stages_journal_file }}"
+    action: start
+    stage: "2"
+    previous_stage: "1"
+    inputs: "{{ config.vm }}"
+    input_files: "{{ ansible_inventory_sources }}"
+    config_sha256: "{{ config_output.config_sha256 }}"
+
+- name: Mark stage as completed
+  dt_stages_journal:
+    path: "{{ config.common.output_stages_journal_file }}"
+    action: finish
+    stage: "2"
+'''
+
+RETURN = '''
+up_to_date_stages:
+    description: Names of the stages which can be skipped.
+    returned: when action is 'plan'
+    type: list
+stages:
+    description:
+        - Dicts with 'name', 'up_to_date', 'reason' and 'duration_sec'
+          (of the last completed run) keys for each of the stages.
+    returned: when action is 'plan'
+    type: list
+record:
+    description: Journal record of the stage.
+    returned: when action is 'start' or 'finish'
+    type: dict
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from ansible.module_utils.basic import AnsibleModule
+
+JOURNAL_VERSION = 1
+
+
+def read_journal(path):
+    try:
+        with open(path, 'r') as f:
+            journal = json.load(f)
+    except (IOError, OSError, ValueError):
+        # Absent or broken journal means that nothing is completed
+        return {"version": JOURNAL_VERSION, "stages": {}}
+    if journal.get("version") != JOURNAL_VERSION:
+        return {"version": JOURNAL_VERSION, "stages": {}}
+    return journal
+
+
+def write_journal(path, journal):
+    file_dir = os.path.dirname(path)
+    if not os.path.isdir(file_dir):
+        os.makedirs(file_dir, 0o755)
+    fd, tmp_path = tempfile.mkstemp(dir=file_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(journal, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_file_sha256(path):
+    sha256 = hashlib.sha256()
+    try:
+        with open(os.path.expanduser(path), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+    except (IOError, OSError):
+        return None
+    return sha256.hexdigest()
+
+
+def get_inputs_sha256(inputs, input_files):
+    data = json.dumps({
+        "inputs": inputs,
+        "input_files": [
+            [path, get_file_sha256(path)] for path in input_files or []],
+    }, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def get_run_id(journal, stage):
+    return journal["stages"].get(stage, {}).get("run_id")
+
+
+def plan(journal, stages):
+    """Return records with 'up_to_date' flag and its reason per stage."""
+    result, previous_stage, is_chain_up_to_date = [], None, True
+    for stage in stages:
+        record = journal["stages"].get(stage["name"])
+        reason = ""
+        if not is_chain_up_to_date:
+            reason = "previous stage is to be run"
+        elif not record or record.get("status") != "completed":
+            reason = "stage is not completed"
+        elif record["inputs_sha256"] != get_inputs_sha256(
+                stage.get("inputs"), stage.get("input_files")):
+            reason = "inputs are changed"
+        elif record.get("upstream_run_id") != get_run_id(
+                journal, previous_stage):
+            reason = "previous stage has been re-run"
+        is_chain_up_to_date = not reason
+        result.append({
+            "name": stage["name"],
+            "up_to_date": is_chain_up_to_date,
+            "reason": reason,
+            "duration_sec": (record or {}).get("duration_sec"),
+        })
+        previous_stage = stage["name"]
+    return result
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "path": {"type": "path", "required": True},
+            "action": {
+                "type": "str", "required": True,
+                "choices": ["plan", "start", "finish"],
+            },
+            "stages": {"type": "list", "default": []},
+            "stage": {"type": "str", "required": False},
+            "previous_stage": {"type": "str", "required": False},
+            "inputs": {"type": "raw", "default": {}},
+            "input_files": {"type": "list", "default": []},
+            "config_sha256": {"type": "str", "required": False},
+        },
+        required_if=[
+            ["action", "start", ["stage"]],
+            ["action", "finish", ["stage"]],
+        ],
+    )
+    path = os.path.abspath(module.params['path'])
+    stage = module.params['stage']
+    journal = read_journal(path)
+
+    if module.params['action'] == "plan":
+        stages = plan(journal, module.params['stages'])
+        module.exit_json(
+            changed=False, stages=stages,
+            up_to_date_stages=[s["name"] for s in stages if s["up_to_date"]])
+
+    if module.params['action'] == "start":
+        journal["stages"][stage] = {
+            "status": "running",
+            "run_id": None,
+            "upstream_run_id": get_run_id(
+                journal, module.params['previous_stage']),
+            "inputs_sha256": get_inputs_sha256(
+                module.params['inputs'], module.params['input_files']),
+            "config_sha256": module.params['config_sha256'],
+            "started_at": round(time.time(), 3),
+            "finished_at": None,
+            "duration_sec": None,
+        }
+    else:
+        record = journal["stages"].get(stage)
+        if not record or record["status"] != "running":
+            module.fail_json(msg="Stage '%s' has not been started" % stage)
+        finished_at = round(time.time(), 3)
+        record.update(
+            status="completed",
+            run_id=uuid.uuid4().hex,
+            finished_at=finished_at,
+            duration_sec=round(finished_at - record["started_at"], 3))
+    write_journal(path, journal)
+    module.exit_json(changed=True, record=journal["stages"][stage])
+
+
+if __name__ == '__main__':
+    main()
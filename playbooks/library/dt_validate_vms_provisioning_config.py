@@ -26,6 +26,19 @@ options:
         description:
             - List of top-level config options to validate.
         required: false
+    use_cache:
+        description:
+            - Whether to reuse results of previous validations of the same
+              config file. Cached entries are keyed by hash of the file
+              content, 'check_groups' and version of the config schema,
+              so any edit of the config file invalidates them.
+        required: false
+        default: true
+    cache_dir:
+        description:
+            - Directory where validated configs are cached.
+        required: false
+        default: "~/.cache/dt_validate_vms_provisioning_config"
 
 extends_documentation_fragment:
 
@@ -50,15 +63,74 @@ RETURN = '''
 config:
     description: Dictionary with validated data and inserted in default values.
     type: dict
+cache_hit:
+    description: Whether validated config was taken from the cache or not.
+    type: bool
+config_sha256:
+    description: SHA256 hash of the config file content.
+    type: str
+ocp_nodes:
+    description:
+        - Provisioning plan of the VMs defined in the 'vmware' config section.
+          Keys are VM names and values are dicts with 'group',
+          'resource_pool', 'clone_mode', 'template', 'num_cpus', 'ram_mb'
+          and 'disks' keys.
+          Empty if 'vmware' config section is not validated.
+    type: dict
+child_resource_pools:
+    description:
+        - Resource pools to be created inside of the 'vmware.resource_pool'
+          one for the node groups which have 'resource_pool_allocation'
+          defined. Keys are names of the pools and values are allocations.
+    type: dict
 '''
 
+import copy
+import hashlib
+import json
+import os
+import re
+import tempfile
+
 import schema
 import yaml
 
 from ansible.module_utils.basic import AnsibleModule
 
+# NOTE(vponomar): increase it each time the config schema gets changed, so
+# the cached results of previous validations become stale.
+CONFIG_SCHEMA_VERSION = 15
 
-def validate_config_structure(module, config):
+# Limits of the VMs supported by the vSphere 6.5+ and 'vmware_guest' module,
+# which attaches all the disks of a VM to the single SCSI controller.
+MAX_VM_NUM_CPUS = 128
+MAX_VM_RAM_MB = 6128 * 1024
+MAX_VM_DISKS = 15
+
+# VM names may be defined as ranges, i.e. 'node-[001-120]'
+VM_NAMES_RANGE_REGEX = re.compile(r"^(.*)\[(\d+)-(\d+)\](.*)$")
+
+
+def expand_vm_names(names):
+    expanded_names = []
+    for name in names:
+        match = VM_NAMES_RANGE_REGEX.match(name)
+        if not match:
+            expanded_names.append(name)
+            continue
+        prefix, start, end, suffix = match.groups()
+        if int(start) > int(end):
+            {}["Start of the VM names range should not be bigger than "
+               "its end: '%s'" % name]
+        expanded_names.extend(
+            "%s%0*d%s" % (prefix, len(start), i, suffix)
+            for i in range(int(start), int(end) + 1))
+    if len(set(expanded_names)) != len(expanded_names):
+        {}["VM names should be unique: %s" % names]
+    return expanded_names
+
+
+def build_config_schema_dict():
     def non_empty_string_without_spaces(input_string):
         if ' ' in input_string or not input_string.strip():
             {}['Repository name should not be empty and should not contain '
@@ -73,6 +145,16 @@ def validate_config_structure(module, config):
             "glusterfs_registry": [],
         },
     }
+    vm_repo_cache_default = {
+        "mode": "none",
+        "proxy_url": None,
+        "mirror_host": "localhost",
+        "mirror_dir": "~/.cache/dt_repo_mirror",
+        "mirror_port": 8088,
+        "mirror_bind_address": "0.0.0.0",
+        "mirror_url": None,
+        "makecache": True,
+    }
     cluster_validation_default = dict(
         {"skip": True}.items() +
         {pod_type: {
@@ -86,7 +168,21 @@ def validate_config_structure(module, config):
     common_default = {
         "output_tests_config_file": "../tests_config.yaml",
         "output_cluster_info_file": "../cluster_info.yaml",
+        "output_cluster_state_file": "../cluster_state.yaml",
+        "output_stages_journal_file": "../stages_journal.json",
     }
+    resource_pool_allocation_schema = {}
+    for prefix in ("cpu", "mem"):
+        resource_pool_allocation_schema.update({
+            schema.Optional("%s_reservation" % prefix, default=0): (
+                schema.And(int, lambda i: i >= 0)),
+            schema.Optional("%s_limit" % prefix, default=-1): (
+                schema.And(int, lambda i: i >= -1)),
+            schema.Optional("%s_shares" % prefix, default="normal"): (
+                schema.And(str, lambda s: s in ("high", "normal", "low"))),
+            schema.Optional("%s_expandable_reservations" % prefix,
+                            default=True): bool,
+        })
     config_schema_dict = {
         "vmware": {
             "host": schema.And(str, len),
@@ -97,32 +193,58 @@ def validate_config_structure(module, config):
             "resource_pool": schema.And(str, len),
             "folder": schema.And(str, len),
             "datastore": schema.And(str, len),
+            schema.Optional("disks_placement", default=None): schema.Or(
+                None, {
+                    schema.Optional("policy", default="free_space"): (
+                        schema.And(str, lambda s: s in (
+                            "free_space", "round_robin"))),
+                    schema.Optional("datastores", default=[]): [
+                        schema.And(str, len)],
+                    schema.Optional("datastore_cluster", default=None): (
+                        schema.Or(None, schema.And(str, len))),
+                    schema.Optional("storage_datastores", default=[]): [
+                        schema.And(str, len)],
+                    schema.Optional("separate_gluster_bricks",
+                                    default=True): bool,
+                }),
             "vm_network": schema.And(str, len),
             "vm_templates": [schema.And(str, len)],
-            "vm_parameters": {node_type: {
+            schema.Optional("delete_absent_vms", default=False): bool,
+            "vm_parameters": {node_type: schema.And({
                 schema.Optional("num_cpus", default=1): schema.And(
-                    int, lambda i: i in range(1, 17)),
+                    int, lambda i: 1 <= i <= MAX_VM_NUM_CPUS),
                 schema.Optional("ram_mb", default=16384): schema.And(
-                    int, lambda i: 4096 <= i <= 65535),
+                    int, lambda i: 4096 <= i <= MAX_VM_RAM_MB),
                 schema.Optional("names", default=[]): schema.Or(
                     schema.Use(lambda o: (
                         [] if (o is None or o == []) else {}[
                             "Only 'None' or 'list' objects are allowed"]
                     )),
-                    schema.And([schema.And(str, len)], lambda l: len(l) <= 9),
+                    schema.And([schema.And(str, len)],
+                               schema.Use(expand_vm_names)),
                 ),
                 schema.Optional("system_disks_gb", default=[150]): schema.And(
                     [schema.And(int, lambda i: 0 < i)],
-                    lambda l: len(l) <= 4),
+                    lambda l: len(l) <= MAX_VM_DISKS),
                 schema.Optional("system_disks_type", default='thin'): (
                     schema.And(str, len)),
                 schema.Optional("storage_disks_gb", default=(
                     [100, 600, 100] if 'gluster' in node_type else []
                 )): schema.And(
-                    [schema.And(int, lambda i: 0 < i)], lambda l: len(l) <= 7),
+                    [schema.And(int, lambda i: 0 < i)],
+                    lambda l: len(l) <= MAX_VM_DISKS),
                 schema.Optional("storage_disks_type", default='thin'): (
-                    schema.And(str, len))
-            } for node_type in node_types if node_type != "all"}
+                    schema.And(str, len)),
+                # NOTE(vponomar): instant clones are not accepted till
+                # there is an agent setting identity of the clones in
+                # the guest OS of the templates.
+                schema.Optional("clone_mode", default="full"): schema.And(
+                    str, lambda s: s in ("full", "linked")),
+                schema.Optional("resource_pool_allocation", default=None): (
+                    schema.Or(None, resource_pool_allocation_schema)),
+            }, lambda d: len(d["system_disks_gb"]) + len(
+                d["storage_disks_gb"]) <= MAX_VM_DISKS,
+            ) for node_type in node_types if node_type != "all"}
         },
         "vm": {
             schema.Optional("dns",
@@ -197,11 +319,41 @@ def validate_config_structure(module, config):
                         }
                     ),
                 }),
+                schema.Optional("cache", default=vm_repo_cache_default): (
+                    schema.And({
+                        schema.Optional("mode", default="none"): schema.And(
+                            str, lambda s: s in ("none", "proxy", "mirror")),
+                        schema.Optional("proxy_url", default=None): (
+                            schema.Or(None, schema.And(
+                                str, lambda s: s.startswith("http")))),
+                        schema.Optional("mirror_host",
+                                        default="localhost"): (
+                            schema.And(str, len)),
+                        schema.Optional("mirror_dir",
+                                        default="~/.cache/dt_repo_mirror"): (
+                            schema.And(str, len)),
+                        schema.Optional("mirror_port", default=8088): (
+                            schema.And(int, lambda i: 0 < i < 65536)),
+                        schema.Optional("mirror_bind_address",
+                                        default="0.0.0.0"): (
+                            schema.And(str, len)),
+                        schema.Optional("mirror_url", default=None): (
+                            schema.Or(None, schema.And(
+                                str, lambda s: s.startswith("http")))),
+                        schema.Optional("makecache", default=True): bool,
+                    }, lambda d: (
+                        (d["mode"] != "proxy" or d["proxy_url"]) and
+                        (d["mode"] != "mirror" or d["mirror_url"])))),
             },
             "yum": {
                 schema.Optional("update", default=True): bool,
                 schema.Optional("reboot_after_update", default=True): bool,
-                schema.Optional("sleep_after_reboot_sec", default=60): int,
+                schema.Optional("sleep_after_reboot_sec", default=0): int,
+                schema.Optional("batch_size", default=0): schema.And(
+                    int, lambda i: i >= 0),
+                schema.Optional("max_parallel_downloads", default=5):
+                    schema.And(int, lambda i: i >= 0),
+                schema.Optional("download_only_first", default=True): bool,
             },
             "uninstall_packages": schema.Or(
                 schema.Use(lambda o: (
@@ -332,7 +484,9 @@ def validate_config_structure(module, config):
         "common": schema.Or(
             schema.Use(lambda o: (
                 {"output_tests_config_file": common_default["output_tests_config_file"],
-                 "output_cluster_info_file": common_default["output_cluster_info_file"]}
+                 "output_cluster_info_file": common_default["output_cluster_info_file"],
+                 "output_cluster_state_file": common_default["output_cluster_state_file"],
+                 "output_stages_journal_file": common_default["output_stages_journal_file"]}
                 if (o is None or o == {}) else {}[
                     "Only 'dict' and 'None' values are allowed"])
             ),
@@ -342,31 +496,272 @@ def validate_config_structure(module, config):
              schema.Optional("output_cluster_info_file",
                              default=(common_default["output_cluster_info_file"])): (
                  schema.And(str, len)),
+             schema.Optional("output_cluster_state_file",
+                             default=(common_default["output_cluster_state_file"])): (
+                 schema.And(str, len)),
+             schema.Optional("output_stages_journal_file",
+                             default=(common_default["output_stages_journal_file"])): (
+                 schema.And(str, len)),
             },
         ),
     }
-    if module.params["check_groups"]:
-        config_schema_dict = {
-            k:v for k, v in config_schema_dict.items()
-            if getattr(k, 'key', k) in module.params["check_groups"]}
-        config_schema = schema.Schema(
-            config_schema_dict, ignore_extra_keys=True)
-    else:
-        config_schema = schema.Schema(config_schema_dict)
+    return config_schema_dict
+
+
+class CompiledSchemaMismatch(Exception):
+    pass
+
+
+def _raise_mismatch(data):
+    raise CompiledSchemaMismatch(data)
+
+
+def compile_schema(s, ignore_extra_keys=False):
+    """Compile 'schema' library objects into plain python callables.
+
+    Compiled callables return the same data as the 'schema' library does for
+    valid input and raise exceptions for everything else, not caring about
+    the error messages. So, on failure, data is expected to be validated once
+    again using the 'schema' library to get the proper error message.
+    Unknown schema objects are validated using the 'schema' library as is.
+    """
+    if type(s) in (schema.And, schema.Or):
+        validators = [compile_schema(arg, s._ignore_extra_keys)
+                      for arg in s._args]
+        if type(s) is schema.And:
+            def validate_and(data):
+                for validator in validators:
+                    data = validator(data)
+                return data
+            return validate_and
+
+        def validate_or(data):
+            for validator in validators:
+                try:
+                    return validator(data)
+                except Exception:
+                    pass
+            _raise_mismatch(data)
+        return validate_or
+    if type(s) is schema.Use:
+        return s._callable
+    if type(s) is list:
+        validate_item = compile_schema(schema.Or(
+            *s, ignore_extra_keys=ignore_extra_keys))
+
+        def validate_list(data):
+            if not isinstance(data, list):
+                _raise_mismatch(data)
+            return type(data)(validate_item(item) for item in data)
+        return validate_list
+    if type(s) is dict and all(
+            type(getattr(k, '_schema', k)) is str and (
+                type(k) in (str, schema.Optional)) for k in s):
+        keys, required_keys, defaults = {}, set(), []
+        for k, v in s.items():
+            key = getattr(k, '_schema', k)
+            keys[key] = compile_schema(v, ignore_extra_keys)
+            if type(k) is str:
+                required_keys.add(key)
+            elif hasattr(k, 'default') and not callable(k.default):
+                defaults.append((key, k.default))
+            elif hasattr(k, 'default'):
+                # NOTE(vponomar): callable defaults are not used by config
+                # schema, so let 'schema' library handle them.
+                return schema.Schema(s, ignore_extra_keys=ignore_extra_keys
+                                     ).validate
 
+        def validate_dict(data):
+            if not isinstance(data, dict):
+                _raise_mismatch(data)
+            new = type(data)()
+            for key, value in data.items():
+                if key in keys:
+                    new[key] = keys[key](value)
+                elif not ignore_extra_keys:
+                    _raise_mismatch(data)
+            if not required_keys.issubset(new):
+                _raise_mismatch(data)
+            for key, default in defaults:
+                if key not in new:
+                    new[key] = default
+            return new
+        return validate_dict
+    if issubclass(type(s), type):
+        def validate_type(data):
+            if not isinstance(data, s) or (isinstance(data, bool) and
+                                           s is int):
+                _raise_mismatch(data)
+            return data
+        return validate_type
+    if not (callable(s) or hasattr(s, 'validate')):
+        def validate_literal(data):
+            if s != data:
+                _raise_mismatch(data)
+            return data
+        return validate_literal
+    if callable(s) and not hasattr(s, 'validate'):
+        def validate_callable(data):
+            if not s(data):
+                _raise_mismatch(data)
+            return data
+        return validate_callable
+    return schema.Schema(s, ignore_extra_keys=ignore_extra_keys).validate
+
+
+class ConfigValidator(object):
+    """Config validator built once per set of top-level config keys."""
+
+    def __init__(self, check_groups=None):
+        config_schema_dict = CONFIG_SCHEMA_DICT
+        if check_groups:
+            config_schema_dict = {
+                k: v for k, v in config_schema_dict.items()
+                if getattr(k, 'key', k) in check_groups}
+        self.schema = schema.Schema(
+            config_schema_dict, ignore_extra_keys=bool(check_groups))
+        self.compiled_schema = compile_schema(
+            config_schema_dict, ignore_extra_keys=bool(check_groups))
+
+    def validate(self, config):
+        try:
+            return self.compiled_schema(config)
+        except Exception:
+            # Get exactly the same error as 'schema' library provides
+            return self.schema.validate(config)
+
+
+CONFIG_SCHEMA_DICT = build_config_schema_dict()
+CONFIG_VALIDATORS = {}
+
+
+def get_config_validator(check_groups=None):
+    check_groups_key = tuple(sorted(set(check_groups or [])))
+    if check_groups_key not in CONFIG_VALIDATORS:
+        CONFIG_VALIDATORS[check_groups_key] = ConfigValidator(check_groups)
+    return CONFIG_VALIDATORS[check_groups_key]
+
+
+def validate_config_structure(module, config):
     try:
-        validated_config = config_schema.validate(config)
+        validated_config = get_config_validator(
+            module.params["check_groups"]).validate(config)
     except schema.SchemaError as e:
         module.fail_json(msg=("Error: %s" % e))
-    return validated_config
+    # NOTE(vponomar): schema objects are shared between validations, so make
+    # sure validated config doesn't reference any of them.
+    return copy.deepcopy(validated_config)
+
+
+def get_child_resource_pool_name(vmware, group):
+    # NOTE(vponomar): 'vmware_guest' module searches resource pools by name
+    # in the whole datacenter, so make names of the child pools unique.
+    return "%s-%s" % (vmware["resource_pool"], group.replace("_", "-"))
+
+
+def get_child_resource_pools_plan(config):
+    if "vmware" not in config:
+        return {}
+    vmware = config["vmware"]
+    return {
+        get_child_resource_pool_name(vmware, group): (
+            vm_params["resource_pool_allocation"])
+        for group, vm_params in vmware["vm_parameters"].items()
+        if vm_params["resource_pool_allocation"] is not None
+    }
+
+
+def get_ocp_nodes_plan(config):
+    if "vmware" not in config:
+        return {}
+    vmware = config["vmware"]
+    templates = vmware["vm_templates"]
+    ocp_nodes = {}
+    for group in ("masters", "nodes", "glusterfs", "glusterfs_registry"):
+        vm_params = vmware["vm_parameters"][group]
+        disks = [{
+            "size_gb": size_gb,
+            "type": vm_params["system_disks_type"],
+            "kind": "system",
+            "datastore": vmware["datastore"],
+        } for size_gb in vm_params["system_disks_gb"]]
+        # NOTE(vponomar): storage disks are used only by Gluster nodes
+        if group.startswith("glusterfs"):
+            disks.extend({
+                "size_gb": size_gb,
+                "type": vm_params["storage_disks_type"],
+                "kind": "storage",
+                "datastore": vmware["datastore"],
+            } for size_gb in vm_params["storage_disks_gb"])
+        resource_pool = vmware["resource_pool"]
+        if vm_params["resource_pool_allocation"] is not None:
+            resource_pool = get_child_resource_pool_name(vmware, group)
+        for name in vm_params["names"]:
+            ocp_nodes[name] = {
+                "group": group,
+                "resource_pool": resource_pool,
+                "clone_mode": vm_params["clone_mode"],
+                "template": templates[len(ocp_nodes) % len(templates)],
+                "num_cpus": vm_params["num_cpus"],
+                "ram_mb": vm_params["ram_mb"],
+                "disks": [dict(disk) for disk in disks],
+            }
+    return ocp_nodes
+
+
+def get_config_cache_key(config_data, check_groups):
+    key_data = json.dumps({
+        "schema_version": CONFIG_SCHEMA_VERSION,
+        "check_groups": sorted(set(check_groups or [])),
+        "config_sha256": hashlib.sha256(config_data).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+
+def read_cached_config(cache_dir, cache_key):
+    cache_filepath = os.path.join(cache_dir, "%s.json" % cache_key)
+    try:
+        with open(cache_filepath, 'r') as cache_stream:
+            return json.load(cache_stream)
+    except (IOError, OSError, ValueError):
+        # Absent, unreadable or broken cache entry is just a cache miss
+        return None
+
+
+def write_cached_config(cache_dir, cache_key, config):
+    # NOTE(vponomar): config contains vCenter credentials, so make cache
+    # readable only by owner and write it atomically to let parallel runs
+    # never read partially written entries.
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, 0o700)
+    fd, tmp_filepath = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as cache_stream:
+            json.dump(config, cache_stream)
+        os.rename(tmp_filepath, os.path.join(cache_dir, "%s.json" % cache_key))
+    except Exception:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
 
 
 def main():
     module_args = {
         "path": {"type": "str", "required": True},
         "check_groups": {"type": "list", "required": False},
+        "use_cache": {"type": "bool", "required": False, "default": True},
+        "cache_dir": {
+            "type": "path", "required": False,
+            "default": "~/.cache/dt_validate_vms_provisioning_config",
+        },
+    }
+    result = {
+        "config": "",
+        "cache_hit": False,
+        "config_sha256": "",
+        "ocp_nodes": {},
+        "child_resource_pools": {},
     }
-    result = {"config": ""}
     module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
     if module.check_mode:
         return result
@@ -374,19 +769,40 @@ def main():
     # Make sure file was provided, it exists and yaml-parsible
     if not (module.params['path'] and module.params['path'].strip()):
         module.fail_json(msg="Path for config file is not provided")
-    with open(module.params['path'], 'r') as config_stream:
+    with open(module.params['path'], 'rb') as config_stream:
+        config_data = config_stream.read()
+
+    # Reuse result of the previous validation of the same config if exists
+    cache_dir = os.path.expanduser(module.params['cache_dir'])
+    cache_key = get_config_cache_key(
+        config_data, module.params['check_groups'])
+    validated_config = None
+    if module.params['use_cache']:
+        validated_config = read_cached_config(cache_dir, cache_key)
+    result["cache_hit"] = validated_config is not None
+
+    if validated_config is None:
         try:
-            config = yaml.load(config_stream)
+            config = yaml.load(config_data)
         except yaml.YAMLError as e:
             module.fail_json(
                 msg=("Failed to parse '%s' file as yaml. "
                      "Got following error: %s") % (module.params['path'], e))
 
-    # Validate config structure after successful parsing of the file
-    validated_config = validate_config_structure(module, config)
+        # Validate config structure after successful parsing of the file
+        validated_config = validate_config_structure(module, config)
+        if module.params['use_cache']:
+            try:
+                write_cached_config(cache_dir, cache_key, validated_config)
+            except (IOError, OSError) as e:
+                module.warn("Failed to cache validated config: %s" % e)
 
     # Finish module execution
     result["config"] = validated_config
+    result["config_sha256"] = hashlib.sha256(config_data).hexdigest()
+    result["ocp_nodes"] = get_ocp_nodes_plan(validated_config)
+    result["child_resource_pools"] = get_child_resource_pools_plan(
+        validated_config)
     module.exit_json(**result)
 
 
@@ -54,14 +54,33 @@ options:
         description: Name of the cluster to add the host
         required: True
     folder:
-        description: Folder name to manage
-        required: True
+        description:
+            - Folder name to manage. Its last path segment is searched by name
+              in the whole inventory. Mutually exclusive with 'folders'.
+    folders:
+        description:
+            - List of folder paths relative to the VM folder of the datacenter.
+              Each path is walked segment by segment from the VM folder of the
+              datacenter and only missing tail of it gets created or the exact
+              folder gets removed. All the paths are processed using single
+              connection and single inventory snapshot. Empty list is a no-op.
+              Mutually exclusive with 'folder'.
     state:
         description: Add or remove the folder
         default: 'present'
         choices:
             - 'present'
             - 'absent'
+    session_cache_dir:
+        description:
+            - Directory where vCenter sessions are cached to be reused
+              by following runs of the 'dt_*' modules.
+        default: '~/.cache/dt_vmware_sessions'
+    session_ttl:
+        description:
+            - Time in seconds for which unused cached vCenter session is
+              considered to be alive. Set it to 0 to disable session caching.
+        default: 1200
 extends_documentation_fragment: vmware.documentation
 EXAMPLES =
 # Create a folder
@@ -74,14 +93,36 @@ EXAMPLES =
       cluster: cluster
       folder: folder
       state: present
+# Create folder per node group
+  - name: Add folders to vCenter
+    dt_vmware_folder:
+      hostname: vcsa_host
+      username: vcsa_user
+      password: vcsa_pass
+      datacenter: datacenter
+      cluster: cluster
+      folders:
+      - cluster/masters
+      - cluster/nodes
+      - cluster/glusterfs
+      state: present
 RETURN =
 instance:
     descripton: metadata about the new folder
     returned: always
     type: dict
     sample: None
+results:
+    description:
+        - Per-path results of the 'folders' processing. Each of them has
+          'path', 'changed', 'created' folder paths, 'time_sec' and
+          'failed' with 'msg' keys.
+    returned: when 'folders' is provided
+    type: list
 """
 
+import time
+
 try:
     from pyVmomi import vim, vmodl
     HAS_PYVMOMI = True
@@ -89,11 +130,11 @@ except ImportError:
     HAS_PYVMOMI = False
 
 from ansible.module_utils import basic  # noqa
-from ansible.module_utils.vmware import (  # noqa
-    connect_to_api,
-    vmware_argument_spec,
-    find_datacenter_by_name,
-    wait_for_task,
+from ansible.module_utils.vmware import wait_for_task  # noqa
+from ansible.module_utils.dt_vmware import (  # noqa
+    connect_to_api_with_session_cache,
+    dt_vmware_argument_spec,
+    VMwareObjectsSnapshot,
 )
 
 def find_cluster_by_name_datacenter(datacenter, cluster_name):
@@ -109,6 +150,7 @@ class VMwareFolder(object):
         self.datacenter = module.params['datacenter']
         self.cluster = module.params['cluster']
         self.folder = module.params['folder']
+        self.folders = module.params['folders']
         self.hostname = module.params['hostname']
         self.username = module.params['username']
         self.password = module.params['password']
@@ -120,11 +162,11 @@ class VMwareFolder(object):
         self.folder_name = None
         self.folder_expanded = None
         self.folder_full_path = []
-        self.content = connect_to_api(module)
+        self.content = connect_to_api_with_session_cache(module)
+        self.snapshot = None
 
     def find_host_by_cluster_datacenter(self):
-        self.dc_obj = find_datacenter_by_name(
-            self.content, self.datacenter)
+        self.dc_obj = self.get_obj([vim.Datacenter], self.datacenter)
         self.cluster_obj = find_cluster_by_name_datacenter(
             self.dc_obj, self.cluster)
 
@@ -142,18 +184,13 @@ class VMwareFolder(object):
         return fold_obj
 
     def get_obj(self, vimtype, name, return_all=False):
-        obj = []
-        container = self.content.viewManager.CreateContainerView(
-            self.content.rootFolder, vimtype, True)
-
-        for c in container.view:
-            if name in [c.name, c._GetMoId()]:
-                if return_all is False:
-                    return c
-                else:
-                    obj.append(c)
-
-        return obj if len(obj) > 0 else None
+        # NOTE(vponomar): read names of all the datacenters and folders
+        # only once, because reading them one by one is very slow
+        # on vCenters with big inventory.
+        if self.snapshot is None:
+            self.snapshot = VMwareObjectsSnapshot(
+                self.content, [vim.Datacenter, vim.Folder])
+        return self.snapshot.get(tuple(vimtype), name, return_all=return_all)
 
     def process_state(self):
         try:
@@ -196,8 +233,7 @@ class VMwareFolder(object):
     def state_add_folder(self):
         changed = True
 
-        self.dc_obj = find_datacenter_by_name(
-            self.content, self.datacenter)
+        self.dc_obj = self.get_obj([vim.Datacenter], self.datacenter)
         self.cluster_obj = find_cluster_by_name_datacenter(
             self.dc_obj, self.cluster)
         self.folder_expanded = self.folder.split("/")
@@ -206,15 +242,72 @@ class VMwareFolder(object):
             if not self.get_obj([vim.Folder], f):
                 if index == 0:
                     # First object gets created on the datacenter
-                    self.dc_obj.vmFolder.CreateFolder(name=f)
+                    parent_f = self.dc_obj.vmFolder
                 else:
                     parent_f = self.get_obj(
                         [vim.Folder], self.folder_expanded[index - 1])
-                    parent_f.CreateFolder(name=f)
+                self.snapshot.add(parent_f.CreateFolder(name=f), f, parent_f)
             index = index + 1
 
         self.module.exit_json(changed=changed)
 
+    def process_folders(self):
+        self.dc_obj = self.get_obj([vim.Datacenter], self.datacenter)
+        if self.dc_obj is None:
+            self.module.fail_json(
+                msg="Datacenter '%s' is not found" % self.datacenter)
+        vm_folder = self.dc_obj.vmFolder
+        results = []
+        for folder in self.folders:
+            start_time = time.time()
+            result = {"path": folder, "changed": False, "created": []}
+            try:
+                if self.state == 'present':
+                    self.add_folder_path(vm_folder, folder, result)
+                else:
+                    self.remove_folder_path(vm_folder, folder, result)
+            except vmodl.MethodFault as method_fault:
+                result.update(failed=True, msg=method_fault.msg)
+            except Exception as e:
+                result.update(failed=True, msg=str(e))
+            result["time_sec"] = round(time.time() - start_time, 3)
+            results.append(result)
+
+        changed = any(result["changed"] for result in results)
+        failed_paths = [r["path"] for r in results if r.get("failed")]
+        if failed_paths:
+            self.module.fail_json(
+                msg="Failed to process folders: %s" % ", ".join(failed_paths),
+                changed=changed, results=results)
+        self.module.exit_json(changed=changed, results=results)
+
+    def add_folder_path(self, parent_f, folder, result):
+        segments = [f for f in folder.split("/") if f]
+        for index, f in enumerate(segments):
+            folder_obj = self.snapshot.get_child(parent_f, f)
+            if folder_obj is None:
+                if self.module.check_mode:
+                    result["created"].extend(
+                        "/".join(segments[:i + 1])
+                        for i in range(index, len(segments)))
+                    result["changed"] = True
+                    return
+                folder_obj = parent_f.CreateFolder(name=f)
+                self.snapshot.add(folder_obj, f, parent_f)
+                result["created"].append("/".join(segments[:index + 1]))
+                result["changed"] = True
+            parent_f = folder_obj
+
+    def remove_folder_path(self, parent_f, folder, result):
+        for f in [f for f in folder.split("/") if f]:
+            parent_f = self.snapshot.get_child(parent_f, f)
+            if parent_f is None:
+                return
+        if not self.module.check_mode:
+            wait_for_task(parent_f.Destroy())
+            self.snapshot.remove(parent_f)
+        result["changed"] = True
+
     def check_folder_state(self):
         self.host_obj, self.cluster_obj = (
             self.find_host_by_cluster_datacenter())
@@ -223,14 +316,15 @@ class VMwareFolder(object):
 
 
 def main():
-    argument_spec = vmware_argument_spec()
+    argument_spec = dt_vmware_argument_spec()
     argument_spec.update({
         "hostname": {"required": True, "type": "str"},
         "username": {"required": True, "type": "str"},
         "password": {"required": True, "type": "str", "no_log": True},
         "datacenter": {"required": True, "type": "str"},
         "cluster": {"required": True, "type": "str"},
-        "folder": {"required": True, "type": "str"},
+        "folder": {"required": False, "type": "str"},
+        "folders": {"required": False, "type": "list"},
         "state": {
             "default": "present",
             "choices": ["present", "absent"],
@@ -239,13 +333,18 @@ def main():
     })
 
     module = basic.AnsibleModule(
-        argument_spec=argument_spec, supports_check_mode=True)
+        argument_spec=argument_spec, supports_check_mode=True,
+        mutually_exclusive=[["folder", "folders"]],
+        required_one_of=[["folder", "folders"]])
 
     if not HAS_PYVMOMI:
         module.fail_json(msg='pyvmomi is required for this module')
 
     vmware_folder = VMwareFolder(module)
-    vmware_folder.process_state()
+    if module.params['folders'] is not None:
+        vmware_folder.process_folders()
+    else:
+        vmware_folder.process_state()
 
 
 if __name__ == '__main__':
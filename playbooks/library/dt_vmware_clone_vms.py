@@ -0,0 +1,671 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_vmware_clone_vms
+
+short_description: clones lots of VMs from templates in parallel
+
+version_added: "2.4"
+
+description:
+    - "Clones all the VMs of the provisioning plan using single vCenter
+       session. Clone tasks are submitted with bounded concurrency and their
+       completion is tracked using 'WaitForUpdatesEx' calls of the property
+       collector instead of polling each of them."
+    - "Already existing VMs with the same names in the target folder are
+       left untouched."
+    - "Annotation of each created VM stores fingerprint of its plan, which
+       is used by the 'dt_vmware_reconcile_vms' module to find out changed
+       VMs."
+
+options:
+    datacenter:
+        description:
+            - Name of the datacenter where VMs are created.
+        required: true
+    folder:
+        description:
+            - Path of the folder relative to the VM folder of the datacenter
+              where VMs are created.
+        required: true
+    network:
+        description:
+            - Name of the network to be used by the first network adapter
+              of the VMs. IP addresses are assigned by DHCP.
+        required: true
+    vms:
+        description:
+            - Provisioning plan of the VMs the same as 'ocp_nodes' returned
+              by the 'dt_validate_vms_provisioning_config' module.
+              Keys are VM names and values are dicts with 'template',
+              'resource_pool', 'num_cpus', 'ram_mb', 'disks' and optional
+              'clone_mode' keys. Each of disks is dict with 'size_gb', 'type'
+              and 'datastore' keys. First disks of the list resize disks of
+              the template and the rest of them are added.
+            - "'clone_mode' may be 'full' (default), 'linked' or 'instant'.
+               Linked clones are created from the 'linked_clone_snapshot'
+               snapshot of the template and keep size of its disks.
+               Instant clones require source VM to be powered on, inherit
+               its network settings and get hostname via the
+               'guestinfo.hostname' variable. CPUs and RAM of the plan are
+               hot-added right after instant cloning if they differ from the
+               ones of the source VM, so they cannot be smaller than that
+               and require CPU and memory hot add enabled for it.
+               Extra disks are added in all the modes."
+            - "Instant clones get no guest customization, they resume with
+               the hostname, network state and DHCP lease of the source VM.
+               So guest OS of the source VM must run an agent, which, after
+               resuming in the clone, reads hostname from the
+               'guestinfo.hostname' variable using VMware Tools, sets it,
+               and renews machine ID and DHCP lease. That is why the
+               'dt_validate_vms_provisioning_config' module does not accept
+               the 'instant' mode yet."
+        required: true
+    linked_clone_snapshot:
+        description:
+            - Name of the template snapshot used for linked clones.
+              It gets created if absent.
+        required: false
+        default: dt-linked-clone-base
+    max_concurrent_tasks:
+        description:
+            - Maximum amount of clone tasks running in vCenter at once.
+        required: false
+        default: 8
+    timeout:
+        description:
+            - Time in seconds to wait for all the clone tasks to finish.
+        required: false
+        default: 3600
+    power_on:
+        description:
+            - Whether to power on VMs right after cloning or not.
+        required: false
+        default: true
+    session_cache_dir:
+        description:
+            - Directory where vCenter sessions are cached to be reused
+              by following runs of the 'dt_*' modules.
+        required: false
+        default: '~/.cache/dt_vmware_sessions'
+    session_ttl:
+        description:
+            - Time in seconds for which unused cached vCenter session is
+              considered to be alive. Set it to 0 to disable session caching.
+        required: false
+        default: 1200
+
+extends_documentation_fragment: vmware.documentation
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Create all the requested VMs
+  dt_vmware_clone_vms:
+    hostname: "{{ config.vmware.host }}"
+    username: "{{ config.vmware.username }}"
+    password: "{{ config.vmware.password }}"
+    validate_certs: False
+    datacenter: "{{ config.vmware.datacenter }}"
+    folder: "{{ config.vmware.folder }}"
+    network: "{{ config.vmware.vm_network }}"
+    vms: "{{ config_output.ocp_nodes }}"
+    max_concurrent_tasks: 8
+  register: vms_cloning
+'''
+
+RETURN = '''
+vms:
+    description:
+        - One record per each of the requested VMs sorted by VM names.
+          Each of them has 'name', 'group', 'template', 'changed', 'failed',
+          'msg', 'moid', 'uuid', 'instance_uuid', 'queued_sec' (time from
+          the start of the module till the submission of the clone task)
+          and 'time_sec' (duration of the clone task) keys.
+    returned: always
+    type: list
+created_snapshots:
+    description:
+        - List of '<template>/<snapshot>' snapshots created for linked clones.
+    returned: always
+    type: list
+'''
+
+import copy
+import re
+import time
+
+try:
+    from pyVmomi import vim, vmodl
+    HAS_PYVMOMI = True
+except ImportError:
+    HAS_PYVMOMI = False
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.vmware import wait_for_task
+from ansible.module_utils.dt_vmware import (
+    connect_to_api_with_session_cache,
+    dt_vmware_argument_spec,
+    get_datastore,
+    get_disk_spec,
+    get_vm_annotation,
+    retrieve_properties,
+    SCSI_CONTROLLER_UNIT_NUMBER,
+    SCSI_MAX_UNIT_NUMBER,
+    VMwareObjectsSnapshot,
+    VMwarePropertiesWatcher,
+)
+
+def get_nic_spec(nic_device, network):
+    nic_spec = vim.vm.device.VirtualDeviceSpec()
+    nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+    nic_spec.device = nic_device
+    if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
+        port_connection = vim.dvs.PortConnection()
+        port_connection.portgroupKey = network.key
+        port_connection.switchUuid = (
+            network.config.distributedVirtualSwitch.uuid)
+        nic_spec.device.backing = (
+            vim.vm.device.VirtualEthernetCard.
+            DistributedVirtualPortBackingInfo())
+        nic_spec.device.backing.port = port_connection
+    else:
+        nic_spec.device.backing = (
+            vim.vm.device.VirtualEthernetCard.NetworkBackingInfo())
+        nic_spec.device.backing.network = network
+        nic_spec.device.backing.deviceName = network.name
+    nic_spec.device.deviceInfo.summary = network.name
+    return nic_spec
+
+
+def get_customization_spec(vm_name):
+    identity = vim.vm.customization.LinuxPrep()
+    identity.hostName = vim.vm.customization.FixedName()
+    # Remove all the characters except alphanumeric and minus as RFC 952 says
+    identity.hostName.name = re.sub(r"[^a-zA-Z0-9\-]", "", vm_name)
+    adapter_mapping = vim.vm.customization.AdapterMapping()
+    adapter_mapping.adapter = vim.vm.customization.IPSettings()
+    adapter_mapping.adapter.ip = vim.vm.customization.DhcpIpGenerator()
+    customization_spec = vim.vm.customization.Specification()
+    customization_spec.nicSettingMap = [adapter_mapping]
+    customization_spec.globalIPSettings = (
+        vim.vm.customization.GlobalIPSettings())
+    customization_spec.identity = identity
+    return customization_spec
+
+
+class VMwareCloneVMs(object):
+    def __init__(self, module):
+        self.module = module
+        self.params = module.params
+        self.start_time = time.time()
+        self.content = connect_to_api_with_session_cache(module)
+        self.snapshot = VMwareObjectsSnapshot(self.content, [
+            vim.Datacenter, vim.Folder, vim.ResourcePool, vim.Datastore,
+            vim.Network, vim.VirtualMachine])
+        self.records = {}
+        self.vm_objs = {}
+        self.created_snapshots = []
+
+    def get_folder(self):
+        dc_obj = self.snapshot.get(vim.Datacenter, self.params['datacenter'])
+        if dc_obj is None:
+            self.module.fail_json(
+                msg="Datacenter '%s' is not found" % self.params['datacenter'])
+        folder_obj = dc_obj.vmFolder
+        for f in [f for f in self.params['folder'].split("/") if f]:
+            folder_obj = self.snapshot.get_child(folder_obj, f)
+            if folder_obj is None:
+                self.module.fail_json(
+                    msg="Folder '%s' is not found" % self.params['folder'])
+        return folder_obj
+
+    def get_templates(self, template_names):
+        templates = {}
+        for template_name in template_names:
+            template = self.snapshot.get(vim.VirtualMachine, template_name)
+            if template is None:
+                self.module.fail_json(
+                    msg="Template '%s' is not found" % template_name)
+            templates[template_name] = template
+        templates_props = retrieve_properties(
+            self.content, list(templates.values()), vim.VirtualMachine,
+            ["config.cpuHotAddEnabled", "config.hardware.device",
+             "config.hardware.memoryMB", "config.hardware.numCPU",
+             "config.memoryHotAddEnabled", "config.template", "snapshot",
+             "runtime.powerState"])
+        return {
+            template_name: dict(
+                templates_props.get(template._GetMoId(), {}),
+                obj=template, name=template_name)
+            for template_name, template in templates.items()
+        }
+
+    def get_linked_clone_snapshot(self, template, resource_pool):
+        """Find snapshot of a template for linked clones or create it."""
+        snapshot_name = self.params['linked_clone_snapshot']
+        snapshots = list(getattr(
+            template.get("snapshot"), "rootSnapshotList", None) or [])
+        while snapshots:
+            snapshot = snapshots.pop(0)
+            if snapshot.name == snapshot_name:
+                return snapshot.snapshot
+            snapshots.extend(snapshot.childSnapshotList or [])
+        if self.module.check_mode:
+            return None
+
+        # NOTE(vponomar): templates cannot be snapshotted, so turn template
+        # into VM for a while.
+        template_obj = template["obj"]
+        is_template = template.get("config.template")
+        if is_template:
+            template_obj.MarkAsVirtualMachine(pool=resource_pool)
+        try:
+            success, snapshot = wait_for_task(
+                template_obj.CreateSnapshot_Task(
+                    name=snapshot_name,
+                    description="Base of linked clones",
+                    memory=False, quiesce=False))
+        finally:
+            if is_template:
+                template_obj.MarkAsTemplate()
+        self.created_snapshots.append(
+            "%s/%s" % (template["name"], snapshot_name))
+        return snapshot
+
+    def get_devices_info(self, vm, template):
+        # NOTE(vponomar): device specs edit devices of the template in place,
+        # so use own copy of them per each VM.
+        devices = copy.deepcopy(template.get("config.hardware.device") or [])
+        scsi_controller = None
+        template_disks, template_nics, used_unit_numbers = [], [], set()
+        for device in devices:
+            if (scsi_controller is None and isinstance(
+                    device, vim.vm.device.VirtualSCSIController)):
+                scsi_controller = device
+            elif isinstance(device, vim.vm.device.VirtualDisk):
+                template_disks.append(device)
+            elif isinstance(device, vim.vm.device.VirtualEthernetCard):
+                template_nics.append(device)
+        if scsi_controller is None:
+            raise ValueError(
+                "Template '%s' has no SCSI controller" % vm["template"])
+        if len(vm["disks"]) < len(template_disks):
+            raise ValueError(
+                "Template '%s' has more disks than requested (%d vs %d)" % (
+                    vm["template"], len(template_disks), len(vm["disks"])))
+        if not template_nics:
+            raise ValueError(
+                "Template '%s' has no network adapters" % vm["template"])
+        for device in devices:
+            if getattr(device, "controllerKey", None) == scsi_controller.key:
+                used_unit_numbers.add(device.unitNumber)
+        used_unit_numbers.add(SCSI_CONTROLLER_UNIT_NUMBER)
+        free_unit_numbers = [
+            i for i in range(SCSI_MAX_UNIT_NUMBER + 1)
+            if i not in used_unit_numbers]
+        return scsi_controller, template_disks, template_nics, (
+            free_unit_numbers)
+
+    def get_disks_changes(self, vm_name, vm, template, edit_template_disks):
+        """Calculate device specs and locators of the disks of a VM.
+
+        Disks of the template are resized and relocated only if
+        'edit_template_disks' is true, the rest of disks are added.
+        """
+        disks = vm["disks"]
+        if not disks:
+            raise ValueError("At least one disk must be defined")
+        scsi_controller, template_disks, template_nics, free_unit_numbers = (
+            self.get_devices_info(vm, template))
+        device_specs, disk_locators = [], []
+        for index, disk in enumerate(disks):
+            disk_device = None
+            if index < len(template_disks):
+                if not edit_template_disks:
+                    continue
+                disk_device = template_disks[index]
+                if disk["datastore"] != disks[0]["datastore"]:
+                    disk_locators.append(vim.vm.RelocateSpec.DiskLocator(
+                        diskId=disk_device.key,
+                        datastore=get_datastore(
+                            self.snapshot, disk["datastore"])))
+            elif not free_unit_numbers:
+                raise ValueError(
+                    "Too many disks are requested for the '%s' VM" % vm_name)
+            device_specs.append(get_disk_spec(
+                disk, disk_device, scsi_controller,
+                None if disk_device else free_unit_numbers.pop(0),
+                self.snapshot))
+        return device_specs, disk_locators, template_nics
+
+    def get_relocate_spec(self, vm):
+        relocate_spec = vim.vm.RelocateSpec()
+        relocate_spec.datastore = get_datastore(
+            self.snapshot, vm["disks"][0]["datastore"])
+        relocate_spec.pool = self.snapshot.get(
+            vim.ResourcePool, vm["resource_pool"])
+        if relocate_spec.pool is None:
+            raise ValueError(
+                "Resource pool '%s' is not found" % vm["resource_pool"])
+        return relocate_spec
+
+    def get_clone_spec(self, vm_name, vm, template, network, snapshot=None):
+        """Calculate spec of the full clone or linked one from 'snapshot'.
+
+        Child disks of linked clones cannot be extended, so they keep size
+        of the template disks.
+        """
+        device_specs, disk_locators, template_nics = self.get_disks_changes(
+            vm_name, vm, template, edit_template_disks=snapshot is None)
+        config_spec = vim.vm.ConfigSpec()
+        config_spec.numCPUs = int(vm["num_cpus"])
+        config_spec.memoryMB = int(vm["ram_mb"])
+        config_spec.annotation = get_vm_annotation(vm_name, vm)
+        config_spec.deviceChange = [
+            get_nic_spec(template_nics[0], network)] + device_specs
+        relocate_spec = self.get_relocate_spec(vm)
+        relocate_spec.disk = disk_locators
+        clone_spec = vim.vm.CloneSpec(
+            template=False, powerOn=self.params['power_on'],
+            location=relocate_spec, config=config_spec,
+            customization=get_customization_spec(vm_name))
+        if snapshot is not None:
+            relocate_spec.diskMoveType = (
+                vim.vm.RelocateSpec.DiskMoveOptions.createNewChildDiskBacking)
+            clone_spec.snapshot = snapshot
+        return clone_spec
+
+    def get_instant_clone_specs(self, vm_name, vm, template, folder_obj):
+        """Calculate spec of the instant clone and spec of its reconfiguration.
+
+        Instant clones share memory and disks of the running source VM, so
+        CPU, RAM and network settings are inherited from it. Extra disks are
+        hot-added and CPU and RAM differing from the source VM are set after
+        cloning, so they require hot add enabled for the source VM.
+        Hostname is passed to the guest OS using the 'guestinfo.hostname'
+        variable.
+        """
+        if template.get("runtime.powerState") != (
+                vim.VirtualMachinePowerState.poweredOn):
+            raise ValueError(
+                "Source VM '%s' of instant clones must be powered on" % (
+                    vm["template"]))
+        device_specs, disk_locators, template_nics = self.get_disks_changes(
+            vm_name, vm, template, edit_template_disks=False)
+        relocate_spec = self.get_relocate_spec(vm)
+        relocate_spec.folder = folder_obj
+        instant_clone_spec = vim.vm.InstantCloneSpec(
+            name=vm_name, location=relocate_spec,
+            config=[vim.option.OptionValue(
+                key="guestinfo.hostname", value=vm_name)])
+        config_spec = vim.vm.ConfigSpec()
+        config_spec.annotation = get_vm_annotation(vm_name, vm)
+        config_spec.deviceChange = device_specs
+        # NOTE(vponomar): fingerprint in the annotation describes planned
+        # CPU and RAM, so the clone must get them, not the ones of the source.
+        for key, spec_key, template_key, hot_add_key, title in (
+                ("num_cpus", "numCPUs", "config.hardware.numCPU",
+                 "config.cpuHotAddEnabled", "CPUs"),
+                ("ram_mb", "memoryMB", "config.hardware.memoryMB",
+                 "config.memoryHotAddEnabled", "RAM")):
+            wanted, actual = int(vm[key]), template.get(template_key)
+            if actual is not None and wanted < actual:
+                raise ValueError(
+                    "%s of the instant clone cannot be reduced from %s of "
+                    "the source VM '%s' to %s" % (
+                        title, actual, vm["template"], wanted))
+            if wanted == actual:
+                continue
+            if not template.get(hot_add_key):
+                raise ValueError(
+                    "%s hot add is disabled for the source VM '%s', so %s of "
+                    "the instant clone cannot be changed from %s to %s" % (
+                        title, vm["template"], title, actual, wanted))
+            setattr(config_spec, spec_key, wanted)
+        return instant_clone_spec, config_spec
+
+    def get_clone_task_args(self, vm_name, vm, templates, network, folder_obj):
+        """Return method submitting clone task and spec of reconfiguration."""
+        template = templates[vm["template"]]
+        clone_mode = vm.get("clone_mode") or "full"
+        if clone_mode == "instant":
+            instant_clone_spec, config_spec = self.get_instant_clone_specs(
+                vm_name, vm, template, folder_obj)
+            return (lambda: template["obj"].InstantClone_Task(
+                spec=instant_clone_spec)), config_spec
+
+        snapshot = None
+        if clone_mode == "linked":
+            snapshot_key = (vm["template"], "snapshot")
+            if snapshot_key not in templates:
+                templates[snapshot_key] = self.get_linked_clone_snapshot(
+                    template, self.get_relocate_spec(vm).pool)
+            snapshot = templates[snapshot_key]
+        clone_spec = self.get_clone_spec(
+            vm_name, vm, template, network, snapshot=snapshot)
+        return (lambda: template["obj"].CloneVM_Task(
+            folder=folder_obj, name=vm_name, spec=clone_spec)), None
+
+    def add_record(self, vm_name, vm, **kwargs):
+        record = {
+            "name": vm_name,
+            "group": vm.get("group"),
+            "template": vm.get("template"),
+            "changed": False,
+            "failed": False,
+            "msg": "",
+            "moid": None,
+            "uuid": None,
+            "instance_uuid": None,
+            "queued_sec": None,
+            "time_sec": None,
+        }
+        record.update(kwargs)
+        self.records[vm_name] = record
+        return record
+
+    def clone_vms(self):
+        vms = self.params['vms']
+        folder_obj = self.get_folder()
+        network = self.snapshot.get(vim.Network, self.params['network'])
+        if network is None:
+            self.module.fail_json(
+                msg="Network '%s' is not found" % self.params['network'])
+
+        # Prepare clone specs of all the VMs before submitting any clone task
+        clone_queue = []
+        new_vms = {}
+        for vm_name, vm in sorted(vms.items()):
+            vm_obj = self.snapshot.get_child(folder_obj, vm_name)
+            if vm_obj is not None:
+                self.add_record(vm_name, vm, msg="VM already exists")
+                self.vm_objs[vm_name] = vm_obj
+            else:
+                new_vms[vm_name] = vm
+        templates = self.get_templates(
+            set(vm["template"] for vm in new_vms.values()))
+        for vm_name, vm in sorted(new_vms.items()):
+            try:
+                submit_clone_task, config_spec = self.get_clone_task_args(
+                    vm_name, vm, templates, network, folder_obj)
+            except vmodl.MethodFault as e:
+                self.add_record(vm_name, vm, failed=True, msg=e.msg)
+                continue
+            except Exception as e:
+                self.add_record(vm_name, vm, failed=True, msg=str(e))
+                continue
+            self.add_record(vm_name, vm, changed=True)
+            clone_queue.append((vm_name, submit_clone_task, config_spec))
+
+        if self.module.check_mode or not clone_queue:
+            return
+        self.run_clone_tasks(clone_queue)
+
+    def run_clone_tasks(self, clone_queue):
+        max_concurrent_tasks = max(1, self.params['max_concurrent_tasks'])
+        deadline = self.start_time + self.params['timeout']
+        running_tasks = {}
+        # NOTE(vponomar): updates are partial, so state, error and result
+        # of a task may come in different updates. Keep all of them.
+        tasks_props = {}
+        watcher = VMwarePropertiesWatcher(
+            self.content, vim.Task,
+            ["info.state", "info.error", "info.result"])
+        try:
+            while clone_queue or running_tasks:
+                while (clone_queue and
+                       len(running_tasks) < max_concurrent_tasks):
+                    vm_name, submit_clone_task, config_spec = (
+                        clone_queue.pop(0))
+                    record = self.records[vm_name]
+                    record["queued_sec"] = round(
+                        time.time() - self.start_time, 3)
+                    try:
+                        task = submit_clone_task()
+                    except vmodl.MethodFault as e:
+                        record.update(failed=True, changed=False, msg=e.msg)
+                        continue
+                    except Exception as e:
+                        record.update(failed=True, changed=False, msg=str(e))
+                        continue
+                    watcher.add(task)
+                    running_tasks[task._GetMoId()] = (
+                        task, vm_name, time.time(), config_spec)
+
+                if not running_tasks:
+                    continue
+                if time.time() >= deadline:
+                    msg = "Clone task is not finished in %s seconds" % (
+                        self.params['timeout'])
+                    for task, vm_name, _, _ in running_tasks.values():
+                        self.records[vm_name].update(failed=True, msg=msg)
+                    for vm_name, _, _ in clone_queue:
+                        self.records[vm_name].update(
+                            failed=True, changed=False,
+                            msg="Clone task is not submitted in %s "
+                                "seconds" % self.params['timeout'])
+                    break
+
+                changes = watcher.wait(min(60, deadline - time.time()))
+                for task_moid, task_changes in changes.items():
+                    if task_moid not in running_tasks:
+                        continue
+                    task_props = tasks_props.setdefault(task_moid, {})
+                    task_props.update(task_changes)
+                    state = task_props.get("info.state")
+                    if state not in (vim.TaskInfo.State.success,
+                                     vim.TaskInfo.State.error):
+                        continue
+                    task, vm_name, submit_time, config_spec = (
+                        running_tasks.pop(task_moid))
+                    tasks_props.pop(task_moid)
+                    watcher.remove(task)
+                    record = self.records[vm_name]
+                    record["time_sec"] = round(time.time() - submit_time, 3)
+                    try:
+                        task = self.process_finished_task(
+                            task, task_props, vm_name, config_spec, record)
+                    except vmodl.MethodFault as e:
+                        record.update(failed=True, msg=e.msg)
+                        continue
+                    except Exception as e:
+                        record.update(failed=True, msg=str(e))
+                        continue
+                    if task is not None:
+                        watcher.add(task)
+                        running_tasks[task._GetMoId()] = (
+                            task, vm_name, submit_time, None)
+        finally:
+            watcher.destroy()
+
+    def process_finished_task(self, task, task_props, vm_name, config_spec,
+                              record):
+        """Update record of the VM using finished clone or reconfigure task.
+
+        Returns reconfigure task if it is required after cloning.
+        """
+        # Reconfigure tasks are run only for VMs which are cloned already
+        is_cloned = vm_name in self.vm_objs
+        if task_props["info.state"] != vim.TaskInfo.State.success:
+            error = task_props.get("info.error") or task.info.error
+            record.update(
+                failed=True, changed=is_cloned,
+                msg=getattr(error, "msg", None) or str(error))
+            return None
+        if is_cloned:
+            return None
+        self.vm_objs[vm_name] = (
+            task_props.get("info.result") or task.info.result)
+        if config_spec is None:
+            return None
+        # Reconfigure VM right after cloning if required
+        return self.vm_objs[vm_name].ReconfigVM_Task(spec=config_spec)
+
+    def read_vms_ids(self):
+        vm_names = {vm_obj._GetMoId(): vm_name
+                    for vm_name, vm_obj in self.vm_objs.items()}
+        vms_props = retrieve_properties(
+            self.content, list(self.vm_objs.values()), vim.VirtualMachine,
+            ["config.uuid", "config.instanceUuid"])
+        for vm_moid, vm_props in vms_props.items():
+            self.records[vm_names[vm_moid]].update(
+                moid=vm_moid,
+                uuid=vm_props.get("config.uuid"),
+                instance_uuid=vm_props.get("config.instanceUuid"))
+
+    def process(self):
+        try:
+            self.clone_vms()
+            self.read_vms_ids()
+        except vmodl.MethodFault as method_fault:
+            self.module.fail_json(msg=method_fault.msg)
+
+        records = [self.records[vm_name] for vm_name in sorted(self.records)]
+        result = {
+            "changed": bool(self.created_snapshots) or any(
+                record["changed"] for record in records),
+            "vms": records,
+            "created_snapshots": self.created_snapshots,
+        }
+        failed_vms = [record["name"] for record in records if record["failed"]]
+        if failed_vms:
+            self.module.fail_json(
+                msg="Failed to create VMs: %s" % ", ".join(failed_vms),
+                **result)
+        self.module.exit_json(**result)
+
+
+def main():
+    argument_spec = dt_vmware_argument_spec()
+    argument_spec.update({
+        "datacenter": {"type": "str", "required": True},
+        "folder": {"type": "str", "required": True},
+        "network": {"type": "str", "required": True},
+        "vms": {"type": "dict", "required": True},
+        "max_concurrent_tasks": {"type": "int", "default": 8},
+        "timeout": {"type": "int", "default": 3600},
+        "power_on": {"type": "bool", "default": True},
+        "linked_clone_snapshot": {
+            "type": "str", "default": "dt-linked-clone-base",
+        },
+    })
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True)
+    if not HAS_PYVMOMI:
+        module.fail_json(msg='pyvmomi is required for this module')
+
+    VMwareCloneVMs(module).process()
+
+
+if __name__ == '__main__':
+    main()
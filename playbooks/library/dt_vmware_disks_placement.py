@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_vmware_disks_placement
+
+short_description: places disks of the VMs on datastores
+
+version_added: "2.4"
+
+description:
+    - "Calculates datastores for all the disks of the VMs from the nodes
+       provisioning plan up front. Free space of all the datastores is read
+       using single API call and the placement is done in memory."
+    - "System disks of a VM are kept together on one datastore. Storage
+       disks of the Gluster nodes can be put on the datastores separate from
+       the system ones and each Gluster node gets datastore for its bricks
+       different from other Gluster nodes of the same group while possible."
+    - "If one of the 'templates' is located on the datastore selected for
+       system disks of a VM, then it is used for cloning of the VM to avoid
+       copying of disks between datastores."
+
+options:
+    vms:
+        description:
+            - Provisioning plan of the VMs the same as 'ocp_nodes' returned
+              by the 'dt_validate_vms_provisioning_config' module.
+        required: true
+    datastores:
+        description:
+            - Names of the datastores for system disks.
+        required: false
+        default: []
+    datastore_cluster:
+        description:
+            - Name of the datastore cluster, datastores of which are used
+              for system disks in addition to the 'datastores' ones.
+        required: false
+    storage_datastores:
+        description:
+            - Names of the datastores for storage disks of the Gluster nodes.
+              Datastores for system disks are used if not set.
+        required: false
+        default: []
+    policy:
+        description:
+            - "'free_space' puts disks on the datastores with the most of free
+               space left taking into account already placed disks.
+               'round_robin' just rotates datastores."
+        required: false
+        default: free_space
+        choices: ['free_space', 'round_robin']
+    separate_gluster_bricks:
+        description:
+            - Whether to put storage disks of each Gluster node on a datastore
+              not used by other Gluster nodes of the same group or not.
+        required: false
+        default: true
+    templates:
+        description:
+            - Names of the templates which can be used for cloning of any VM.
+              Template located on the datastore of the system disks of a VM
+              is preferred.
+        required: false
+        default: []
+    session_cache_dir:
+        description:
+            - Directory where vCenter sessions are cached to be reused
+              by following runs of the 'dt_*' modules.
+        required: false
+        default: '~/.cache/dt_vmware_sessions'
+    session_ttl:
+        description:
+            - Time in seconds for which unused cached vCenter session is
+              considered to be alive. Set it to 0 to disable session caching.
+        required: false
+        default: 1200
+
+extends_documentation_fragment: vmware.documentation
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Place disks of the VMs on datastores
+  dt_vmware_disks_placement:
+    hostname: "{{ config.vmware.host }}"
+    username: "{{ config.vmware.username }}"
+    password: "{{ config.vmware.password }}"
+    validate_certs: False
+    vms: "{{ config_output.ocp_nodes }}"
+    datastores: ['ds1', 'ds2']
+    storage_datastores: ['ssd-ds1', 'ssd-ds2', 'ssd-ds3']
+    templates: "{{ config.vmware.vm_templates }}"
+  register: disks_placement
+'''
+
+RETURN = '''
+vms:
+    description:
+        - Provisioning plan of the VMs with updated 'datastore' of each disk
+          and 'template' of each VM.
+    type: dict
+datastores:
+    description:
+        - Usage of the datastores. Keys are names of the datastores and
+          values are dicts with 'free_space_gb', 'planned_gb' and 'disks'
+          keys.
+    type: dict
+'''
+
+try:
+    from pyVmomi import vim
+    HAS_PYVMOMI = True
+except ImportError:
+    HAS_PYVMOMI = False
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dt_vmware import (
+    connect_to_api_with_session_cache,
+    dt_vmware_argument_spec,
+    retrieve_properties,
+    VMwareObjectsSnapshot,
+)
+
+GB = 1024 ** 3
+NODE_GROUPS_ORDER = ("masters", "nodes", "glusterfs", "glusterfs_registry")
+
+
+class DatastoresSelector(object):
+    def __init__(self, datastores, free_space, policy):
+        self.datastores = list(datastores)
+        self.free_space = free_space
+        self.policy = policy
+        self.counter = 0
+
+    def select(self, size_bytes, exclude=()):
+        candidates = [
+            ds for ds in self.datastores if ds not in exclude
+        ] or self.datastores
+        if self.policy == "round_robin":
+            datastore = candidates[self.counter % len(candidates)]
+            self.counter += 1
+        else:
+            # On equal free space prefer the datastore listed first
+            datastore = max(candidates, key=lambda ds: (
+                self.free_space[ds], -self.datastores.index(ds)))
+        self.free_space[datastore] -= size_bytes
+        return datastore
+
+
+def get_disks_placement(vms, system_datastores, storage_datastores,
+                        free_space, policy="free_space",
+                        separate_gluster_bricks=True,
+                        templates_datastores=None):
+    """Calculate datastores of all the disks of the VMs.
+
+    'free_space' is dict with free space of the datastores in bytes,
+    it gets decreased by sizes of the placed disks. 'templates_datastores'
+    is dict where keys are template names and values are lists of names of
+    datastores they are located on.
+    """
+    free_space = dict(free_space)
+    system_selector = DatastoresSelector(
+        system_datastores, free_space, policy)
+    storage_selector = DatastoresSelector(
+        storage_datastores or system_datastores, free_space, policy)
+    templates_datastores = templates_datastores or {}
+    bricks_datastores = {}
+    placement = {}
+
+    # Place VMs in stable order, so the same plan gets the same placement
+    vm_names = sorted(vms, key=lambda vm_name: (
+        NODE_GROUPS_ORDER.index(vms[vm_name]["group"])
+        if vms[vm_name]["group"] in NODE_GROUPS_ORDER
+        else len(NODE_GROUPS_ORDER),
+        vm_name))
+    for vm_name in vm_names:
+        vm = dict(vms[vm_name])
+        vm["disks"] = [dict(disk) for disk in vm["disks"]]
+        system_disks = [
+            disk for disk in vm["disks"] if disk.get("kind") != "storage"]
+        storage_disks = [
+            disk for disk in vm["disks"] if disk.get("kind") == "storage"]
+
+        system_datastore = system_selector.select(
+            sum(disk["size_gb"] for disk in system_disks) * GB)
+        for disk in system_disks:
+            disk["datastore"] = system_datastore
+
+        if storage_disks and separate_gluster_bricks:
+            used_datastores = bricks_datastores.setdefault(vm["group"], [])
+            if len(used_datastores) >= len(storage_selector.datastores):
+                # All the datastores are used, so start new round
+                del used_datastores[:]
+            bricks_datastore = storage_selector.select(
+                sum(disk["size_gb"] for disk in storage_disks) * GB,
+                exclude=used_datastores)
+            used_datastores.append(bricks_datastore)
+            for disk in storage_disks:
+                disk["datastore"] = bricks_datastore
+        else:
+            for disk in storage_disks:
+                disk["datastore"] = storage_selector.select(
+                    disk["size_gb"] * GB)
+
+        local_templates = sorted(
+            template for template, datastores in templates_datastores.items()
+            if system_datastore in datastores)
+        if local_templates and vm["template"] not in local_templates:
+            vm["template"] = local_templates[
+                len(placement) % len(local_templates)]
+        placement[vm_name] = vm
+    return placement, free_space
+
+
+class VMwareDisksPlacement(object):
+    def __init__(self, module):
+        self.module = module
+        self.params = module.params
+        self.content = connect_to_api_with_session_cache(module)
+        self.snapshot = VMwareObjectsSnapshot(self.content, [
+            vim.Datastore, vim.StoragePod, vim.VirtualMachine])
+
+    def get_datastores(self, names, datastore_cluster=None):
+        datastores = []
+        for name in names:
+            datastore = self.snapshot.get(vim.Datastore, name)
+            if datastore is None:
+                self.module.fail_json(msg="Datastore '%s' is not found" % name)
+            datastores.append(datastore)
+        if datastore_cluster:
+            pod = self.snapshot.get(vim.StoragePod, datastore_cluster)
+            if pod is None:
+                self.module.fail_json(
+                    msg="Datastore cluster '%s' is not found" % (
+                        datastore_cluster))
+            datastores.extend(
+                obj for obj in self.snapshot.objects
+                if isinstance(obj, vim.Datastore) and
+                self.snapshot.get_parent(obj) == pod and
+                obj not in datastores)
+        return datastores
+
+    def process(self):
+        system_datastores = self.get_datastores(
+            self.params['datastores'], self.params['datastore_cluster'])
+        storage_datastores = self.get_datastores(
+            self.params['storage_datastores'])
+        if not system_datastores:
+            self.module.fail_json(
+                msg="Either 'datastores' or 'datastore_cluster' must be set")
+
+        datastores_props = retrieve_properties(
+            self.content, system_datastores + storage_datastores,
+            vim.Datastore, ["name", "summary.freeSpace", "summary.accessible"])
+        names = {}
+        free_space = {}
+        for ds_moid, ds_props in datastores_props.items():
+            if not ds_props.get("summary.accessible"):
+                self.module.warn(
+                    "Datastore '%s' is not accessible" % ds_props["name"])
+                continue
+            names[ds_moid] = ds_props["name"]
+            free_space[ds_props["name"]] = ds_props["summary.freeSpace"]
+        system_datastore_names = [
+            names[ds._GetMoId()] for ds in system_datastores
+            if ds._GetMoId() in names]
+        storage_datastore_names = [
+            names[ds._GetMoId()] for ds in storage_datastores
+            if ds._GetMoId() in names]
+        if not system_datastore_names:
+            self.module.fail_json(msg="No accessible datastores found")
+
+        templates_datastores = {}
+        templates = [
+            self.snapshot.get(vim.VirtualMachine, template)
+            for template in self.params['templates']]
+        templates_props = retrieve_properties(
+            self.content, [t for t in templates if t is not None],
+            vim.VirtualMachine, ["name", "datastore"])
+        for template_props in templates_props.values():
+            templates_datastores[template_props["name"]] = [
+                names.get(ds._GetMoId())
+                for ds in template_props.get("datastore") or []]
+
+        vms, free_space_left = get_disks_placement(
+            self.params['vms'], system_datastore_names,
+            storage_datastore_names, free_space,
+            policy=self.params['policy'],
+            separate_gluster_bricks=self.params['separate_gluster_bricks'],
+            templates_datastores=templates_datastores)
+
+        datastores = {}
+        for name in free_space:
+            datastores[name] = {
+                "free_space_gb": round(float(free_space[name]) / GB, 1),
+                "planned_gb": round(
+                    float(free_space[name] - free_space_left[name]) / GB, 1),
+                "disks": 0,
+            }
+        for vm in vms.values():
+            for disk in vm["disks"]:
+                datastores[disk["datastore"]]["disks"] += 1
+        for name in sorted(datastores):
+            if free_space_left[name] < 0:
+                self.module.warn(
+                    "Planned disks exceed free space of the '%s' datastore "
+                    "by %s Gb. Thin disks may fit, thick ones will not." % (
+                        name, round(float(-free_space_left[name]) / GB, 1)))
+        self.module.exit_json(changed=False, vms=vms, datastores=datastores)
+
+
+def main():
+    argument_spec = dt_vmware_argument_spec()
+    argument_spec.update({
+        "vms": {"type": "dict", "required": True},
+        "datastores": {"type": "list", "default": []},
+        "datastore_cluster": {"type": "str", "required": False},
+        "storage_datastores": {"type": "list", "default": []},
+        "policy": {
+            "type": "str", "default": "free_space",
+            "choices": ["free_space", "round_robin"],
+        },
+        "separate_gluster_bricks": {"type": "bool", "default": True},
+        "templates": {"type": "list", "default": []},
+    })
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True)
+    if not HAS_PYVMOMI:
+        module.fail_json(msg='pyvmomi is required for this module')
+
+    VMwareDisksPlacement(module).process()
+
+
+if __name__ == '__main__':
+    main()
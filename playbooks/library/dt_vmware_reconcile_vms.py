@@ -0,0 +1,529 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_vmware_reconcile_vms
+
+short_description: applies changes of the provisioning plan to existing VMs
+
+version_added: "2.4"
+
+description:
+    - "Takes single snapshot of the VMs in the target folder and compares
+       their CPUs, RAM and disks with the provisioning plan and the
+       fingerprint of the plan stored in their annotations. VMs are left
+       untouched only if both of them match, so manual changes of the
+       hardware are detected as well."
+    - "Calculates minimal set of actions: VMs to be created, CPUs and RAM
+       to be hot-added, disks to be added or extended and, optionally,
+       VMs to be deleted. Creation of VMs is left to the
+       'dt_vmware_clone_vms' module, all the other actions are applied by
+       this module unless it runs in check mode."
+    - "Existing planned VMs which are not powered on are powered on after
+       the other changes are applied to them."
+    - "Changes which cannot be applied in place, like reducing of CPUs,
+       RAM or disks or hot-adding of CPUs to running VM with disabled CPU
+       hot add, are reported as 'blocked' and not applied."
+    - "Only VMs with fingerprint in their annotation, which means created by
+       the 'dt_vmware_clone_vms' module, may be deleted."
+
+options:
+    datacenter:
+        description:
+            - Name of the datacenter where VMs are located.
+        required: true
+    folder:
+        description:
+            - Path of the folder relative to the VM folder of the datacenter
+              where VMs are located.
+        required: true
+    vms:
+        description:
+            - Provisioning plan of the VMs the same as 'ocp_nodes' returned
+              by the 'dt_validate_vms_provisioning_config' module.
+        required: true
+    delete_absent:
+        description:
+            - Whether to delete VMs of the folder absent in the plan or not.
+        required: false
+        default: false
+    max_concurrent_tasks:
+        description:
+            - Maximum amount of reconfigure and delete tasks running in
+              vCenter at once.
+        required: false
+        default: 8
+    timeout:
+        description:
+            - Time in seconds to wait for all the tasks to finish.
+        required: false
+        default: 1800
+    session_cache_dir:
+        description:
+            - Directory where vCenter sessions are cached to be reused
+              by following runs of the 'dt_*' modules.
+        required: false
+        default: '~/.cache/dt_vmware_sessions'
+    session_ttl:
+        description:
+            - Time in seconds for which unused cached vCenter session is
+              considered to be alive. Set it to 0 to disable session caching.
+        required: false
+        default: 1200
+
+extends_documentation_fragment: vmware.documentation
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Apply changes of the provisioning plan to the existing VMs
+  dt_vmware_reconcile_vms:
+    hostname: "{{ config.vmware.host }}"
+    username: "{{ config.vmware.username }}"
+    password: "{{ config.vmware.password }}"
+    validate_certs: False
+    datacenter: "{{ config.vmware.datacenter }}"
+    folder: "{{ config.vmware.folder }}"
+    vms: "{{ ocp_nodes }}"
+    delete_absent: no
+  register: vms_reconciling
+
+- name: Create only absent VMs
+  dt_vmware_clone_vms:
+    hostname: "{{ config.vmware.host }}"
+    username: "{{ config.vmware.username }}"
+    password: "{{ config.vmware.password }}"
+    validate_certs: False
+    datacenter: "{{ config.vmware.datacenter }}"
+    folder: "{{ config.vmware.folder }}"
+    network: "{{ config.vmware.vm_network }}"
+    vms: "{{ vms_reconciling.vms_to_create }}"
+  when: "vms_reconciling.vms_to_create"
+'''
+
+RETURN = '''
+actions:
+    description:
+        - One record per each of the planned VMs and VMs of the folder
+          absent in the plan sorted by VM names. Each of them has 'name',
+          'action', 'changes', 'failed', 'msg' and 'time_sec' keys.
+          Action is one of 'none', 'create', 'reconfigure', 'annotate'
+          (only fingerprint is updated), 'power_on' (VM is only powered
+          on), 'blocked', 'delete' and 'keep' (VM is absent in the plan,
+          but deletion is not requested). Powering on of the reconfigured
+          or annotated VMs is reported as 'power on' in their changes.
+    returned: always
+    type: list
+vms_to_create:
+    description:
+        - Part of the provisioning plan with VMs to be created.
+    returned: always
+    type: dict
+vms:
+    description:
+        - Records of the existing planned VMs in format of the records
+          returned by the 'dt_vmware_clone_vms' module.
+    returned: always
+    type: list
+'''
+
+import time
+
+try:
+    from pyVmomi import vim, vmodl
+    HAS_PYVMOMI = True
+except ImportError:
+    HAS_PYVMOMI = False
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dt_vmware import (
+    connect_to_api_with_session_cache,
+    dt_vmware_argument_spec,
+    get_disk_spec,
+    get_vm_annotation,
+    get_vm_fingerprint,
+    parse_vm_fingerprint,
+    retrieve_properties,
+    SCSI_CONTROLLER_UNIT_NUMBER,
+    SCSI_MAX_UNIT_NUMBER,
+    VMwareObjectsSnapshot,
+    VMwarePropertiesWatcher,
+)
+
+VM_PROPERTIES = [
+    "config.annotation", "config.cpuHotAddEnabled", "config.hardware.device",
+    "config.hardware.memoryMB", "config.hardware.numCPU",
+    "config.instanceUuid", "config.memoryHotAddEnabled", "config.template",
+    "config.uuid", "runtime.powerState",
+]
+
+
+def get_vm_changes(vm, current):
+    """Compare VM plan with the current state of the VM.
+
+    'current' is dict with 'num_cpus', 'ram_mb', 'disks_kb' (sizes of the
+    disks ordered by controllers and unit numbers), 'cpu_hot_add',
+    'memory_hot_add' and 'powered_on' keys.
+    Returns dict of changes which can be applied in place and list of the
+    reasons why VM cannot be updated in place.
+    """
+    changes, blockers = {}, []
+    for key, hot_add_key, title in (("num_cpus", "cpu_hot_add", "CPUs"),
+                                    ("ram_mb", "memory_hot_add", "RAM")):
+        wanted, actual = int(vm[key]), current[key]
+        if wanted < actual:
+            blockers.append("%s cannot be reduced from %s to %s" % (
+                title, actual, wanted))
+        elif wanted > actual:
+            if current["powered_on"] and not current[hot_add_key]:
+                blockers.append(
+                    "%s hot add is disabled for the running VM" % title)
+            else:
+                changes[key] = wanted
+
+    # NOTE(vponomar): linked and instant clones keep size of the template
+    # disks, so only absent disks are added to them.
+    resize_disks = (vm.get("clone_mode") or "full") == "full"
+    for index, disk in enumerate(vm["disks"]):
+        wanted_kb = int(disk["size_gb"]) * 1024 * 1024
+        if index >= len(current["disks_kb"]):
+            changes.setdefault("add_disks", []).append(disk)
+        elif resize_disks and wanted_kb > current["disks_kb"][index]:
+            changes.setdefault("extend_disks", {})[index] = wanted_kb
+        elif resize_disks and wanted_kb < current["disks_kb"][index]:
+            blockers.append("Disk #%d cannot be reduced" % index)
+    if len(current["disks_kb"]) > len(vm["disks"]):
+        blockers.append("VM has %d disks, but %d are requested" % (
+            len(current["disks_kb"]), len(vm["disks"])))
+    return changes, blockers
+
+
+def describe_changes(changes):
+    descriptions = []
+    if "num_cpus" in changes:
+        descriptions.append("set %s CPUs" % changes["num_cpus"])
+    if "ram_mb" in changes:
+        descriptions.append("set %s Mb of RAM" % changes["ram_mb"])
+    for index, capacity_kb in sorted(changes.get("extend_disks", {}).items()):
+        descriptions.append("extend disk #%d to %d Gb" % (
+            index, capacity_kb // (1024 * 1024)))
+    for disk in changes.get("add_disks", []):
+        descriptions.append("add %s Gb disk" % disk["size_gb"])
+    return descriptions
+
+
+def get_sorted_disks(devices):
+    return sorted(
+        [device for device in devices
+         if isinstance(device, vim.vm.device.VirtualDisk)],
+        key=lambda device: (device.controllerKey, device.unitNumber))
+
+
+class VMwareReconcileVMs(object):
+    def __init__(self, module):
+        self.module = module
+        self.params = module.params
+        self.start_time = time.time()
+        self.content = connect_to_api_with_session_cache(module)
+        self.snapshot = VMwareObjectsSnapshot(self.content, [
+            vim.Datacenter, vim.Folder, vim.Datastore, vim.VirtualMachine])
+        self.actions = {}
+        self.vm_records = {}
+        self.vms_to_create = {}
+
+    def get_folder(self):
+        dc_obj = self.snapshot.get(vim.Datacenter, self.params['datacenter'])
+        if dc_obj is None:
+            self.module.fail_json(
+                msg="Datacenter '%s' is not found" % self.params['datacenter'])
+        folder_obj = dc_obj.vmFolder
+        for f in [f for f in self.params['folder'].split("/") if f]:
+            folder_obj = self.snapshot.get_child(folder_obj, f)
+            if folder_obj is None:
+                self.module.fail_json(
+                    msg="Folder '%s' is not found" % self.params['folder'])
+        return folder_obj
+
+    def get_folder_vms(self, folder_obj):
+        """Return VMs of the folder and their properties keyed by names."""
+        vm_objs = self.snapshot.get_children(folder_obj, vim.VirtualMachine)
+        vms_props = retrieve_properties(
+            self.content, list(vm_objs.values()), vim.VirtualMachine,
+            VM_PROPERTIES)
+        folder_vms = {}
+        for vm_name, vm_obj in vm_objs.items():
+            props = vms_props.get(vm_obj._GetMoId())
+            if props is None or props.get("config.template"):
+                continue
+            folder_vms[vm_name] = dict(props, obj=vm_obj)
+        return folder_vms
+
+    def add_action(self, vm_name, action, **kwargs):
+        record = {
+            "name": vm_name,
+            "action": action,
+            "changes": [],
+            "failed": False,
+            "msg": "",
+            "time_sec": None,
+        }
+        record.update(kwargs)
+        self.actions[vm_name] = record
+        return record
+
+    def add_vm_record(self, vm_name, vm, props, changed):
+        self.vm_records[vm_name] = {
+            "name": vm_name,
+            "group": vm.get("group"),
+            "template": vm.get("template"),
+            "changed": changed,
+            "failed": False,
+            "msg": "VM already exists",
+            "moid": props["obj"]._GetMoId(),
+            "uuid": props.get("config.uuid"),
+            "instance_uuid": props.get("config.instanceUuid"),
+            "queued_sec": None,
+            "time_sec": None,
+        }
+
+    def get_reconfig_spec(self, vm_name, vm, props, changes):
+        config_spec = vim.vm.ConfigSpec()
+        config_spec.annotation = get_vm_annotation(vm_name, vm)
+        if "num_cpus" in changes:
+            config_spec.numCPUs = changes["num_cpus"]
+        if "ram_mb" in changes:
+            config_spec.memoryMB = changes["ram_mb"]
+        devices = props.get("config.hardware.device") or []
+        disks = get_sorted_disks(devices)
+        device_specs = []
+        for index, capacity_kb in sorted(
+                changes.get("extend_disks", {}).items()):
+            disk_spec = vim.vm.device.VirtualDeviceSpec()
+            disk_spec.operation = (
+                vim.vm.device.VirtualDeviceSpec.Operation.edit)
+            disk_spec.device = disks[index]
+            disk_spec.device.capacityInKB = capacity_kb
+            device_specs.append(disk_spec)
+        if changes.get("add_disks"):
+            scsi_controller = [
+                device for device in devices if isinstance(
+                    device, vim.vm.device.VirtualSCSIController)][0]
+            used_unit_numbers = set([SCSI_CONTROLLER_UNIT_NUMBER] + [
+                device.unitNumber for device in devices
+                if getattr(device, "controllerKey", None) == (
+                    scsi_controller.key)])
+            free_unit_numbers = [
+                i for i in range(SCSI_MAX_UNIT_NUMBER + 1)
+                if i not in used_unit_numbers]
+            if len(free_unit_numbers) < len(changes["add_disks"]):
+                raise ValueError(
+                    "Too many disks are requested for the '%s' VM" % vm_name)
+            for disk in changes["add_disks"]:
+                device_specs.append(get_disk_spec(
+                    disk, None, scsi_controller, free_unit_numbers.pop(0),
+                    self.snapshot))
+        config_spec.deviceChange = device_specs
+        return config_spec
+
+    def plan(self):
+        """Calculate actions and return chains of tasks to be run."""
+        folder_vms = self.get_folder_vms(self.get_folder())
+        task_chains = {}
+        for vm_name, vm in sorted(self.params['vms'].items()):
+            props = folder_vms.get(vm_name)
+            if props is None:
+                self.add_action(vm_name, "create")
+                self.vms_to_create[vm_name] = vm
+                continue
+            powered_on = props.get("runtime.powerState") == (
+                vim.VirtualMachinePowerState.poweredOn)
+            changes, blockers = get_vm_changes(vm, {
+                "num_cpus": props.get("config.hardware.numCPU"),
+                "ram_mb": props.get("config.hardware.memoryMB"),
+                "disks_kb": [disk.capacityInKB for disk in get_sorted_disks(
+                    props.get("config.hardware.device") or [])],
+                "cpu_hot_add": props.get("config.cpuHotAddEnabled"),
+                "memory_hot_add": props.get("config.memoryHotAddEnabled"),
+                "powered_on": powered_on,
+            })
+            if blockers:
+                self.add_action(
+                    vm_name, "blocked", changes=describe_changes(changes),
+                    msg="; ".join(blockers))
+                self.add_vm_record(vm_name, vm, props, changed=False)
+                continue
+            vm_obj, chain = props["obj"], []
+            fingerprint = parse_vm_fingerprint(props.get("config.annotation"))
+            if not changes and fingerprint == get_vm_fingerprint(vm):
+                action = "none" if powered_on else "power_on"
+            else:
+                try:
+                    config_spec = self.get_reconfig_spec(
+                        vm_name, vm, props, changes)
+                except ValueError as e:
+                    self.add_action(vm_name, "blocked", msg=str(e))
+                    self.add_vm_record(vm_name, vm, props, changed=False)
+                    continue
+                action = "reconfigure" if changes else "annotate"
+                chain.append(lambda vm_obj=vm_obj, spec=config_spec: (
+                    vm_obj.ReconfigVM_Task(spec=spec)))
+            descriptions = describe_changes(changes)
+            # NOTE(vponomar): VMs may be powered off manually or by the
+            # previous failed run, so power them on like 'vmware_guest'
+            # with 'poweredon' state did it before.
+            if not powered_on:
+                descriptions.append("power on")
+                chain.append(lambda vm_obj=vm_obj: vm_obj.PowerOnVM_Task())
+            self.add_action(vm_name, action, changes=descriptions)
+            self.add_vm_record(vm_name, vm, props, changed=bool(chain))
+            if chain:
+                task_chains[vm_name] = chain
+
+        for vm_name, props in sorted(folder_vms.items()):
+            if vm_name in self.params['vms'] or not parse_vm_fingerprint(
+                    props.get("config.annotation")):
+                continue
+            if not self.params['delete_absent']:
+                self.add_action(vm_name, "keep", msg="VM is absent in plan")
+                continue
+            self.add_action(vm_name, "delete")
+            vm_obj, task_chains[vm_name] = props["obj"], []
+            if props.get("runtime.powerState") != (
+                    vim.VirtualMachinePowerState.poweredOff):
+                task_chains[vm_name].append(
+                    lambda vm_obj=vm_obj: vm_obj.PowerOffVM_Task())
+            task_chains[vm_name].append(
+                lambda vm_obj=vm_obj: vm_obj.Destroy_Task())
+        return task_chains
+
+    def run_tasks(self, task_chains):
+        """Run tasks of each chain one by one and chains in parallel.
+
+        'task_chains' is dict where keys are VM names and values are lists
+        of callables submitting vCenter tasks.
+        """
+        max_concurrent_tasks = max(1, self.params['max_concurrent_tasks'])
+        deadline = self.start_time + self.params['timeout']
+        queue = sorted(task_chains.items())
+        running_tasks, tasks_props = {}, {}
+        watcher = VMwarePropertiesWatcher(
+            self.content, vim.Task, ["info.state", "info.error"])
+
+        def submit(vm_name, chain, submit_time):
+            try:
+                task = chain.pop(0)()
+            except vmodl.MethodFault as e:
+                self.actions[vm_name].update(failed=True, msg=e.msg)
+                return
+            except Exception as e:
+                self.actions[vm_name].update(failed=True, msg=str(e))
+                return
+            watcher.add(task)
+            running_tasks[task._GetMoId()] = (
+                task, vm_name, chain, submit_time)
+
+        try:
+            while queue or running_tasks:
+                while queue and len(running_tasks) < max_concurrent_tasks:
+                    vm_name, chain = queue.pop(0)
+                    submit(vm_name, chain, time.time())
+                if not running_tasks:
+                    continue
+                if time.time() >= deadline:
+                    for _, vm_name, _, _ in running_tasks.values():
+                        self.actions[vm_name].update(
+                            failed=True,
+                            msg="Task is not finished in %s seconds" % (
+                                self.params['timeout']))
+                    for vm_name, _ in queue:
+                        self.actions[vm_name].update(
+                            failed=True,
+                            msg="Task is not submitted in %s seconds" % (
+                                self.params['timeout']))
+                    break
+
+                changes = watcher.wait(min(60, deadline - time.time()))
+                for task_moid, task_changes in changes.items():
+                    if task_moid not in running_tasks:
+                        continue
+                    # NOTE(vponomar): updates are partial, so state and
+                    # error of a task may come in different updates.
+                    task_props = tasks_props.setdefault(task_moid, {})
+                    task_props.update(task_changes)
+                    state = task_props.get("info.state")
+                    if state not in (vim.TaskInfo.State.success,
+                                     vim.TaskInfo.State.error):
+                        continue
+                    task, vm_name, chain, submit_time = running_tasks.pop(
+                        task_moid)
+                    tasks_props.pop(task_moid)
+                    watcher.remove(task)
+                    record = self.actions[vm_name]
+                    record["time_sec"] = round(time.time() - submit_time, 3)
+                    if state == vim.TaskInfo.State.error:
+                        error = task_props.get("info.error") or (
+                            task.info.error)
+                        record.update(
+                            failed=True,
+                            msg=getattr(error, "msg", None) or str(error))
+                    elif chain:
+                        submit(vm_name, chain, submit_time)
+        finally:
+            watcher.destroy()
+
+    def process(self):
+        try:
+            task_chains = self.plan()
+            if task_chains and not self.module.check_mode:
+                self.run_tasks(task_chains)
+        except vmodl.MethodFault as method_fault:
+            self.module.fail_json(msg=method_fault.msg)
+
+        actions = [self.actions[vm_name] for vm_name in sorted(self.actions)]
+        result = {
+            "changed": bool(task_chains),
+            "actions": actions,
+            "vms_to_create": self.vms_to_create,
+            "vms": [self.vm_records[vm_name]
+                    for vm_name in sorted(self.vm_records)],
+        }
+        failed_vms = [record["name"] for record in actions if record["failed"]]
+        if failed_vms:
+            self.module.fail_json(
+                msg="Failed to update VMs: %s" % ", ".join(failed_vms),
+                **result)
+        for record in actions:
+            if record["action"] == "blocked":
+                self.module.warn("VM '%s' cannot be updated in place: %s" % (
+                    record["name"], record["msg"]))
+        self.module.exit_json(**result)
+
+
+def main():
+    argument_spec = dt_vmware_argument_spec()
+    argument_spec.update({
+        "datacenter": {"type": "str", "required": True},
+        "folder": {"type": "str", "required": True},
+        "vms": {"type": "dict", "required": True},
+        "delete_absent": {"type": "bool", "default": False},
+        "max_concurrent_tasks": {"type": "int", "default": 8},
+        "timeout": {"type": "int", "default": 1800},
+    })
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True)
+    if not HAS_PYVMOMI:
+        module.fail_json(msg='pyvmomi is required for this module')
+
+    VMwareReconcileVMs(module).process()
+
+
+if __name__ == '__main__':
+    main()
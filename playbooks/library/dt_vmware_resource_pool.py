@@ -30,6 +30,11 @@ module: dt_vmware_resource_pool
 short_description: Add/remove resource pools to/from vCenter
 description:
     - This module can be used to add/remove a resource pool to/from vCenter
+    - CPU and memory allocations of existing resource pools are compared
+      with the requested ones and updated in place if they differ.
+      Only the 'cpu_*' and 'mem_*' options which are set are compared for
+      the 'resource_pool', so its omitted options keep values set by the
+      vCenter admins. New resource pools get defaults for omitted options.
 version_added: 2.3
 author: "Davis Phillips (@dav1x)"
 notes:
@@ -61,17 +66,17 @@ options:
             - In a resource pool with an expandable reservation,
               the reservation on a resource pool can grow beyond
               the specified value.
-        default: True
+        default: True for new resource pools
     cpu_reservation:
         description:
             - Amount of resource that is guaranteed available to
               the virtual machine or resource pool.
-        default: 0
+        default: 0 for new resource pools
     cpu_limit:
         description:
             - The utilization of a virtual machine/resource pool will not
               exceed this limit, even if there are available resources.
-        default: -1 (No limit)
+        default: -1 (No limit) for new resource pools
     cpu_shares:
         description: Memory shares are used in case of resource contention.
         choices:
@@ -79,23 +84,23 @@ options:
             - custom
             - low
             - normal
-        default: Normal
+        default: Normal for new resource pools
     mem_expandable_reservations:
         description:
             - In a resource pool with an expandable reservation,
               the reservation on a resource pool can grow beyond
               the specified value.
-        default: True
+        default: True for new resource pools
     mem_reservation:
         description:
             - Amount of resource that is guaranteed available to
               the virtual machine or resource pool.
-        default: 0
+        default: 0 for new resource pools
     mem_limit:
         description:
             - The utilization of a virtual machine/resource pool will not
               exceed this limit, even if there are available resources.
-        default: -1 (No limit)
+        default: -1 (No limit) for new resource pools
     mem_shares:
         description: Memory shares are used in case of resource contention.
         choices:
@@ -103,13 +108,30 @@ options:
             - custom
             - low
             - normal
-        default: Normal
+        default: Normal for new resource pools
+    child_resource_pools:
+        description:
+            - Dict of resource pools to be created inside of the
+              'resource_pool' one. Keys are names of the child pools and values
+              are dicts with any of the 'cpu_*' and 'mem_*' options.
+              Omitted options get their default values.
+        default: {}
     state:
         description: Add or remove the resource pool
         default: 'present'
         choices:
             - 'present'
             - 'absent'
+    session_cache_dir:
+        description:
+            - Directory where vCenter sessions are cached to be reused
+              by following runs of the 'dt_*' modules.
+        default: '~/.cache/dt_vmware_sessions'
+    session_ttl:
+        description:
+            - Time in seconds for which unused cached vCenter session is
+              considered to be alive. Set it to 0 to disable session caching.
+        default: 1200
 extends_documentation_fragment: vmware.documentation
 EXAMPLES =
 # Create a resource pool
@@ -130,12 +152,35 @@ EXAMPLES =
       cpu_reservation: 0
       cpu_expandable_reservations: True
       state: present
+# Create a resource pool with guaranteed resources for the storage nodes
+  - name: Add resource pools to vCenter
+    dt_vmware_resource_pool:
+      hostname: vcsa_host
+      username: vcsa_user
+      password: vcsa_pass
+      datacenter: datacenter
+      cluster: cluster
+      resource_pool: resource_pool
+      child_resource_pools:
+        resource_pool-glusterfs:
+          cpu_reservation: 8000
+          cpu_shares: high
+          mem_reservation: 65536
+          mem_shares: high
+      state: present
 RETURN =
 instance:
     descripton: metadata about the new resource pool
     returned: always
     type: dict
     sample: None
+resource_pools:
+    description:
+        - Results per each of the resource pools in case of 'present' state.
+          Each of them has 'name', 'created' and 'diff' keys, where 'diff'
+          maps names of changed options to their 'before' and 'after' values.
+    returned: on success
+    type: list
 """
 
 try:
@@ -145,14 +190,67 @@ except ImportError:
     HAS_PYVMOMI = False
 
 from ansible.module_utils import basic  # noqa
-from ansible.module_utils.vmware import (  # noqa
-    get_all_objs,
-    connect_to_api,
-    vmware_argument_spec,
-    find_datacenter_by_name,
-    wait_for_task,
+from ansible.module_utils.vmware import wait_for_task  # noqa
+from ansible.module_utils.dt_vmware import (  # noqa
+    connect_to_api_with_session_cache,
+    dt_vmware_argument_spec,
+    VMwareObjectsSnapshot,
 )
 
+RP_ALLOCATION_DEFAULTS = {
+    "cpu_expandable_reservations": True,
+    "cpu_reservation": 0,
+    "cpu_limit": -1,
+    "cpu_shares": "normal",
+    "mem_expandable_reservations": True,
+    "mem_reservation": 0,
+    "mem_limit": -1,
+    "mem_shares": "normal",
+}
+RP_SHARES_LEVELS = ("high", "custom", "normal", "low")
+
+
+def get_resource_config_spec(allocation):
+    rp_spec = vim.ResourceConfigSpec()
+    for alloc_attr, prefix in (("cpuAllocation", "cpu"),
+                               ("memoryAllocation", "mem")):
+        alloc = vim.ResourceAllocationInfo()
+        alloc.expandableReservation = allocation[
+            "%s_expandable_reservations" % prefix]
+        alloc.limit = int(allocation["%s_limit" % prefix])
+        alloc.reservation = int(allocation["%s_reservation" % prefix])
+        alloc_shares = vim.SharesInfo()
+        alloc_shares.level = allocation["%s_shares" % prefix]
+        alloc.shares = alloc_shares
+        setattr(rp_spec, alloc_attr, alloc)
+    return rp_spec
+
+
+def get_current_allocation(rp_config):
+    allocation = {}
+    for alloc_attr, prefix in (("cpuAllocation", "cpu"),
+                               ("memoryAllocation", "mem")):
+        current = getattr(rp_config, alloc_attr)
+        allocation.update({
+            "%s_expandable_reservations" % prefix: (
+                current.expandableReservation),
+            "%s_limit" % prefix: current.limit,
+            "%s_reservation" % prefix: current.reservation,
+            "%s_shares" % prefix: current.shares.level,
+        })
+    return allocation
+
+
+def get_allocation_diff(current_allocation, allocation):
+    """Compare only options present in the 'allocation' dict."""
+    diff = {}
+    for option, value in allocation.items():
+        if current_allocation[option] != value:
+            diff[option] = {
+                "before": current_allocation[option], "after": value}
+    return diff
+
+
 def find_cluster_by_name_datacenter(datacenter, cluster_name):
     for folder in datacenter.hostFolder.childEntity:
         if folder.name == cluster_name:
@@ -170,25 +268,20 @@ class VMwareResourcePool(object):
         self.username = module.params['username']
         self.password = module.params['password']
         self.state = module.params['state']
-        self.mem_shares = module.params['mem_shares']
-        self.mem_limit = module.params['mem_limit']
-        self.mem_reservation = module.params['mem_reservation']
-        self.mem_expandable_reservations = (
-            module.params['cpu_expandable_reservations'])
-        self.cpu_shares = module.params['cpu_shares']
-        self.cpu_limit = module.params['cpu_limit']
-        self.cpu_reservation = module.params['cpu_reservation']
-        self.cpu_expandable_reservations = (
-            module.params['cpu_expandable_reservations'])
+        self.allocation = {
+            option: module.params[option] for option in RP_ALLOCATION_DEFAULTS
+            if module.params[option] is not None}
+        self.child_resource_pools = module.params['child_resource_pools']
+        self.results = []
         self.dc_obj = None
         self.cluster_obj = None
         self.host_obj = None
         self.resource_pool_obj = None
-        self.content = connect_to_api(module)
+        self.content = connect_to_api_with_session_cache(module)
+        self.snapshot = None
 
     def find_host_by_cluster_datacenter(self):
-        self.dc_obj = find_datacenter_by_name(
-            self.content, self.datacenter)
+        self.dc_obj = self.get_obj([vim.Datacenter], self.datacenter)
         self.cluster_obj = find_cluster_by_name_datacenter(
             self.dc_obj, self.cluster)
 
@@ -199,32 +292,16 @@ class VMwareResourcePool(object):
         return None, self.cluster
 
     def select_resource_pool(self, host):
-        pool_obj = None
-
-        resource_pools = get_all_objs(self.content, [vim.ResourcePool])
-
-        pool_selections = self.get_obj(
-            [vim.ResourcePool], self.resource_pool, return_all=True)
-        if pool_selections:
-            for p in pool_selections:
-                if p in resource_pools:
-                    pool_obj = p
-                    break
-        return pool_obj
+        return self.get_obj([vim.ResourcePool], self.resource_pool)
 
     def get_obj(self, vimtype, name, return_all=False):
-        obj = []
-        container = self.content.viewManager.CreateContainerView(
-            self.content.rootFolder, vimtype, True)
-
-        for c in container.view:
-            if name in [c.name, c._GetMoId()]:
-                if return_all is False:
-                    return c
-                else:
-                    obj.append(c)
-
-        return obj if len(obj) > 0 else None
+        # NOTE(vponomar): read names of all the datacenters and resource pools
+        # only once, because reading them one by one is very slow
+        # on vCenters with big inventory.
+        if self.snapshot is None:
+            self.snapshot = VMwareObjectsSnapshot(
+                self.content, [vim.Datacenter, vim.ResourcePool])
+        return self.snapshot.get(tuple(vimtype), name, return_all=return_all)
 
     def process_state(self):
         try:
@@ -234,7 +311,7 @@ class VMwareResourcePool(object):
                     'absent': self.state_exit_unchanged,
                 },
                 'present': {
-                    'present': self.state_exit_unchanged,
+                    'present': self.state_update_rp,
                     'absent': self.state_add_rp,
                 }
             }
@@ -264,34 +341,55 @@ class VMwareResourcePool(object):
         self.module.exit_json(changed=changed, result=str(result))
 
     def state_add_rp(self):
-        changed = True
-
-        rp_spec = vim.ResourceConfigSpec()
-        cpu_alloc = vim.ResourceAllocationInfo()
-        cpu_alloc.expandableReservation = self.cpu_expandable_reservations
-        cpu_alloc.limit = int(self.cpu_limit)
-        cpu_alloc.reservation = int(self.cpu_reservation)
-        cpu_alloc_shares = vim.SharesInfo()
-        cpu_alloc_shares.level = self.cpu_shares
-        cpu_alloc.shares = cpu_alloc_shares
-        rp_spec.cpuAllocation = cpu_alloc
-        mem_alloc = vim.ResourceAllocationInfo()
-        mem_alloc.limit = int(self.mem_limit)
-        mem_alloc.expandableReservation = self.mem_expandable_reservations
-        mem_alloc.reservation = int(self.mem_reservation)
-        mem_alloc_shares = vim.SharesInfo()
-        mem_alloc_shares.level = self.mem_shares
-        mem_alloc.shares = mem_alloc_shares
-        rp_spec.memoryAllocation = mem_alloc
-
-        self.dc_obj = find_datacenter_by_name(
-            self.content, self.datacenter)
+        self.dc_obj = self.get_obj([vim.Datacenter], self.datacenter)
         self.cluster_obj = find_cluster_by_name_datacenter(
             self.dc_obj, self.cluster)
-        rootResourcePool = self.cluster_obj.resourcePool
-        rootResourcePool.CreateResourcePool(self.resource_pool, rp_spec)
-
-        self.module.exit_json(changed=changed)
+        allocation = dict(RP_ALLOCATION_DEFAULTS)
+        allocation.update(self.allocation)
+        self.resource_pool_obj = self.add_rp(
+            self.cluster_obj.resourcePool, self.resource_pool, allocation)
+        self.reconcile_child_rps()
+
+    def state_update_rp(self):
+        self.update_rp(
+            self.resource_pool_obj, self.resource_pool, self.allocation)
+        self.reconcile_child_rps()
+
+    def add_rp(self, parent_rp, name, allocation):
+        self.results.append({"name": name, "created": True, "diff": {}})
+        if self.module.check_mode:
+            return None
+        rp = parent_rp.CreateResourcePool(
+            name, get_resource_config_spec(allocation))
+        self.snapshot.add(rp, name, parent_rp)
+        return rp
+
+    def update_rp(self, rp, name, allocation):
+        current_allocation = get_current_allocation(rp.config)
+        diff = get_allocation_diff(current_allocation, allocation)
+        self.results.append({"name": name, "created": False, "diff": diff})
+        if diff and not self.module.check_mode:
+            current_allocation.update(allocation)
+            rp.UpdateConfig(
+                name=None, config=get_resource_config_spec(current_allocation))
+
+    def reconcile_child_rps(self):
+        for name, child_allocation in sorted(
+                self.child_resource_pools.items()):
+            allocation = dict(RP_ALLOCATION_DEFAULTS)
+            allocation.update(child_allocation or {})
+            child_rp = None
+            if self.resource_pool_obj is not None:
+                child_rp = self.snapshot.get_child(
+                    self.resource_pool_obj, name)
+            if child_rp is None:
+                self.add_rp(self.resource_pool_obj, name, allocation)
+            else:
+                self.update_rp(child_rp, name, allocation)
+
+        changed = any(
+            result["created"] or result["diff"] for result in self.results)
+        self.module.exit_json(changed=changed, resource_pools=self.results)
 
     def check_rp_state(self):
         self.host_obj, self.cluster_obj = (
@@ -301,7 +399,7 @@ class VMwareResourcePool(object):
 
 
 def main():
-    argument_spec = vmware_argument_spec()
+    argument_spec = dt_vmware_argument_spec()
     argument_spec.update({
         "hostname": {"required": True, "type": "str"},
         "username": {"required": True, "type": "str"},
@@ -309,20 +407,21 @@ def main():
         "datacenter": {"required": True, "type": "str"},
         "cluster": {"required": True, "type": "str"},
         "resource_pool": {"required": True, "type": "str"},
+        "child_resource_pools": {"type": "dict", "default": {}},
         "mem_shares": {
-            "type": "str", "default": "normal",
-            "choices": ["high", "custom", "normal", "low"],
+            "type": "str",
+            "choices": list(RP_SHARES_LEVELS),
         },
-        "mem_limit": {"type": "int", "default": "-1"},
-        "mem_reservation": {"type": "int", "default": "0"},
-        "mem_expandable_reservations": {"type": "bool", "default": "True"},
+        "mem_limit": {"type": "int"},
+        "mem_reservation": {"type": "int"},
+        "mem_expandable_reservations": {"type": "bool"},
         "cpu_shares": {
-            "type": "str", "default": "normal",
-            "choices": ["high", "custom", "normal", "low"]
+            "type": "str",
+            "choices": list(RP_SHARES_LEVELS),
         },
-        "cpu_limit": {"type": "int", "default": "-1"},
-        "cpu_reservation": {"type": "int", "default": "0"},
-        "cpu_expandable_reservations": {"type": "bool", "default": "True"},
+        "cpu_limit": {"type": "int"},
+        "cpu_reservation": {"type": "int"},
+        "cpu_expandable_reservations": {"type": "bool"},
         "state": {
             "default": "present",
             "choices": ["present", "absent"],
@@ -336,6 +435,25 @@ def main():
     if not HAS_PYVMOMI:
         module.fail_json(msg='pyvmomi is required for this module')
 
+    for name, child_allocation in module.params[
+            'child_resource_pools'].items():
+        unknown_options = set(child_allocation or {}) - set(
+            RP_ALLOCATION_DEFAULTS)
+        if unknown_options:
+            module.fail_json(
+                msg="Unknown options of the '%s' child resource pool: %s" % (
+                    name, ", ".join(sorted(unknown_options))))
+        for option in ("cpu_limit", "cpu_reservation",
+                       "mem_limit", "mem_reservation"):
+            if option in (child_allocation or {}):
+                child_allocation[option] = int(child_allocation[option])
+        for option in ("cpu_shares", "mem_shares"):
+            if (child_allocation or {}).get(
+                    option, "normal") not in RP_SHARES_LEVELS:
+                module.fail_json(
+                    msg="'%s' of the '%s' child resource pool must be one "
+                        "of: %s" % (option, name, ", ".join(RP_SHARES_LEVELS)))
+
     vmware_rp = VMwareResourcePool(module)
     vmware_rp.process_state()
 
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_vmware_wait_for_vms_ips
+
+short_description: waits for IPv4 addresses of lots of VMs at once
+
+version_added: "2.4"
+
+description:
+    - "Watches 'guest.toolsRunningStatus' and 'guest.net' properties of all
+       the requested VMs using single property collector and returns mapping
+       of VM names to their IPv4 addresses as soon as each of VMs has
+       running VMware tools and reports IPv4 address."
+
+options:
+    vms:
+        description:
+            - List of VMs to wait for. Each of them is dict with 'name' and
+              'moid' keys like records returned by the 'dt_vmware_clone_vms'
+              module. Failed records are ignored.
+        required: true
+    timeout:
+        description:
+            - Time in seconds to wait for all the VMs to report IPv4 address.
+        required: false
+        default: 900
+    session_cache_dir:
+        description:
+            - Directory where vCenter sessions are cached to be reused
+              by following runs of the 'dt_*' modules.
+        required: false
+        default: '~/.cache/dt_vmware_sessions'
+    session_ttl:
+        description:
+            - Time in seconds for which unused cached vCenter session is
+              considered to be alive. Set it to 0 to disable session caching.
+        required: false
+        default: 1200
+
+extends_documentation_fragment: vmware.documentation
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Wait for IP addresses of the newly created VMs
+  dt_vmware_wait_for_vms_ips:
+    hostname: "{{ config.vmware.host }}"
+    username: "{{ config.vmware.username }}"
+    password: "{{ config.vmware.password }}"
+    validate_certs: False
+    vms: "{{ vms_cloning.vms }}"
+  register: vms_ips
+'''
+
+RETURN = '''
+hostnames_ip_mapping:
+    description: Mapping of VM names to their IPv4 addresses.
+    returned: always
+    type: dict
+vms:
+    description:
+        - One record per each of VMs sorted by VM names. Each of them has
+          'name', 'ip', 'tools_running_status', 'timed_out' and 'time_sec'
+          (time till the VM has reported its IPv4 address) keys.
+    returned: always
+    type: list
+'''
+
+import re
+import time
+
+try:
+    from pyVmomi import vim
+    HAS_PYVMOMI = True
+except ImportError:
+    HAS_PYVMOMI = False
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dt_vmware import (
+    connect_to_api_with_session_cache,
+    dt_vmware_argument_spec,
+    VMwarePropertiesWatcher,
+)
+
+IPV4_REGEX = re.compile(r"^(\d{1,3})\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
+
+
+def get_ipv4_address(guest_nics):
+    for nic in guest_nics or []:
+        for ip in getattr(nic, "ipAddress", None) or []:
+            match = IPV4_REGEX.match(ip)
+            # Skip loopback and link-local addresses
+            if match and match.group(1) != "127" and not ip.startswith(
+                    "169.254."):
+                return ip
+    return None
+
+
+class VMwareWaitForVMsIPs(object):
+    def __init__(self, module):
+        self.module = module
+        self.params = module.params
+        self.start_time = time.time()
+        self.content = connect_to_api_with_session_cache(module)
+        self.records = {}
+
+    def wait_for_ips(self):
+        stub = self.content.propertyCollector._stub
+        vm_names = {}
+        for vm in self.params['vms']:
+            if vm.get("failed") or not vm.get("moid"):
+                continue
+            vm_names[vm["moid"]] = vm["name"]
+            self.records[vm["name"]] = {
+                "name": vm["name"],
+                "ip": None,
+                "tools_running_status": None,
+                "timed_out": False,
+                "time_sec": None,
+            }
+
+        deadline = self.start_time + self.params['timeout']
+        vms_props = {}
+        # NOTE(vponomar): IPs are usually added to the NICs already reported
+        # without them, so get whole 'guest.net' lists on each change.
+        watcher = VMwarePropertiesWatcher(
+            self.content, vim.VirtualMachine,
+            ["guest.toolsRunningStatus", "guest.net"], partial_updates=False)
+        try:
+            watcher.add(*[vim.VirtualMachine(vm_moid, stub)
+                          for vm_moid in vm_names])
+            waiting = set(vm_names)
+            while waiting and time.time() < deadline:
+                changes = watcher.wait(min(60, deadline - time.time()))
+                for vm_moid, vm_changes in changes.items():
+                    if vm_moid not in waiting:
+                        continue
+                    vm_props = vms_props.setdefault(vm_moid, {})
+                    vm_props.update(vm_changes)
+                    record = self.records[vm_names[vm_moid]]
+                    record["tools_running_status"] = vm_props.get(
+                        "guest.toolsRunningStatus")
+                    record["ip"] = get_ipv4_address(vm_props.get("guest.net"))
+                    if (record["ip"] and record["tools_running_status"] ==
+                            vim.vm.GuestInfo.ToolsRunningStatus.
+                            guestToolsRunning):
+                        record["time_sec"] = round(
+                            time.time() - self.start_time, 3)
+                        waiting.remove(vm_moid)
+                        watcher.remove(vim.VirtualMachine(vm_moid, stub))
+            for vm_moid in waiting:
+                self.records[vm_names[vm_moid]]["timed_out"] = True
+        finally:
+            watcher.destroy()
+
+    def process(self):
+        self.wait_for_ips()
+        records = [self.records[vm_name] for vm_name in sorted(self.records)]
+        result = {
+            "changed": False,
+            "hostnames_ip_mapping": {
+                record["name"]: record["ip"] for record in records
+                if not record["timed_out"]},
+            "vms": records,
+        }
+        timed_out_vms = [
+            record["name"] for record in records if record["timed_out"]]
+        if timed_out_vms:
+            self.module.fail_json(
+                msg="VMs have not reported IPv4 address in %s seconds: %s" % (
+                    self.params['timeout'], ", ".join(timed_out_vms)),
+                **result)
+        self.module.exit_json(**result)
+
+
+def main():
+    argument_spec = dt_vmware_argument_spec()
+    argument_spec.update({
+        "vms": {"type": "list", "required": True},
+        "timeout": {"type": "int", "default": 900},
+    })
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True)
+    if not HAS_PYVMOMI:
+        module.fail_json(msg='pyvmomi is required for this module')
+
+    VMwareWaitForVMsIPs(module).process()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_wait_for_ssh
+
+short_description: waits for lots of hosts to become reachable via SSH
+
+version_added: "2.4"
+
+description:
+    - "Probes all the hosts at the same time using pool of threads and
+       returns as soon as all of them are ready. Host is ready when its SSH
+       server sends SSH banner and, optionally, when the
+       'systemctl is-system-running' command reports one of 'ready_states'
+       and boot ID of the host differs from the 'previous_boot_ids' one."
+    - "Should be run on the same host as Ansible itself, so the same SSH
+       keys are used."
+
+options:
+    hosts:
+        description:
+            - List of hostnames or IP addresses to wait for.
+        required: true
+    port:
+        description:
+            - SSH port of the hosts.
+        required: false
+        default: 22
+    timeout:
+        description:
+            - Time in seconds to wait for all the hosts to become ready.
+        required: false
+        default: 420
+    connect_timeout:
+        description:
+            - Time in seconds to wait for each of connections to a host.
+        required: false
+        default: 5
+    probe_interval:
+        description:
+            - Time in seconds between probes of a host which is not ready yet.
+        required: false
+        default: 2
+    max_workers:
+        description:
+            - Amount of hosts probed at the same time.
+        required: false
+        default: 50
+    check_system_running:
+        description:
+            - Whether to wait for the 'systemctl is-system-running' command to
+              report one of 'ready_states' or not. Requires passwordless
+              SSH access to the hosts.
+        required: false
+        default: false
+    ready_states:
+        description:
+            - States of the system reported by 'systemctl is-system-running'
+              which are considered as ready ones.
+        required: false
+        default: ['running', 'degraded']
+    previous_boot_ids:
+        description:
+            - Dict with boot IDs of the hosts read before their reboot.
+              Host is not considered as ready until it reports other boot ID.
+              Useful to make sure that host has really been rebooted.
+        required: false
+        default: {}
+    read_boot_ids:
+        description:
+            - Whether to read boot IDs of the hosts or not. Requires
+              passwordless SSH access to the hosts. Boot IDs are read anyway
+              if 'previous_boot_ids' are provided.
+        required: false
+        default: false
+    ssh_user:
+        description:
+            - User used for running commands on the hosts.
+        required: false
+        default: root
+    ssh_private_key_file:
+        description:
+            - Private SSH key used for running commands on the hosts.
+        required: false
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Wait for SSH availability of newly provisioned VMs
+  dt_wait_for_ssh:
+    hosts: "{{ hostnames_ip_mapping.values() | list }}"
+    check_system_running: yes
+
+- name: Read boot IDs of the hosts before their reboot
+  dt_wait_for_ssh:
+    hosts: "{{ hostnames }}"
+    read_boot_ids: yes
+  register: before_reboot
+
+- name: Wait for hosts to be rebooted and started up
+  dt_wait_for_ssh:
+    hosts: "{{ hostnames }}"
+    check_system_running: yes
+    previous_boot_ids: "{{ before_reboot.boot_ids }}"
+'''
+
+RETURN = '''
+hosts:
+    description:
+        - One record per each of the hosts. Each of them has 'host', 'ready',
+          'time_sec' (time till host has become ready), 'attempts',
+          'system_state', 'boot_id' and 'msg' (last probe error) keys.
+    returned: always
+    type: list
+boot_ids:
+    description: Mapping of the hosts to their boot IDs, if they are read.
+    returned: always
+    type: dict
+'''
+
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dt_ssh import (
+    HostProbe,
+    run_in_threads,
+)
+
+
+def wait_for_hosts(params):
+    deadline = time.time() + params['timeout']
+    probes = [
+        HostProbe(host, params, deadline,
+                  previous_boot_id=params['previous_boot_ids'].get(host),
+                  read_boot_id=params['read_boot_ids'])
+        for host in sorted(set(params['hosts']))]
+    run_in_threads(lambda probe: probe.run(), probes, params['max_workers'])
+    return [probe.record for probe in probes]
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "hosts": {"type": "list", "required": True},
+            "port": {"type": "int", "default": 22},
+            "timeout": {"type": "int", "default": 420},
+            "connect_timeout": {"type": "int", "default": 5},
+            "probe_interval": {"type": "int", "default": 2},
+            "max_workers": {"type": "int", "default": 50},
+            "check_system_running": {"type": "bool", "default": False},
+            "ready_states": {
+                "type": "list", "default": ["running", "degraded"],
+            },
+            "previous_boot_ids": {"type": "dict", "default": {}},
+            "read_boot_ids": {"type": "bool", "default": False},
+            "ssh_user": {"type": "str", "default": "root"},
+            "ssh_private_key_file": {"type": "path", "required": False},
+        },
+        supports_check_mode=True,
+    )
+    if module.params['max_workers'] < 1:
+        module.fail_json(msg="'max_workers' must be positive")
+
+    records = wait_for_hosts(module.params)
+    result = {
+        "changed": False,
+        "hosts": records,
+        "boot_ids": {
+            record["host"]: record["boot_id"] for record in records
+            if record["boot_id"]},
+    }
+    not_ready_hosts = [
+        record["host"] for record in records if not record["ready"]]
+    if not_ready_hosts:
+        module.fail_json(
+            msg="Hosts are not ready in %s seconds: %s" % (
+                module.params['timeout'], ", ".join(not_ready_hosts)),
+            **result)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,14 +29,18 @@
 # pylint: disable=wrong-import-order,wrong-import-position,unused-import
 
 from __future__ import print_function  # noqa: F401
+import collections  # noqa: F401
 import copy  # noqa: F401
+import errno  # noqa: F401
 import fcntl  # noqa: F401
+import hashlib  # noqa: F401
 import json   # noqa: F401
 import os  # noqa: F401
 import re  # noqa: F401
 import shutil  # noqa: F401
 import tempfile  # noqa: F401
 import time  # noqa: F401
+import uuid  # noqa: F401
 
 try:
     import ruamel.yaml as yaml  # noqa: F401
@@ -162,6 +166,44 @@ options:
     required: false
     default: '.'
     aliases: []
+  lock_timeout:
+    description:
+    - Seconds to wait for the exclusive lock of the 'src' file. The lock is
+    - held by the 'present' and 'absent' states from reading the file till
+    - writing it, so concurrent processes do not lose updates of each other.
+    - The lock is taken on the file in the '~/.cache/dt_yedit' dir named
+    - after hash of the absolute 'src' path, so no files are left near 'src'.
+    required: false
+    default: 300
+    aliases: []
+  queue:
+    description:
+    - Put the edits to the queue dir kept near the lock file instead of
+    - applying them right away. The process which takes the lock applies all
+    - the queued edits as a single transaction and writes the file once, the
+    - others just wait till their edits are applied. Edits queued longer
+    - than 'lock_timeout' seconds are dropped, because their owners have
+    - failed already. Requires 'src' and the 'present' state.
+    required: false
+    default: false
+    aliases: []
+  stream:
+    description:
+    - Append the edits to the end of the 'src' yaml file as a fragment of
+    - its top-level mapping instead of loading and rewriting the whole file.
+    - Edits must set top-level keys. If some of the keys already exist, or
+    - the top-level keys cannot be found without loading the file, the file
+    - is rewritten as usual. Requires the 'present' state.
+    required: false
+    default: false
+    aliases: []
+  compact:
+    description:
+    - Load the 'src' file and rewrite it as a single document, folding the
+    - fragments appended in the 'stream' mode into its common formatting.
+    required: false
+    default: false
+    aliases: []
 author:
 - "Kenny Woodson <kwoodson@redhat.com>"
 extends_documentation_fragment: []
@@ -204,6 +246,28 @@ EXAMPLES = '''
 #   b:
 #     c:
 #       d: e
+# append new top-level section without rewriting the file
+- name: write big section
+  yedit:
+    src: somefile.yml
+    stream: true
+    edits:
+    - key: packages
+      value: "{{ packages.stdout_lines }}"
+# rewrite the file with the appended sections as a single document
+- name: compact file
+  yedit:
+    src: somefile.yml
+    compact: true
+# merge edits made from many hosts into one write
+- name: write data of the current host
+  delegate_to: localhost
+  yedit:
+    src: somefile.yml
+    queue: true
+    edits:
+    - key: "nodes#{{ inventory_hostname }}"
+      value: "{{ node_data }}"
 '''
 
 # -*- -*- -*- End included fragment: doc/yedit -*- -*- -*-
@@ -216,12 +280,87 @@ class YeditException(Exception):
     pass
 
 
+class YeditLock(object):
+    ''' Exclusive lock of a file shared between processes '''
+    sync_dir = '~/.cache/dt_yedit'
+
+    def __init__(self, filename, timeout=300, interval=0.05):
+        self.lock_filename = YeditLock.get_sync_path(filename, '.lock')
+        self.timeout = timeout
+        self.interval = interval
+        self._lock_fd = None
+
+    @staticmethod
+    def get_sync_path(filename, suffix):
+        '''return path of the file used to sync processes editing 'filename'
+
+           NOTE(vponomar): such files are kept out of the dir of 'filename',
+           so they do not mix up with the data files.
+        '''
+        sync_dir = os.path.expanduser(YeditLock.sync_dir)
+        try:
+            os.makedirs(sync_dir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        name = hashlib.sha1(
+            os.path.abspath(filename).encode('utf-8')).hexdigest()
+        return os.path.join(sync_dir, name + suffix)
+
+    def acquire(self, is_needless=None):
+        '''wait for the lock
+
+           Return False without taking the lock if 'is_needless' callable
+           returns True while waiting.
+        '''
+        lock_fd = open(self.lock_filename, 'a')
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._lock_fd = lock_fd
+                return True
+            except IOError as err:
+                if err.errno not in (errno.EAGAIN, errno.EACCES):
+                    lock_fd.close()
+                    raise
+            if is_needless is not None and is_needless():
+                lock_fd.close()
+                return False
+            if time.time() > deadline:
+                lock_fd.close()
+                raise YeditException(
+                    'Timed out after {} seconds waiting for the lock '
+                    'of {}'.format(self.timeout, self.lock_filename))
+            time.sleep(self.interval)
+
+    def release(self):
+        ''' release the lock '''
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            self._lock_fd.close()
+            self._lock_fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
 # pylint: disable=too-many-public-methods,too-many-instance-attributes
 class Yedit(object):
     ''' Class to modify yaml files '''
     re_valid_key = r"(((\[-?\d+\])|([0-9a-zA-Z%s/_-]+)).?)+$"
     re_key = r"(?:\[(-?\d+)\])|([0-9a-zA-Z{}/_-]+)"
     com_sep = set(['.', '#', '|', ':'])
+    # Compiled key patterns per separator and parsed keys, keys of the
+    # latter are (key, separator) tuples, values are parsed keys or None for
+    # invalid keys.
+    _key_patterns = {}
+    _parsed_keys = collections.OrderedDict()
+    parsed_keys_cache_size = 1024
 
     # pylint: disable=too-many-arguments
     def __init__(self,
@@ -237,6 +376,8 @@ class Yedit(object):
         self.__yaml_dict = content
         self.content_type = content_type
         self.backup = backup
+        self.__transaction_backup = None
+        self.__in_transaction = False
         if backup_ext is None:
             self.backup_ext = ".{}".format(time.strftime("%Y%m%dT%H%M%S"))
         else:
@@ -266,20 +407,74 @@ class Yedit(object):
         ''' setter method for yaml_dict '''
         self.__yaml_dict = value
 
+    @property
+    def in_transaction(self):
+        ''' whether edits are applied to the working copy of a transaction '''
+        return self.__in_transaction
+
+    @staticmethod
+    def copy_yaml(data):
+        ''' return deep copy of the yaml data keeping its format attributes '''
+        # deepcopy didn't work
+        # Try to use ruamel.yaml and fallback to pyyaml
+        try:
+            tmp_copy = yaml.load(yaml.round_trip_dump(data,
+                                                      default_flow_style=False),
+                                 yaml.RoundTripLoader)
+        except AttributeError:
+            tmp_copy = copy.deepcopy(data)
+
+        # set the format attributes if available
+        try:
+            tmp_copy.fa.set_block_style()
+        except AttributeError:
+            pass
+
+        return tmp_copy
+
+    @staticmethod
+    def get_key_patterns(sep='.'):
+        '''return compiled validation and parsing patterns for the separator'''
+        patterns = Yedit._key_patterns.get(sep)
+        if patterns is None:
+            common_separators = ''.join(sorted(Yedit.com_sep - set([sep])))
+            patterns = (
+                re.compile(Yedit.re_valid_key.format(common_separators)),
+                re.compile(Yedit.re_key.format(common_separators)))
+            Yedit._key_patterns[sep] = patterns
+        return patterns
+
+    @staticmethod
+    def _get_parsed_key(key, sep):
+        '''return cached tuple of the parsed key or None if it is invalid'''
+        cache_key = (key, sep)
+        try:
+            parsed_key = Yedit._parsed_keys.pop(cache_key)
+        except KeyError:
+            valid_key_re, key_re = Yedit.get_key_patterns(sep)
+            parsed_key = None
+            if valid_key_re.match(key):
+                parsed_key = tuple(key_re.findall(key))
+        if Yedit.parsed_keys_cache_size > 0:
+            # Least recently used keys are the first ones
+            while len(Yedit._parsed_keys) >= Yedit.parsed_keys_cache_size:
+                Yedit._parsed_keys.popitem(last=False)
+            Yedit._parsed_keys[cache_key] = parsed_key
+        return parsed_key
+
     @staticmethod
     def parse_key(key, sep='.'):
         '''parse the key allowing the appropriate separator'''
-        common_separators = list(Yedit.com_sep - set([sep]))
-        return re.findall(Yedit.re_key.format(''.join(common_separators)), key)
+        parsed_key = Yedit._get_parsed_key(key, sep)
+        if parsed_key is None:
+            # Invalid keys are parsed as is
+            return Yedit.get_key_patterns(sep)[1].findall(key)
+        return list(parsed_key)
 
     @staticmethod
     def valid_key(key, sep='.'):
         '''validate the incoming key'''
-        common_separators = list(Yedit.com_sep - set([sep]))
-        if not re.match(Yedit.re_valid_key.format(''.join(common_separators)), key):
-            return False
-
-        return True
+        return Yedit._get_parsed_key(key, sep) is not None
 
     # pylint: disable=too-many-return-statements,too-many-branches
     @staticmethod
@@ -312,11 +507,13 @@ class Yedit(object):
 
             return True
 
-        if not (key and Yedit.valid_key(key, sep)) and \
+        key_indexes = Yedit._get_parsed_key(key, sep)
+        if not (key and key_indexes is not None) and \
            isinstance(data, (list, dict)):
             return None
 
-        key_indexes = Yedit.parse_key(key, sep)
+        if key_indexes is None:
+            key_indexes = Yedit.parse_key(key, sep)
         for arr_ind, dict_key in key_indexes[:-1]:
             if dict_key and isinstance(data, dict):
                 data = data.get(dict_key)
@@ -346,13 +543,15 @@ class Yedit(object):
             key = a#b
             return c
         '''
+        key_indexes = Yedit._get_parsed_key(key, sep)
         if key == '':
             pass
-        elif (not (key and Yedit.valid_key(key, sep)) and
+        elif (not (key and key_indexes is not None) and
               isinstance(data, (list, dict))):
             return None
 
-        key_indexes = Yedit.parse_key(key, sep)
+        if key_indexes is None:
+            key_indexes = Yedit.parse_key(key, sep)
         for arr_ind, dict_key in key_indexes[:-1]:
             if dict_key:
                 if isinstance(data, dict) and dict_key in data and data[dict_key]:  # noqa: E501
@@ -399,13 +598,15 @@ class Yedit(object):
             key = a.b
             return c
         '''
+        key_indexes = Yedit._get_parsed_key(key, sep)
         if key == '':
             pass
-        elif (not (key and Yedit.valid_key(key, sep)) and
+        elif (not (key and key_indexes is not None) and
               isinstance(data, (list, dict))):
             return None
 
-        key_indexes = Yedit.parse_key(key, sep)
+        if key_indexes is None:
+            key_indexes = Yedit.parse_key(key, sep)
         for arr_ind, dict_key in key_indexes:
             if dict_key and isinstance(data, dict):
                 data = data.get(dict_key)
@@ -681,20 +882,12 @@ class Yedit(object):
         if entry == value:
             return (False, self.yaml_dict)
 
-        # deepcopy didn't work
-        # Try to use ruamel.yaml and fallback to pyyaml
-        try:
-            tmp_copy = yaml.load(yaml.round_trip_dump(self.yaml_dict,
-                                                      default_flow_style=False),
-                                 yaml.RoundTripLoader)
-        except AttributeError:
-            tmp_copy = copy.deepcopy(self.yaml_dict)
-
-        # set the format attributes if available
-        try:
-            tmp_copy.fa.set_block_style()
-        except AttributeError:
-            pass
+        # NOTE(vponomar): working copy of a transaction is copied only once
+        # in 'begin', it is discarded as a whole in case of a failed edit.
+        if self.in_transaction:
+            tmp_copy = self.yaml_dict
+        else:
+            tmp_copy = Yedit.copy_yaml(self.yaml_dict)
 
         result = Yedit.add_entry(tmp_copy, path, value, self.separator)
         if result is None:
@@ -717,20 +910,10 @@ class Yedit(object):
     def create(self, path, value):
         ''' create a yaml file '''
         if not self.file_exists():
-            # deepcopy didn't work
-            # Try to use ruamel.yaml and fallback to pyyaml
-            try:
-                tmp_copy = yaml.load(yaml.round_trip_dump(self.yaml_dict,
-                                                          default_flow_style=False),
-                                     yaml.RoundTripLoader)
-            except AttributeError:
-                tmp_copy = copy.deepcopy(self.yaml_dict)
-
-            # set the format attributes if available
-            try:
-                tmp_copy.fa.set_block_style()
-            except AttributeError:
-                pass
+            if self.in_transaction:
+                tmp_copy = self.yaml_dict
+            else:
+                tmp_copy = Yedit.copy_yaml(self.yaml_dict)
 
             result = Yedit.add_entry(tmp_copy, path, value, self.separator)
             if result is not None:
@@ -739,6 +922,37 @@ class Yedit(object):
 
         return (False, self.yaml_dict)
 
+    def begin(self):
+        ''' start transaction making single working copy of the document '''
+        if self.in_transaction:
+            raise YeditException('Transaction is already started.')
+        self.__transaction_backup = self.yaml_dict
+        self.yaml_dict = Yedit.copy_yaml(self.yaml_dict)
+        self.__in_transaction = True
+
+    def validate(self):
+        ''' check that the working copy can be written as a document '''
+        if not isinstance(self.yaml_dict, (dict, list)):
+            raise YeditException(
+                'Document root must be a dict or a list, got {}.'.format(
+                    type(self.yaml_dict)))
+
+    def commit(self):
+        ''' validate the working copy and make it the document '''
+        if not self.in_transaction:
+            raise YeditException('Transaction is not started.')
+        self.validate()
+        self.__transaction_backup = None
+        self.__in_transaction = False
+
+    def rollback(self):
+        ''' drop the working copy restoring the document '''
+        if not self.in_transaction:
+            raise YeditException('Transaction is not started.')
+        self.yaml_dict = self.__transaction_backup
+        self.__transaction_backup = None
+        self.__in_transaction = False
+
     @staticmethod
     def get_curr_value(invalue, val_type):
         '''return the current value'''
@@ -784,8 +998,25 @@ class Yedit(object):
 
     @staticmethod
     def process_edits(edits, yamlfile):
-        '''run through a list of edits and process them one-by-one'''
+        '''apply a list of edits as a single transaction
+
+           Document is copied once, all the edits are applied to the copy
+           which replaces the document only if all of them succeed.
+        '''
         results = []
+        yamlfile.begin()
+        try:
+            Yedit._process_edits(edits, yamlfile, results)
+            yamlfile.commit()
+        except Exception:
+            yamlfile.rollback()
+            raise
+
+        return {'changed': len(results) > 0, 'results': results}
+
+    @staticmethod
+    def _process_edits(edits, yamlfile, results):
+        '''run through a list of edits and process them one-by-one'''
         for edit in edits:
             value = Yedit.parse_value(edit['value'], edit.get('value_type', ''))
             if edit.get('action') == 'update':
@@ -808,7 +1039,322 @@ class Yedit(object):
             if rval[0]:
                 results.append({'key': edit['key'], 'edit': rval[1]})
 
-        return {'changed': len(results) > 0, 'results': results}
+    @staticmethod
+    def _read_queue_entry(path):
+        ''' return queued entry or None if it is already taken '''
+        try:
+            with open(path) as qfd:
+                return json.load(qfd)
+        except (IOError, OSError) as err:
+            if err.errno == errno.ENOENT:
+                return None
+            raise
+
+    @staticmethod
+    def _write_queue_entry(path, entry):
+        ''' write queued entry atomically '''
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as qfd:
+            json.dump(entry, qfd)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def _move_queue_entry(path, new_path=None):
+        '''rename or remove queued entry
+
+           Return False if it is already moved by some other process.
+        '''
+        try:
+            if new_path is None:
+                os.remove(path)
+            else:
+                os.rename(path, new_path)
+        except OSError as err:
+            if err.errno == errno.ENOENT:
+                return False
+            raise
+        return True
+
+    @staticmethod
+    def run_queued(params, edits):
+        '''queue the edits and apply all the queued ones with a single write
+
+           Entries are '<id>.json' files in the queue dir. The process which
+           takes the lock renames entries with the same 'separator' and
+           'content_type' to '<id>.taken', applies them in one transaction
+           and replaces each applied entry with the '<id>.done' file holding
+           its results.
+        '''
+        queue_dir = YeditLock.get_sync_path(params['src'], '.queue')
+        try:
+            os.makedirs(queue_dir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        entry_id = '{:.6f}-{}-{}'.format(
+            time.time(), os.getpid(), uuid.uuid4().hex[:8])
+        entry_path = os.path.join(queue_dir, entry_id + '.json')
+        done_path = os.path.join(queue_dir, entry_id + '.done')
+        settings = {'separator': params['separator'],
+                    'content_type': params['content_type']}
+        # NOTE(vponomar): strings are read back from json as unicode, which
+        # 'parse_value' does not parse, so parse values before queueing.
+        edits = [dict(edit, **dict(
+            (key, Yedit.parse_value(edit[key], vtype))
+            for key, vtype in (('value', edit.get('value_type', '')),
+                               ('curr_value', ''))
+            if key in edit)) for edit in edits]
+        Yedit._write_queue_entry(entry_path, dict(
+            settings, edits=edits,
+            expires_at=time.time() + params['lock_timeout']))
+
+        lock = YeditLock(params['src'], params['lock_timeout'])
+        is_needless = lambda: os.path.exists(done_path)  # noqa: E731
+        try:
+            lock.acquire(is_needless=is_needless)
+        except YeditException:
+            # Do not leave the edits to be applied after the task failed
+            if Yedit._move_queue_entry(entry_path):
+                raise
+            # NOTE(vponomar): the edits are taken by the process holding
+            # the lock, so wait for their results instead of failing.
+            lock.acquire(is_needless=is_needless)
+        try:
+            if not os.path.exists(done_path):
+                Yedit._apply_queue(params, queue_dir, entry_id, settings)
+        finally:
+            lock.release()
+
+        result = Yedit._read_queue_entry(done_path)
+        if result is None:
+            return {'failed': True, 'msg': (
+                'Queued edits expired after {} seconds without being '
+                'applied'.format(params['lock_timeout']))}
+        Yedit._move_queue_entry(done_path)
+        if 'failed' in result:
+            return result
+        return dict(result, state=params['state'])
+
+    @staticmethod
+    def _apply_queue(params, queue_dir, entry_id, settings):
+        ''' apply queued entries, must be called holding the lock '''
+        now = time.time()
+        entries = []
+        for filename in sorted(os.listdir(queue_dir)):
+            path = os.path.join(queue_dir, filename)
+            queued_id, ext = os.path.splitext(filename)
+            if ext in ('.done', '.tmp'):
+                # Results and parts of entries of the failed processes
+                try:
+                    is_stale = now - os.path.getmtime(path) > (
+                        params['lock_timeout'])
+                except OSError:
+                    continue
+                if is_stale:
+                    Yedit._move_queue_entry(path)
+                continue
+            if ext == '.taken':
+                # Taken by the process which failed holding the lock
+                Yedit._move_queue_entry(path, path[:-len(ext)] + '.json')
+            elif ext != '.json':
+                continue
+            path = path[:-len(ext)] + '.json'
+            entry = Yedit._read_queue_entry(path)
+            if entry is None:
+                continue
+            if entry.get('expires_at', now) < now:
+                # NOTE(vponomar): owners of such entries have failed already
+                # or are going to fail right now, so do not apply them.
+                Yedit._move_queue_entry(path)
+                continue
+            if not all(entry.get(k) == v for k, v in settings.items()):
+                continue
+            taken_path = path[:-len('.json')] + '.taken'
+            if Yedit._move_queue_entry(path, taken_path):
+                entries.append((queued_id, taken_path, entry))
+
+        error = Yedit._apply_queue_entries(params, entries)
+        if error is None:
+            return
+
+        # NOTE(vponomar): do not let broken edits of one process fail the
+        # others, their owners apply them on their own.
+        own_entries = [e for e in entries if e[0] == entry_id]
+        for queued_id, path, _ in entries:
+            if queued_id != entry_id:
+                Yedit._move_queue_entry(path, path[:-len('.taken')] + '.json')
+        if not own_entries:
+            return
+        if len(entries) > 1:
+            error = Yedit._apply_queue_entries(params, own_entries)
+        if error is not None:
+            _, path, _ = own_entries[0]
+            Yedit._write_queue_entry(path[:-len('.taken')] + '.done', {
+                'failed': True, 'msg': 'Edits are rolled back: ' + error})
+            Yedit._move_queue_entry(path)
+
+    @staticmethod
+    def _apply_queue_entries(params, entries):
+        '''apply queued entries as a single transaction
+
+           Return error message leaving all the entries taken if any of
+           them fails.
+        '''
+        results = {}
+        try:
+            yamlfile = Yedit(filename=params['src'],
+                             backup=params['backup'],
+                             content_type=params['content_type'],
+                             backup_ext=params['backup_ext'],
+                             separator=params['separator'])
+            yamlfile.begin()
+        except YeditException as err:
+            return str(err)
+        try:
+            for queued_id, _, entry in entries:
+                results[queued_id] = []
+                Yedit._process_edits(
+                    entry['edits'], yamlfile, results[queued_id])
+            yamlfile.commit()
+        except Exception as err:  # pylint: disable=broad-except
+            yamlfile.rollback()
+            return str(err)
+
+        if any(results.values()):
+            yamlfile.write()
+        for queued_id, path, _ in entries:
+            Yedit._write_queue_entry(path[:-len('.taken')] + '.done', {
+                'changed': len(results[queued_id]) > 0,
+                'module_results': [
+                    {'key': result['key']} for result in results[queued_id]],
+            })
+            Yedit._move_queue_entry(path)
+        return None
+
+    @staticmethod
+    def get_top_level_keys(contents):
+        '''return top-level keys of the block mapping document
+
+           Only lines without indentation are parsed. None is returned if
+           the keys cannot be found this way, for example, for flow style
+           or multi-document files.
+        '''
+        keys = set()
+        for line_number, line in enumerate(contents.splitlines()):
+            if not line.strip() or line[0] in ' \t#':
+                continue
+            if line_number == 0 and line.rstrip() == '---':
+                continue
+            # items of indentless sequences which are values of the keys
+            if keys and line[0] == '-' and line[1:2] in ('', ' ', '\t'):
+                continue
+            if line[0] in '-?[{%.!&*|>\'"':
+                return None
+            try:
+                item = yaml.safe_load(line)
+            except yaml.YAMLError:
+                return None
+            if not isinstance(item, dict) or len(item) != 1:
+                return None
+            keys.update(item)
+        return keys
+
+    @staticmethod
+    def run_streamed(params, edits):
+        '''append top-level keys to the file, must be called holding the lock'''
+        # Keep keys in the order of edits, plain dict would mix them up.
+        try:
+            fragment = yaml.comments.CommentedMap()
+        except AttributeError:
+            fragment = collections.OrderedDict()
+        for edit in edits:
+            value = Yedit.parse_value(edit['value'], edit.get('value_type', ''))
+            try:
+                result = None
+                if not edit.get('action') and edit['key']:
+                    result = Yedit.add_entry(
+                        fragment, edit['key'], value, params['separator'])
+            except YeditException:
+                result = None
+            if result is None:
+                return {'failed': True,
+                        'msg': "'stream' supports only setting of new "
+                               "top-level keys, got key: {}".format(edit['key'])}
+
+        contents = ''
+        if os.path.exists(params['src']):
+            with open(params['src']) as yfd:
+                contents = yfd.read()
+        keys = Yedit.get_top_level_keys(contents)
+        if keys is None or keys.intersection(fragment):
+            return dict(Yedit.run_ansible(params), streamed=False)
+
+        try:
+            text = yaml.round_trip_dump(fragment, default_flow_style=False)
+        except AttributeError:
+            # NOTE(vponomar): PyYAML cannot dump OrderedDict safely and sorts
+            # keys anyway, so keys come in sorted order here.
+            text = yaml.safe_dump(dict(fragment), default_flow_style=False)
+        if contents and not contents.endswith('\n'):
+            text = '\n' + text
+        with open(params['src'], 'a') as yfd:
+            yfd.write(text)
+
+        return {'changed': bool(fragment),
+                'module_results': [{'key': edit['key']} for edit in edits],
+                'streamed': True,
+                'state': params['state']}
+
+    @staticmethod
+    def run_compact(params):
+        '''rewrite the file as a single document'''
+        if not os.path.exists(params['src']):
+            return {'changed': False, 'module_results': None,
+                    'state': params['state']}
+        with open(params['src']) as yfd:
+            contents = yfd.read()
+        yamlfile = Yedit(filename=params['src'],
+                         backup=params['backup'],
+                         content_type=params['content_type'],
+                         backup_ext=params['backup_ext'],
+                         separator=params['separator'])
+        if yamlfile.yaml_dict is None:
+            return {'failed': True,
+                    'msg': 'Error opening file [{}].'.format(params['src'])}
+        yamlfile.write()
+        with open(params['src']) as yfd:
+            changed = yfd.read() != contents
+        return {'changed': changed, 'module_results': None,
+                'state': params['state']}
+
+    @staticmethod
+    def get_edits(params):
+        '''return list of edits defined by the module params'''
+        # If we were passed a key, value then
+        # we encapsulate it in a list and process it
+        # Key, Value passed to the module : Converted to Edits list #
+        edits = []
+        _edit = {}
+        if params['value'] is not None:
+            _edit['value'] = params['value']
+            _edit['value_type'] = params['value_type']
+            _edit['key'] = params['key']
+
+            if params['update']:
+                _edit['action'] = 'update'
+                _edit['curr_value'] = params['curr_value']
+                _edit['curr_value_format'] = params['curr_value_format']
+                _edit['index'] = params['index']
+
+            elif params['append']:
+                _edit['action'] = 'append'
+
+            edits.append(_edit)
+
+        elif params['edits'] is not None:
+            edits = params['edits']
+
+        return edits
 
     # pylint: disable=too-many-return-statements,too-many-branches
     @staticmethod
@@ -867,32 +1413,13 @@ class Yedit(object):
 
                 yamlfile.yaml_dict = content
 
-            # If we were passed a key, value then
-            # we encapsulate it in a list and process it
-            # Key, Value passed to the module : Converted to Edits list #
-            edits = []
-            _edit = {}
-            if params['value'] is not None:
-                _edit['value'] = params['value']
-                _edit['value_type'] = params['value_type']
-                _edit['key'] = params['key']
-
-                if params['update']:
-                    _edit['action'] = 'update'
-                    _edit['curr_value'] = params['curr_value']
-                    _edit['curr_value_format'] = params['curr_value_format']
-                    _edit['index'] = params['index']
-
-                elif params['append']:
-                    _edit['action'] = 'append'
-
-                edits.append(_edit)
-
-            elif params['edits'] is not None:
-                edits = params['edits']
-
+            edits = Yedit.get_edits(params)
             if edits:
-                results = Yedit.process_edits(edits, yamlfile)
+                try:
+                    results = Yedit.process_edits(edits, yamlfile)
+                except YeditException as err:
+                    return {'failed': True,
+                            'msg': 'Edits are rolled back: {}'.format(err)}
 
                 # if there were changes and a src provided to us we need to write
                 if results['changed'] and params['src']:
@@ -943,14 +1470,19 @@ def main():
             backup_ext=dict(default=".{}".format(time.strftime("%Y%m%dT%H%M%S")), type='str'),
             separator=dict(default='.', type='str'),
             edits=dict(default=None, type='list'),
+            lock_timeout=dict(default=300, type='int'),
+            queue=dict(default=False, type='bool'),
+            stream=dict(default=False, type='bool'),
+            compact=dict(default=False, type='bool'),
         ),
-        mutually_exclusive=[["curr_value", "index"], ['update', "append"]],
+        mutually_exclusive=[["curr_value", "index"], ['update', "append"],
+                            ['queue', 'stream', 'compact']],
         required_one_of=[["content", "src"]],
     )
 
     # Verify we recieved either a valid key or edits with valid keys when receiving a src file.
     # A valid key being not None or not ''.
-    if module.params['src'] is not None:
+    if module.params['src'] is not None and not module.params['compact']:
         key_error = False
         edit_error = False
 
@@ -969,7 +1501,33 @@ def main():
         if key_error and edit_error:
             module.fail_json(failed=True, msg='Empty value for parameter key not allowed.')
 
-    rval = Yedit.run_ansible(module.params)
+    for option in ('queue', 'stream', 'compact'):
+        if module.params[option] and (
+                module.params['src'] is None or module.params['content'] or
+                module.params['state'] != 'present'):
+            module.fail_json(msg="'{}' requires 'src' and 'present' state "
+                                 "without 'content'.".format(option))
+    if module.params['stream'] and module.params['content_type'] != 'yaml':
+        module.fail_json(msg="'stream' supports only 'yaml' content type.")
+
+    try:
+        if module.params['queue']:
+            rval = Yedit.run_queued(
+                module.params, Yedit.get_edits(module.params))
+        elif module.params['src'] and module.params['state'] != 'list':
+            with YeditLock(module.params['src'], module.params['lock_timeout']):
+                if module.params['compact']:
+                    rval = Yedit.run_compact(module.params)
+                elif module.params['stream']:
+                    rval = Yedit.run_streamed(
+                        module.params, Yedit.get_edits(module.params))
+                else:
+                    rval = Yedit.run_ansible(module.params)
+        else:
+            rval = Yedit.run_ansible(module.params)
+    except YeditException as err:
+        module.fail_json(msg=str(err))
+
     if 'failed' in rval and rval['failed']:
         module.fail_json(**rval)
 
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community',
+}
+
+DOCUMENTATION = '''
+---
+module: dt_yum_update_hosts
+
+short_description: updates packages on lots of hosts in rolling batches
+
+version_added: "2.4"
+
+description:
+    - "Runs 'yum update' on all the hosts using rolling batches. Packages
+       are downloaded first using 'download-only' pass limited by the
+       'max_parallel_downloads' hosts at a time, so the repo server is not
+       overloaded. Then packages are applied on not more than 'batch_size'
+       hosts at the same time and each host gets rebooted as soon as its own
+       update is finished, not waiting for other hosts."
+    - "Failed yum commands are retried depending on the detected failure
+       type. Network and yum lock problems are retried after delay,
+       broken metadata gets cleaned up before retry and dependency,
+       disk space and transaction problems fail the host right away."
+    - "Should be run on the same host as Ansible itself, so the same SSH
+       keys are used. Should not be run from the hosts which are going to
+       be rebooted."
+
+options:
+    hosts:
+        description:
+            - List of hostnames or IP addresses to update.
+        required: true
+    batch_size:
+        description:
+            - Amount of hosts which apply updates and get rebooted at the same
+              time. 0 means all the hosts at once.
+        required: false
+        default: 0
+    max_parallel_downloads:
+        description:
+            - Amount of hosts which download packages from the repo servers
+              at the same time. 0 means all the hosts at once.
+        required: false
+        default: 5
+    download_only_first:
+        description:
+            - Whether to download packages using separate 'download-only'
+              pass before applying them or not. If enabled, then updates are
+              applied from the yum cache without hitting the repo servers.
+        required: false
+        default: true
+    reboot:
+        description:
+            - Whether to reboot each of the hosts after its update or not.
+        required: false
+        default: false
+    update_timeout:
+        description:
+            - Time in seconds for each of the yum commands.
+        required: false
+        default: 3600
+    reboot_timeout:
+        description:
+            - Time in seconds to wait for each of the hosts to be rebooted
+              and started up.
+        required: false
+        default: 600
+    retries:
+        description:
+            - Amount of attempts of each of the yum commands for retriable
+              failures.
+        required: false
+        default: 3
+    retry_delay:
+        description:
+            - Time in seconds between attempts of a yum command.
+        required: false
+        default: 10
+    check_system_running:
+        description:
+            - Whether to wait for the 'systemctl is-system-running' command to
+              report one of 'ready_states' after reboot or not.
+        required: false
+        default: true
+    ready_states:
+        description:
+            - States of the system reported by 'systemctl is-system-running'
+              which are considered as ready ones.
+        required: false
+        default: ['running', 'degraded']
+    port:
+        description:
+            - SSH port of the hosts.
+        required: false
+        default: 22
+    connect_timeout:
+        description:
+            - Time in seconds to wait for each of connections to a host.
+        required: false
+        default: 5
+    probe_interval:
+        description:
+            - Time in seconds between probes of a host which is rebooted.
+        required: false
+        default: 2
+    ssh_user:
+        description:
+            - User used for running commands on the hosts.
+        required: false
+        default: root
+    ssh_private_key_file:
+        description:
+            - Private SSH key used for running commands on the hosts.
+        required: false
+
+author:
+    - Valerii Ponomarov (@vponomar)
+'''
+
+EXAMPLES = '''
+- name: Update packages and reboot hosts 5 at a time
+  dt_yum_update_hosts:
+    hosts: "{{ hostnames }}"
+    batch_size: 5
+    max_parallel_downloads: 3
+    reboot: yes
+  register: yum_update
+'''
+
+RETURN = '''
+hosts:
+    description:
+        - One record per each of the hosts. Each of them has 'host',
+          'changed', 'failed', 'failed_stage', 'failure_type', 'msg',
+          'output_tail' and 'timeline' keys. 'timeline' is list of stages
+          ('download', 'update' and 'reboot') with 'stage', 'queued_sec'
+          (time spent waiting for a free slot), 'start_sec' and 'end_sec'
+          (time since start of the module), 'attempts' and 'failure_types'
+          keys.
+    returned: always
+    type: list
+'''
+
+import threading
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dt_ssh import (
+    HostProbe,
+    read_ssh_banner,
+    run_in_threads,
+    run_ssh_command,
+    SSH_CONNECTION_ERROR_RC,
+)
+
+TIMEOUT_RC = 124
+OUTPUT_TAIL_LINES = 20
+NO_UPDATES_MARKER = "No packages marked for update"
+
+# NOTE(vponomar): order matters, first matched type wins. For example,
+# 'checksum' errors contain URLs which could be matched as network ones.
+YUM_FAILURE_PATTERNS = (
+    ("disk_space", (
+        "No space left on device", "Insufficient space",
+        "needs more space", "Disk Requirements:")),
+    ("dependency", (
+        "Error: Package:", "Requires:", "--skip-broken",
+        "conflicts with")),
+    ("transaction", (
+        "Transaction check error", "Error in PREIN scriptlet",
+        "Error in POSTIN scriptlet", "rpmdb open failed")),
+    ("lock", (
+        "Existing lock", "another app is currently holding the yum lock")),
+    ("metadata", (
+        "does not match checksum", "repomd.xml signature could not be",
+        "Metadata file does not match", "Error: Cannot retrieve repository "
+        "metadata", "Package does not match intended download",
+        "Caching enabled but no local cache")),
+    ("network", (
+        "Could not resolve host", "Cannot retrieve metalink",
+        "Cannot find a valid baseurl", "No more mirrors to try",
+        "Connection timed out", "Connection refused", "Operation too slow",
+        "HTTP Error", "Errno 14", "Errno 12", "curl#")),
+)
+
+# Failure types retried after 'retry_delay'. Others fail the host at once.
+# Commands to be run before retry are the values.
+RETRIABLE_YUM_FAILURES = {
+    "connection": None,
+    "lock": None,
+    "metadata": "yum clean metadata",
+    "network": None,
+    "unknown": None,
+}
+
+
+def detect_yum_failure_type(rc, output):
+    if rc == SSH_CONNECTION_ERROR_RC:
+        return "connection"
+    if rc == TIMEOUT_RC:
+        return "timeout"
+    for failure_type, patterns in YUM_FAILURE_PATTERNS:
+        for pattern in patterns:
+            if pattern in output:
+                return failure_type
+    return "unknown"
+
+
+def get_output_tail(output):
+    return output.strip().splitlines()[-OUTPUT_TAIL_LINES:]
+
+
+class HostUpdate(object):
+    def __init__(self, host, scheduler):
+        self.host = host
+        self.scheduler = scheduler
+        self.params = scheduler.params
+        self.record = {
+            "host": host,
+            "changed": False,
+            "failed": False,
+            "failed_stage": None,
+            "failure_type": None,
+            "msg": "",
+            "output_tail": [],
+            "timeline": [],
+        }
+
+    def now(self):
+        return round(time.time() - self.scheduler.start_time, 3)
+
+    def start_stage(self, stage, queued_since):
+        stage_record = {
+            "stage": stage,
+            "queued_sec": round(time.time() - queued_since, 3),
+            "start_sec": self.now(),
+            "end_sec": None,
+            "attempts": 0,
+            "failure_types": [],
+        }
+        self.record["timeline"].append(stage_record)
+        return stage_record
+
+    def fail(self, stage_record, failure_type, msg, output=""):
+        stage_record["end_sec"] = self.now()
+        self.record.update(
+            failed=True, failed_stage=stage_record["stage"],
+            failure_type=failure_type, msg=msg,
+            output_tail=get_output_tail(output))
+
+    def run_yum(self, stage_record, commands):
+        """Run yum command with retries depending on failure type.
+
+        'commands' is list of commands for the consecutive attempts,
+        the last one is used for all the following attempts.
+        """
+        while True:
+            stage_record["attempts"] += 1
+            cmd = commands[min(stage_record["attempts"], len(commands)) - 1]
+            rc, stdout, stderr = run_ssh_command(
+                self.host, "timeout %s %s" % (
+                    self.params['update_timeout'], cmd),
+                self.params)
+            output = stdout + stderr
+            if rc == 0:
+                return output
+            failure_type = detect_yum_failure_type(rc, output)
+            stage_record["failure_types"].append(failure_type)
+            if (failure_type not in RETRIABLE_YUM_FAILURES or
+                    stage_record["attempts"] >= self.params['retries']):
+                self.fail(
+                    stage_record, failure_type,
+                    "'%s' failed with '%s' exit code after %s attempt(s). "
+                    "Detected failure type is '%s'." % (
+                        cmd, rc, stage_record["attempts"], failure_type),
+                    output)
+                return None
+            time.sleep(self.params['retry_delay'])
+            if failure_type == "connection":
+                self.wait_for_ssh()
+            elif RETRIABLE_YUM_FAILURES[failure_type]:
+                run_ssh_command(
+                    self.host, RETRIABLE_YUM_FAILURES[failure_type],
+                    self.params)
+
+    def wait_for_ssh(self):
+        deadline = time.time() + self.params['reboot_timeout']
+        while time.time() < deadline:
+            try:
+                read_ssh_banner(self.host, self.params['port'],
+                                self.params['connect_timeout'])
+                return
+            except Exception:
+                time.sleep(self.params['probe_interval'])
+
+    def download(self):
+        queued_since = time.time()
+        with self.scheduler.downloads_slots:
+            stage_record = self.start_stage("download", queued_since)
+            output = self.run_yum(
+                stage_record, ["yum update -y --downloadonly"])
+            stage_record["end_sec"] = self.now()
+        if output is not None and NO_UPDATES_MARKER in output:
+            stage_record["no_updates"] = True
+        return output is not None
+
+    def update(self, downloaded, queued_since):
+        if downloaded:
+            # Use cached metadata and packages for the first attempt,
+            # hit the repo servers only if something is missing in cache.
+            with_download_slot = False
+            commands = ["yum update -y -C", "yum update -y"]
+        else:
+            with_download_slot = True
+            commands = ["yum update -y"]
+        if with_download_slot:
+            self.scheduler.downloads_slots.acquire()
+        try:
+            stage_record = self.start_stage("update", queued_since)
+            output = self.run_yum(stage_record, commands)
+            stage_record["end_sec"] = self.now()
+        finally:
+            if with_download_slot:
+                self.scheduler.downloads_slots.release()
+        if output is None:
+            return False
+        self.record["changed"] = NO_UPDATES_MARKER not in output
+        return True
+
+    def reboot(self):
+        stage_record = self.start_stage("reboot", time.time())
+        stage_record["attempts"] = 1
+        rc, stdout, stderr = run_ssh_command(
+            self.host, "cat /proc/sys/kernel/random/boot_id", self.params)
+        if rc != 0:
+            self.fail(stage_record, "connection",
+                      "Failed to read boot ID: %s" % stderr.strip())
+            return
+        # NOTE(vponomar): delay shutdown, so SSH session gets closed
+        # gracefully before network goes down.
+        run_ssh_command(
+            self.host,
+            "nohup sh -c \"sleep 3; /sbin/shutdown -r now "
+            "'Reboot triggered by Ansible'\" > /dev/null 2>&1 &",
+            self.params)
+        probe_record = HostProbe(
+            self.host, self.params,
+            time.time() + self.params['reboot_timeout'],
+            previous_boot_id=stdout.strip()).run()
+        stage_record["end_sec"] = self.now()
+        stage_record["attempts"] = probe_record["attempts"]
+        self.record["changed"] = True
+        if not probe_record["ready"]:
+            self.fail(
+                stage_record, "reboot_timeout",
+                "Host is not ready in %s seconds after reboot: %s" % (
+                    self.params['reboot_timeout'], probe_record["msg"]))
+
+    def run(self):
+        try:
+            downloaded = False
+            if self.params['download_only_first']:
+                downloaded = self.download()
+                if not downloaded:
+                    return
+            queued_since = time.time()
+            with self.scheduler.batch_slots:
+                if not self.update(downloaded, queued_since):
+                    return
+                if self.params['reboot']:
+                    self.reboot()
+        except Exception as e:
+            self.record.update(failed=True, failure_type="unknown",
+                               msg="Unexpected error: %s" % e)
+
+
+class YumUpdateScheduler(object):
+    def __init__(self, params):
+        self.params = params
+        self.start_time = time.time()
+        hosts = sorted(set(params['hosts']), key=params['hosts'].index)
+        self.downloads_slots = threading.BoundedSemaphore(
+            params['max_parallel_downloads'] or len(hosts))
+        self.batch_slots = threading.BoundedSemaphore(
+            params['batch_size'] or len(hosts))
+        self.updates = [HostUpdate(host, self) for host in hosts]
+
+    def run(self):
+        run_in_threads(
+            lambda update: update.run(), self.updates, len(self.updates))
+        return [update.record for update in self.updates]
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "hosts": {"type": "list", "required": True},
+            "batch_size": {"type": "int", "default": 0},
+            "max_parallel_downloads": {"type": "int", "default": 5},
+            "download_only_first": {"type": "bool", "default": True},
+            "reboot": {"type": "bool", "default": False},
+            "update_timeout": {"type": "int", "default": 3600},
+            "reboot_timeout": {"type": "int", "default": 600},
+            "retries": {"type": "int", "default": 3},
+            "retry_delay": {"type": "int", "default": 10},
+            "check_system_running": {"type": "bool", "default": True},
+            "ready_states": {
+                "type": "list", "default": ["running", "degraded"],
+            },
+            "port": {"type": "int", "default": 22},
+            "connect_timeout": {"type": "int", "default": 5},
+            "probe_interval": {"type": "int", "default": 2},
+            "ssh_user": {"type": "str", "default": "root"},
+            "ssh_private_key_file": {"type": "path", "required": False},
+        },
+    )
+    for param in ("batch_size", "max_parallel_downloads"):
+        if module.params[param] < 0:
+            module.fail_json(msg="'%s' must not be negative" % param)
+    if module.params['retries'] < 1:
+        module.fail_json(msg="'retries' must be positive")
+    if not module.params['hosts']:
+        module.exit_json(changed=False, hosts=[])
+
+    records = YumUpdateScheduler(module.params).run()
+    result = {
+        "changed": any(record["changed"] for record in records),
+        "hosts": records,
+    }
+    failed_hosts = [
+        "%s (%s, %s)" % (
+            record["host"], record["failed_stage"], record["failure_type"])
+        for record in records if record["failed"]]
+    if failed_hosts:
+        module.fail_json(
+            msg="Failed to update hosts: %s" % ", ".join(failed_hosts),
+            **result)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
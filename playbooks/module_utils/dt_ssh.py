@@ -0,0 +1,151 @@
+# Helpers shared by the 'dt_*' Ansible modules working with hosts over SSH.
+
+import socket
+import subprocess
+import threading
+import time
+
+SSH_BANNER_PREFIX = b"SSH-"
+SSH_CONNECTION_ERROR_RC = 255
+
+
+def read_ssh_banner(host, port, connect_timeout):
+    sock = socket.create_connection((host, port), connect_timeout)
+    try:
+        sock.settimeout(connect_timeout)
+        banner = sock.recv(256)
+    finally:
+        sock.close()
+    if not banner.startswith(SSH_BANNER_PREFIX):
+        raise ValueError("Unexpected SSH banner: %r" % banner[:64])
+    return banner
+
+
+def get_ssh_cmd(host, command, params):
+    """Build 'ssh' command using 'port', 'connect_timeout', 'ssh_user' and
+    'ssh_private_key_file' module params.
+    """
+    cmd = [
+        "ssh", "-p", str(params['port']),
+        "-o", "BatchMode=yes",
+        "-o", "ConnectTimeout=%s" % params['connect_timeout'],
+        "-o", "StrictHostKeyChecking=no",
+        "-o", "UserKnownHostsFile=/dev/null",
+        "-o", "GSSAPIAuthentication=no",
+        "-o", "LogLevel=ERROR",
+    ]
+    if params['ssh_private_key_file']:
+        cmd.extend(["-i", params['ssh_private_key_file']])
+    cmd.extend(["%s@%s" % (params['ssh_user'], host), command])
+    return cmd
+
+
+def run_ssh_command(host, command, params):
+    """Run command on a host and return its exit code, stdout and stderr."""
+    process = subprocess.Popen(
+        get_ssh_cmd(host, command, params), stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    return (process.returncode, stdout.decode("utf-8", "replace"),
+            stderr.decode("utf-8", "replace"))
+
+
+def run_in_threads(func, items, max_workers):
+    """Call 'func' for each of the items using pool of threads.
+
+    Items are taken in the order they are provided. Exceptions are not
+    caught, so 'func' is expected to handle them itself.
+    """
+    queue = list(items)
+    queue_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with queue_lock:
+                if not queue:
+                    return
+                item = queue.pop(0)
+            func(item)
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(len(queue), max_workers))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class HostProbe(object):
+    """Probe host till it becomes ready or till the deadline.
+
+    Uses 'port', 'connect_timeout', 'probe_interval', 'check_system_running',
+    'ready_states', 'ssh_user' and 'ssh_private_key_file' module params.
+    """
+
+    def __init__(self, host, params, deadline, previous_boot_id=None,
+                 read_boot_id=False):
+        self.host = host
+        self.params = params
+        self.deadline = deadline
+        self.start_time = time.time()
+        self.previous_boot_id = previous_boot_id
+        self.run_commands = bool(
+            params['check_system_running'] or read_boot_id or
+            previous_boot_id)
+        self.record = {
+            "host": host,
+            "ready": False,
+            "time_sec": None,
+            "attempts": 0,
+            "system_state": None,
+            "boot_id": None,
+            "msg": "",
+        }
+
+    def run_probe_commands(self):
+        # NOTE(vponomar): 'systemctl is-system-running' returns non-zero
+        # exit code for all the states except 'running', so ignore it.
+        command = "cat /proc/sys/kernel/random/boot_id"
+        if self.params['check_system_running']:
+            command += " && (systemctl is-system-running || true)"
+        rc, stdout, stderr = run_ssh_command(self.host, command, self.params)
+        if rc != 0:
+            raise ValueError("SSH command failed: %s" % stderr.strip())
+        lines = stdout.split()
+        self.record["boot_id"] = lines[0] if lines else None
+        if self.params['check_system_running']:
+            self.record["system_state"] = lines[1] if len(lines) > 1 else None
+
+    def is_ready(self):
+        read_ssh_banner(
+            self.host, self.params['port'], self.params['connect_timeout'])
+        if not self.run_commands:
+            return True
+        self.run_probe_commands()
+        if (self.previous_boot_id and
+                self.record["boot_id"] == self.previous_boot_id):
+            self.record["msg"] = "Host is not rebooted yet"
+            return False
+        if (self.params['check_system_running'] and
+                self.record["system_state"] not in (
+                    self.params['ready_states'])):
+            self.record["msg"] = "System is '%s'" % (
+                self.record["system_state"])
+            return False
+        return True
+
+    def run(self):
+        while True:
+            self.record["attempts"] += 1
+            try:
+                if self.is_ready():
+                    self.record.update(
+                        ready=True, msg="",
+                        time_sec=round(time.time() - self.start_time, 3))
+                    return self.record
+            except Exception as e:
+                self.record["msg"] = str(e)
+            if time.time() + self.params['probe_interval'] >= self.deadline:
+                return self.record
+            time.sleep(self.params['probe_interval'])
@@ -0,0 +1,383 @@
+# Helpers shared by the 'dt_*' Ansible modules working with vCenter.
+
+import hashlib
+import json
+import os
+import ssl
+import tempfile
+import time
+
+try:
+    from pyVmomi import vim, vmodl, SoapStubAdapter
+except ImportError:
+    # Modules using these helpers check presence of 'pyvmomi' themselves
+    pass
+
+from ansible.module_utils.vmware import (
+    connect_to_api,
+    vmware_argument_spec,
+)
+
+# NOTE(vponomar): unit number 7 of a SCSI controller is reserved by itself
+SCSI_CONTROLLER_UNIT_NUMBER = 7
+SCSI_MAX_UNIT_NUMBER = 15
+VM_FINGERPRINT_PREFIX = "dt-fingerprint: "
+
+
+def dt_vmware_argument_spec():
+    argument_spec = vmware_argument_spec()
+    argument_spec.update({
+        "session_cache_dir": {
+            "type": "path", "default": "~/.cache/dt_vmware_sessions",
+        },
+        "session_ttl": {"type": "int", "default": 1200},
+    })
+    return argument_spec
+
+
+def get_session_cache_filepath(module):
+    session_key = hashlib.sha256(("%s:%s:%s" % (
+        module.params['hostname'], module.params.get('port', 443),
+        module.params['username'])).encode("utf-8")).hexdigest()
+    return os.path.join(
+        os.path.expanduser(module.params['session_cache_dir']),
+        "%s.json" % session_key)
+
+
+def read_cached_session(cache_filepath):
+    try:
+        with open(cache_filepath, 'r') as cache_stream:
+            session = json.load(cache_stream)
+    except (IOError, OSError, ValueError):
+        return None
+    if session.get("expires_at", 0) <= time.time():
+        return None
+    return session
+
+
+def write_cached_session(cache_filepath, session):
+    # NOTE(vponomar): session cookie allows to work with vCenter without
+    # credentials, so make it readable only by owner. Also, write it
+    # atomically, because lots of modules may run in parallel.
+    cache_dir = os.path.dirname(cache_filepath)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, 0o700)
+    fd, tmp_filepath = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as cache_stream:
+            json.dump(session, cache_stream)
+        os.rename(tmp_filepath, cache_filepath)
+    except Exception:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def restore_session(module, session):
+    ssl_context = None
+    if not module.params['validate_certs'] and hasattr(ssl, 'SSLContext'):
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        ssl_context.verify_mode = ssl.CERT_NONE
+    try:
+        stub = SoapStubAdapter(
+            host=module.params['hostname'],
+            port=module.params.get('port', 443),
+            version=session["version"], sslContext=ssl_context)
+        stub.cookie = session["cookie"]
+        content = vim.ServiceInstance(
+            "ServiceInstance", stub).RetrieveContent()
+        if content.sessionManager.currentSession is None:
+            return None
+    except Exception:
+        # Session is expired, vCenter is restarted or anything else,
+        # so just log in once again.
+        return None
+    return content
+
+
+def connect_to_api_with_session_cache(module):
+    """Reuse live vCenter session of the same user or log in once again.
+
+    Cached sessions are not logged out at exit of a module, so they can be
+    reused by following module runs until 'session_ttl' seconds pass
+    without any module using it.
+    """
+    if module.params['session_ttl'] <= 0:
+        return connect_to_api(module)
+
+    cache_filepath = get_session_cache_filepath(module)
+    session = read_cached_session(cache_filepath)
+    content = restore_session(module, session) if session else None
+    if content is None:
+        content = connect_to_api(module, disconnect_atexit=False)
+        stub = content.sessionManager._stub
+        session = {"cookie": stub.cookie, "version": stub.version}
+
+    session["expires_at"] = time.time() + module.params['session_ttl']
+    try:
+        write_cached_session(cache_filepath, session)
+    except (IOError, OSError) as e:
+        module.warn("Failed to cache vCenter session: %s" % e)
+    return content
+
+
+class VMwareObjectsSnapshot(object):
+    """In-memory snapshot of names and parents of vCenter objects.
+
+    Names, parents and IDs of all the objects of requested types are fetched
+    using single 'RetrieveContents' call of the property collector instead
+    of reading 'name' property of each object separately.
+    """
+
+    def __init__(self, content, vimtypes):
+        self.objects = []
+        self.objects_by_key = {}
+        self.parents = {}
+        self.children = {}
+
+        view = content.viewManager.CreateContainerView(
+            content.rootFolder, vimtypes, True)
+        try:
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+                name="traverseEntities", path="view", skip=False,
+                type=vim.view.ContainerView)
+            obj_spec = vmodl.query.PropertyCollector.ObjectSpec(
+                obj=view, skip=True, selectSet=[traversal_spec])
+            prop_set = [vmodl.query.PropertyCollector.PropertySpec(
+                type=vimtype, pathSet=["name", "parent"], all=False)
+                for vimtype in vimtypes]
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[obj_spec], propSet=prop_set)
+            objects_content = content.propertyCollector.RetrieveContents(
+                [filter_spec])
+        finally:
+            view.Destroy()
+
+        for obj_content in objects_content or []:
+            props = {prop.name: prop.val for prop in obj_content.propSet}
+            self.add(obj_content.obj, props.get("name"), props.get("parent"))
+
+    def add(self, obj, name, parent=None):
+        self.objects.append(obj)
+        self.parents[obj._GetMoId()] = parent
+        self.children[(
+            parent._GetMoId() if parent is not None else None, name)] = obj
+        for key in (name, obj._GetMoId()):
+            self.objects_by_key.setdefault(key, []).append(obj)
+
+    def remove(self, obj):
+        """Forget the object and all its descendants, like 'Destroy' does."""
+        removed = set([obj._GetMoId()])
+        for descendant in self.objects:
+            parent, chain = self.parents.get(descendant._GetMoId()), []
+            while parent is not None and parent._GetMoId() not in removed:
+                chain.append(parent._GetMoId())
+                parent = self.parents.get(parent._GetMoId())
+            if parent is not None:
+                removed.add(descendant._GetMoId())
+                removed.update(chain)
+        self.objects = [
+            o for o in self.objects if o._GetMoId() not in removed]
+        for moid in removed:
+            self.parents.pop(moid, None)
+        self.children = dict(
+            (key, o) for key, o in self.children.items()
+            if o._GetMoId() not in removed)
+        for key in list(self.objects_by_key):
+            self.objects_by_key[key] = [
+                o for o in self.objects_by_key[key]
+                if o._GetMoId() not in removed]
+            if not self.objects_by_key[key]:
+                del self.objects_by_key[key]
+
+    def get(self, vimtype, name, return_all=False):
+        """Find objects by name or ID the same way as 'get_obj' methods do."""
+        objects = [obj for obj in self.objects_by_key.get(name, [])
+                   if isinstance(obj, vimtype)]
+        if not objects:
+            return None
+        return objects if return_all else objects[0]
+
+    def get_parent(self, obj):
+        return self.parents.get(obj._GetMoId())
+
+    def get_child(self, parent, name):
+        return self.children.get((parent._GetMoId(), name))
+
+    def get_children(self, parent, vimtype):
+        """Return dict of names and objects of the 'parent' children."""
+        parent_moid = parent._GetMoId()
+        return {
+            name: obj for (obj_parent_moid, name), obj in (
+                self.children.items())
+            if obj_parent_moid == parent_moid and isinstance(obj, vimtype)}
+
+
+def retrieve_properties(content, objects, vimtype, path_set):
+    """Read properties of lots of objects using single API call.
+
+    Returns dict where keys are IDs of the objects and values are dicts
+    with the requested properties.
+    """
+    if not objects:
+        return {}
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=obj)
+                   for obj in objects],
+        propSet=[vmodl.query.PropertyCollector.PropertySpec(
+            type=vimtype, pathSet=path_set, all=False)])
+    return {
+        obj_content.obj._GetMoId(): {
+            prop.name: prop.val for prop in obj_content.propSet}
+        for obj_content in content.propertyCollector.RetrieveContents(
+            [filter_spec]) or []
+    }
+
+
+class VMwarePropertiesWatcher(object):
+    """Watch changes of properties of objects using 'WaitForUpdatesEx'.
+
+    Uses own property collector, so updates of other modules and watchers
+    do not mix up with ours. Objects can be added and removed at any time.
+
+    With 'partial_updates' enabled changes of nested properties may come
+    under paths nested in the watched ones, so disable it to always get
+    whole values of the watched properties, like lists of data objects.
+    """
+
+    def __init__(self, content, vimtype, path_set, partial_updates=True):
+        self.vimtype = vimtype
+        self.path_set = path_set
+        self.partial_updates = partial_updates
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        self.version = ""
+        self.filters = {}
+
+    def add(self, *objs):
+        """Watch objects using single property filter for all of them."""
+        if not objs:
+            return
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=obj)
+                       for obj in objs],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(
+                type=self.vimtype, pathSet=self.path_set, all=False)])
+        property_filter = self.collector.CreateFilter(
+            filter_spec, partialUpdates=self.partial_updates)
+        for obj in objs:
+            self.filters[obj._GetMoId()] = property_filter
+
+    def remove(self, obj):
+        """Stop watching the object.
+
+        Filter shared with other objects is destroyed only when the last
+        of them is removed, till then changes of the removed object may
+        still be returned by 'wait'.
+        """
+        property_filter = self.filters.pop(obj._GetMoId(), None)
+        if property_filter is not None and property_filter not in (
+                self.filters.values()):
+            property_filter.DestroyPropertyFilter()
+
+    def wait(self, max_wait_seconds):
+        """Wait for changes and return them as dict of dicts.
+
+        Keys are IDs of the changed objects and values are dicts with new
+        values of the changed properties, removed properties get None.
+        Returns empty dict if nothing is changed during 'max_wait_seconds'
+        seconds.
+        """
+        update_set = self.collector.WaitForUpdatesEx(
+            self.version, vmodl.query.PropertyCollector.WaitOptions(
+                maxWaitSeconds=max(1, int(max_wait_seconds))))
+        if update_set is None:
+            return {}
+        self.version = update_set.version
+        changes = {}
+        for filter_update in update_set.filterSet or []:
+            for obj_update in filter_update.objectSet or []:
+                obj_changes = changes.setdefault(
+                    obj_update.obj._GetMoId(), {})
+                for change in obj_update.changeSet or []:
+                    if change.op in ("remove", "indirectRemove"):
+                        obj_changes[change.name] = None
+                    else:
+                        obj_changes[change.name] = change.val
+        return changes
+
+    def destroy(self):
+        self.filters = {}
+        self.collector.DestroyPropertyCollector()
+
+
+def get_datastore(snapshot, name):
+    datastore = snapshot.get(vim.Datastore, name)
+    if datastore is None:
+        raise ValueError("Datastore '%s' is not found" % name)
+    return datastore
+
+
+def get_disk_spec(disk, disk_device, scsi_controller, unit_number, snapshot):
+    disk_spec = vim.vm.device.VirtualDeviceSpec()
+    if disk_device is not None:
+        # Resize disk of the template
+        disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+        disk_spec.device = disk_device
+    else:
+        disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+        disk_spec.fileOperation = (
+            vim.vm.device.VirtualDeviceSpec.FileOperation.create)
+        disk_spec.device = vim.vm.device.VirtualDisk()
+        disk_spec.device.backing = (
+            vim.vm.device.VirtualDisk.FlatVer2BackingInfo())
+        disk_spec.device.backing.diskMode = 'persistent'
+        disk_spec.device.backing.fileName = "[%s]" % disk["datastore"]
+        disk_spec.device.backing.datastore = get_datastore(
+            snapshot, disk["datastore"])
+        disk_spec.device.controllerKey = scsi_controller.key
+        disk_spec.device.unitNumber = unit_number
+
+    disk_type = (disk.get("type") or "").lower()
+    if disk_type == 'thin':
+        disk_spec.device.backing.thinProvisioned = True
+    elif disk_type == 'eagerzeroedthick':
+        disk_spec.device.backing.eagerlyScrub = True
+
+    capacity_kb = int(disk["size_gb"]) * 1024 * 1024
+    if disk_device is not None and capacity_kb < disk_device.capacityInKB:
+        raise ValueError(
+            "Disk size %s Gb is smaller than size of the template disk "
+            "(%s Kb). Reducing of disks is not allowed." % (
+                disk["size_gb"], disk_device.capacityInKB))
+    disk_spec.device.capacityInKB = capacity_kb
+    return disk_spec
+
+
+def get_vm_fingerprint(vm):
+    """Hash of the options of VM provisioning plan defining its hardware.
+
+    Templates, resource pools and datastores are not included, because
+    they get assigned to VMs depending on the other VMs of the plan.
+    """
+    data = json.dumps({
+        "group": vm.get("group"),
+        "clone_mode": vm.get("clone_mode") or "full",
+        "num_cpus": int(vm["num_cpus"]),
+        "ram_mb": int(vm["ram_mb"]),
+        "disks": [[int(disk["size_gb"]), (disk.get("type") or "").lower(),
+                   disk.get("kind")] for disk in vm["disks"]],
+    }, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def get_vm_annotation(vm_name, vm):
+    return "%s\n%s%s" % (
+        vm_name, VM_FINGERPRINT_PREFIX, get_vm_fingerprint(vm))
+
+
+def parse_vm_fingerprint(annotation):
+    """Return fingerprint stored in the VM annotation or None."""
+    for line in (annotation or "").splitlines():
+        if line.startswith(VM_FINGERPRINT_PREFIX):
+            return line[len(VM_FINGERPRINT_PREFIX):].strip()
+    return None
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Benchmark for the 'dt_validate_vms_provisioning_config' Ansible module.
+#
+# Measures time of the "cold" config validation (yaml parsing and schema
+# validation) and "warm" one, where validated config is read from the cache.
+# Also, it compares time of the config validation done using compiled config
+# schema and using the 'schema' library for configs with different amount
+# of VM names per node type.
+#
+# Run it from the root dir of the repo using the same tox env as for
+# deployment, so all the module requirements are installed:
+#
+# $ tox -e ocp3.11 -- python scripts/benchmark_config_validation.py \
+#     --config config-examples/config-example-ocp311-dev.yaml
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import shutil
+import tempfile
+import timeit
+
+from benchmark_utils import FakeAnsibleModule
+from benchmark_utils import load_library_module
+from benchmark_utils import report
+from benchmark_utils import ROOT_DIR
+
+DEFAULT_CONFIG_PATH = os.path.join(
+    ROOT_DIR, 'config-examples', 'config-example-ocp311-dev.yaml')
+
+
+def get_config_with_vm_names(config, vm_names_amount):
+    config = copy.deepcopy(config)
+    for node_type, vm_params in config["vmware"]["vm_parameters"].items():
+        vm_params["names"] = [
+            "%s-%04d" % (node_type, i) for i in range(vm_names_amount)]
+    return config
+
+
+def benchmark_validation_engines(dtv, config, check_groups, args):
+    validator = dtv.get_config_validator(check_groups)
+    configs = [("Config as is", config)] + [
+        ("%s VM names per node type" % vm_names_amount,
+         get_config_with_vm_names(config, vm_names_amount))
+        for vm_names_amount in args.vm_names]
+    for name, sized_config in configs:
+        try:
+            validator.schema.validate(sized_config)
+        except dtv.schema.SchemaError as e:
+            print("%s: invalid config: %.100s" % (
+                name, str(e).splitlines()[-1]))
+            continue
+        print("%s:" % name)
+        report("  'schema' library", timeit.repeat(
+            lambda: validator.schema.validate(sized_config),
+            number=args.number, repeat=args.repeat), args.number)
+        report("  compiled schema", timeit.repeat(
+            lambda: validator.validate(sized_config),
+            number=args.number, repeat=args.repeat), args.number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=(
+        "Benchmark cold and warm validation of the deployment tool config."))
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH,
+                        help="Path to the config file to validate.")
+    parser.add_argument("--check-groups", default=None,
+                        help="Comma-separated list of top-level config keys.")
+    parser.add_argument("--number", type=int, default=20,
+                        help="Amount of validations in one measurement.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Amount of measurements.")
+    parser.add_argument("--vm-names", default="10,100,1000",
+                        type=lambda s: [int(i) for i in s.split(",")],
+                        help=("Comma-separated amounts of VM names per node "
+                              "type to compare validation engines with."))
+    args = parser.parse_args()
+
+    dtv = load_library_module('dt_validate_vms_provisioning_config')
+    check_groups = (
+        args.check_groups.split(",") if args.check_groups else None)
+    module = FakeAnsibleModule(check_groups=check_groups)
+    with open(args.config, 'rb') as config_stream:
+        config_data = config_stream.read()
+
+    cache_dir = tempfile.mkdtemp(prefix="dt_config_cache_")
+    try:
+        def cold():
+            return dtv.validate_config_structure(
+                module, dtv.yaml.safe_load(config_data))
+
+        def warm():
+            return dtv.read_cached_config(
+                cache_dir, dtv.get_config_cache_key(config_data, check_groups))
+
+        dtv.write_cached_config(
+            cache_dir, dtv.get_config_cache_key(config_data, check_groups),
+            cold())
+        assert warm() is not None, "Cache entry was not created"
+
+        print("Config: %s" % args.config)
+        report("cold (parse + validate)", timeit.repeat(
+            cold, number=args.number, repeat=args.repeat), args.number)
+        report("warm (cache hit)", timeit.repeat(
+            warm, number=args.number, repeat=args.repeat), args.number)
+        benchmark_validation_engines(
+            dtv, dtv.yaml.safe_load(config_data), check_groups, args)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
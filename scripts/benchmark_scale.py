@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Scale benchmark for the deployment tool.
+#
+# Generates configs with hundreds of nodes defined using VM name ranges
+# and measures time of the config validation, calculation of the nodes
+# provisioning plan and building of the in-memory Ansible inventory with the
+# 'dt_*' groups of nodes.
+#
+# Run it from the root dir of the repo using the same tox env as for
+# deployment, so all the module requirements are installed:
+#
+# $ tox -e ocp3.11 -- python scripts/benchmark_scale.py --nodes 100,500,1000
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import timeit
+
+from ansible.inventory.manager import InventoryManager
+from ansible.parsing.dataloader import DataLoader
+
+from benchmark_utils import FakeAnsibleModule
+from benchmark_utils import load_library_module
+from benchmark_utils import report
+from benchmark_utils import ROOT_DIR
+
+DEFAULT_CONFIG_PATH = os.path.join(
+    ROOT_DIR, 'config-examples', 'config-example-ocp311-dev.yaml')
+
+
+def get_config_with_nodes(config, nodes_amount):
+    """Distribute nodes between node types as it is done in big clusters."""
+    config = copy.deepcopy(config)
+    glusterfs_amount = max(3, nodes_amount // 10)
+    amounts = {
+        "masters": 3,
+        "glusterfs": glusterfs_amount,
+        "glusterfs_registry": 3,
+        "nodes": max(1, nodes_amount - glusterfs_amount - 6),
+    }
+    for node_type, amount in amounts.items():
+        config["vmware"]["vm_parameters"][node_type]["names"] = [
+            "%s-[0001-%04d]" % (node_type.replace("_", "-"), amount)]
+    return config
+
+
+def build_inventory(ocp_nodes):
+    inventory = InventoryManager(loader=DataLoader(), sources='localhost,')
+    for group in ("masters", "nodes", "glusterfs", "glusterfs_registry"):
+        inventory.add_group("dt_%s" % group)
+    for name, node in ocp_nodes.items():
+        inventory.add_host(name, group="dt_%s" % node["group"])
+    return inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=(
+        "Benchmark deployment tool data processing for big clusters."))
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH,
+                        help="Path to the config file used as a base.")
+    parser.add_argument("--nodes", default="100,500,1000",
+                        type=lambda s: [int(i) for i in s.split(",")],
+                        help="Comma-separated amounts of nodes in a cluster.")
+    parser.add_argument("--number", type=int, default=5,
+                        help="Amount of runs in one measurement.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Amount of measurements.")
+    args = parser.parse_args()
+
+    dtv = load_library_module('dt_validate_vms_provisioning_config')
+    module = FakeAnsibleModule(check_groups=None)
+    with open(args.config, 'r') as config_stream:
+        config = dtv.yaml.safe_load(config_stream)
+
+    for nodes_amount in args.nodes:
+        sized_config = get_config_with_nodes(config, nodes_amount)
+        validated_config = dtv.validate_config_structure(module, sized_config)
+        ocp_nodes = dtv.get_ocp_nodes_plan(validated_config)
+        inventory = build_inventory(ocp_nodes)
+        print("%s nodes (%s hosts in inventory):" % (
+            len(ocp_nodes), len(inventory.get_hosts("dt_*"))))
+        report("  config validation", timeit.repeat(
+            lambda: dtv.validate_config_structure(module, sized_config),
+            number=args.number, repeat=args.repeat), args.number)
+        report("  nodes provisioning plan", timeit.repeat(
+            lambda: dtv.get_ocp_nodes_plan(validated_config),
+            number=args.number, repeat=args.repeat), args.number)
+        report("  inventory building", timeit.repeat(
+            lambda: build_inventory(ocp_nodes),
+            number=args.number, repeat=args.repeat), args.number)
+
+
+if __name__ == '__main__':
+    main()
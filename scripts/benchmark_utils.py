@@ -0,0 +1,34 @@
+#
+# Helpers shared by the benchmark scripts located in this dir.
+#
+# Benchmarks import it as a sibling module, so run them as scripts, like:
+#
+# $ tox -e ocp3.11 -- python scripts/benchmark_scale.py
+from __future__ import print_function
+
+import imp
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIBRARY_DIR = os.path.join(ROOT_DIR, 'playbooks', 'library')
+
+
+class FakeAnsibleModule(object):
+    def __init__(self, **params):
+        self.params = params
+
+    def fail_json(self, **kwargs):
+        print("Module failed: %s" % kwargs.get("msg"))
+        sys.exit(1)
+
+
+def load_library_module(name):
+    """Import Ansible module from the 'playbooks/library' dir by its name."""
+    return imp.load_source(name, os.path.join(LIBRARY_DIR, '%s.py' % name))
+
+
+def report(name, timings, number):
+    per_call_ms = [t * 1000.0 / number for t in timings]
+    print("%-36s min: %10.3f ms   avg: %10.3f ms" % (
+        name, min(per_call_ms), sum(per_call_ms) / len(per_call_ms)))
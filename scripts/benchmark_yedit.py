@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# Benchmark of the 'dt_yedit' module edits.
+#
+# Generates cluster info file like the one written by the
+# '6_gather_cluster_info.yaml' playbook, but with lots of nodes, packages and
+# images, so it takes several megabytes. Then measures time of applying the
+# same list of edits to it one by one, copying the document on each edit as
+# it was done before, and as a single transaction, which copies the document
+# only once. Also, measures time of lookups of deep keys, like 'a#b#c#[3]#d',
+# with and without cache of the parsed keys.
+#
+# Run it from the root dir of the repo using the same tox env as for
+# deployment, so all the module requirements are installed:
+#
+# $ tox -e ocp3.11 -- python scripts/benchmark_yedit.py --nodes 50 --edits 5
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from benchmark_utils import load_library_module
+from benchmark_utils import report
+
+
+def get_node_info(node_index, packages_amount):
+    return {
+        "Linux kernel version": ["3.10.0-957.el7.x86_64"],
+        "Red Hat release info": [
+            "Red Hat Enterprise Linux Server release 7.6 (Maipo)"],
+        "List of Packages": [
+            "package-%04d-%d.el7.x86_64" % (i, node_index)
+            for i in range(packages_amount)],
+        "List of services": [
+            "service-%03d.service loaded active running" % i
+            for i in range(packages_amount // 10)],
+    }
+
+
+def get_cluster_info(nodes_amount, packages_amount):
+    info = {
+        "01_ansible_runner": get_node_info(0, packages_amount),
+        "02_master": get_node_info(0, packages_amount),
+    }
+    info["02_master"]["Images info"] = [
+        "registry.example.com/ocp/image-%04d:v3.11" % i
+        for i in range(packages_amount)]
+    for i in range(nodes_amount):
+        info["04_node_%04d" % i] = get_node_info(i, packages_amount)
+    info["05_deep"] = dict(
+        ("node_%04d" % i, {"b": {"c": [{"d": j} for j in range(5)]}})
+        for i in range(nodes_amount))
+    return info
+
+
+def get_deep_keys(nodes_amount):
+    return ["05_deep#node_%04d#b#c#[3]#d" % i for i in range(nodes_amount)]
+
+
+def lookup_keys(dty, yaml_dict, keys, lookups_amount):
+    for _ in range(lookups_amount):
+        for key in keys:
+            dty.Yedit.get_entry(yaml_dict, key, '#')
+
+
+def get_edits(edits_amount):
+    return [{
+        "key": "05_gluster_pods#glusterfs-%04d" % i,
+        "value": {
+            "Storage release version": ["Red Hat Gluster Storage 3.4"],
+            "List of Packages": ["glusterfs-3.12.2-%d.el7rhgs" % i],
+        },
+    } for i in range(edits_amount)]
+
+
+def apply_edits_one_by_one(dty, data_file_path, edits):
+    yamlfile = dty.Yedit(filename=data_file_path, separator='#')
+    for edit in edits:
+        yamlfile.put(edit['key'], edit['value'])
+    return yamlfile
+
+
+def apply_edits_in_transaction(dty, data_file_path, edits):
+    yamlfile = dty.Yedit(filename=data_file_path, separator='#')
+    dty.Yedit.process_edits(edits, yamlfile)
+    return yamlfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=(
+        "Benchmark 'dt_yedit' edits of a big cluster info file."))
+    parser.add_argument("--nodes", type=int, default=50,
+                        help="Amount of nodes in the cluster info file.")
+    parser.add_argument("--packages", type=int, default=1000,
+                        help="Amount of packages per node.")
+    parser.add_argument("--edits", type=int, default=5,
+                        help="Amount of edits in one 'dt_yedit' task.")
+    parser.add_argument("--lookups", type=int, default=100,
+                        help="Amount of lookups of each of the deep keys.")
+    parser.add_argument("--number", type=int, default=1,
+                        help="Amount of runs in one measurement.")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Amount of measurements.")
+    args = parser.parse_args()
+
+    dty = load_library_module('dt_yedit')
+    tmp_dir = tempfile.mkdtemp(prefix="benchmark_yedit_")
+    try:
+        data_file_path = os.path.join(tmp_dir, "cluster_info.yaml")
+        yamlfile = dty.Yedit(
+            filename=data_file_path, separator='#',
+            content=get_cluster_info(args.nodes, args.packages))
+        yamlfile.write()
+        edits = get_edits(args.edits)
+
+        one_by_one = apply_edits_one_by_one(dty, data_file_path, edits)
+        in_transaction = apply_edits_in_transaction(
+            dty, data_file_path, edits)
+        if one_by_one.yaml_dict != in_transaction.yaml_dict:
+            raise AssertionError("Results of the edits differ")
+
+        print("%s edits of %.1f Mb file with %s nodes:" % (
+            args.edits, os.path.getsize(data_file_path) / 1024.0 / 1024.0,
+            args.nodes))
+        report("  file loading", timeit.repeat(
+            lambda: dty.Yedit(filename=data_file_path, separator='#'),
+            number=args.number, repeat=args.repeat), args.number)
+        report("  edits one by one", timeit.repeat(
+            lambda: apply_edits_one_by_one(dty, data_file_path, edits),
+            number=args.number, repeat=args.repeat), args.number)
+        report("  edits in transaction", timeit.repeat(
+            lambda: apply_edits_in_transaction(dty, data_file_path, edits),
+            number=args.number, repeat=args.repeat), args.number)
+
+        keys = get_deep_keys(args.nodes)
+        print("%s lookups of %s deep keys:" % (args.lookups, len(keys)))
+        cache_size = dty.Yedit.parsed_keys_cache_size
+        for name, size in (("without cache", 0), ("with cache", cache_size)):
+            dty.Yedit.parsed_keys_cache_size = size
+            report("  lookups %s" % name, timeit.repeat(
+                lambda: lookup_keys(
+                    dty, in_transaction.yaml_dict, keys, args.lookups),
+                number=args.number, repeat=args.repeat), args.number)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()